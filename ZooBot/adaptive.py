@@ -0,0 +1,139 @@
+from functools import lru_cache
+
+from matcher import PRECISION
+
+
+def _l1_term(value, param, weight):
+    return abs(value - param)
+
+
+def _weighted_l1_term(value, param, weight):
+    return weight * abs(value - param)
+
+
+def _l2_term(value, param, weight):
+    return (value - param) ** 2
+
+
+# per-dimension terms of each metric; for l2 the squared distance is used, which orders animals the same way
+TERMS = {
+    'l1': _l1_term,
+    'weighted_l1': _weighted_l1_term,
+    'l2': _l2_term,
+}
+
+
+class AdaptiveEngine:
+    """
+    Decides when a quiz can stop early and which question to ask next.
+    Trait `d` is the mean of the ranks of questions `d` and `d + half`, so the trait values still
+    reachable in each dimension follow from the answers given so far; they are precomputed for every
+    combination of answered and unanswered questions. Because the distance to an animal is a sum over
+    dimensions, the largest possible lead of a rival over the current favourite is the sum of the
+    per-dimension maxima over the reachable values. Once no rival can catch up, the remaining answers
+    cannot change the result and the quiz ends. Otherwise the next question is the one whose answers
+    leave, on average, the fewest rivals able to catch up.
+    States are tuples of ranks by question, None for questions not answered yet.
+    """
+    def __init__(self, questions, matcher, cache_size=4096):
+        self.questions = questions
+        self.matcher = matcher
+        self.term = TERMS[matcher.metric]
+        self.count = len(questions)
+        self.half = self.count // 2
+        self.answer_ranks = tuple(tuple(answer.rank for answer in question.answers) for question in questions)
+        self.ranks = tuple(tuple(sorted(set(ranks))) for ranks in self.answer_ranks)
+        self.reachable = [self.reachable_values(d) for d in range(self.half)]
+        self.leads = {}
+        self.decide = lru_cache(maxsize=cache_size)(self._decide)
+        self.next_question = lru_cache(maxsize=cache_size)(self._next_question)
+
+    def reachable_values(self, dimension):
+        """
+        Returns the trait values a dimension can still take, keyed by the (rank or None) pair of its questions.
+        """
+        first, second = dimension, dimension + self.half
+        values = {}
+        for a in self.ranks[first] + (None,):
+            for b in self.ranks[second] + (None,):
+                values[a, b] = tuple(sorted({round((x + y) / 2, 1)
+                                             for x in ((a,) if a is not None else self.ranks[first])
+                                             for y in ((b,) if b is not None else self.ranks[second])}))
+        return values
+
+    def values(self, state):
+        """
+        Returns the reachable trait values of every dimension in a state.
+        """
+        return [self.reachable[d][state[d], state[d + self.half]] for d in range(self.half)]
+
+    def estimate(self, state):
+        """
+        Returns the running trait estimate of a state: the median reachable value of every dimension.
+        With every question answered it is the trait vector of the answers.
+        """
+        return tuple(values[len(values) // 2] for values in self.values(state))
+
+    def lead(self, dimension, values, leader, rival):
+        """
+        Returns how much closer to the rival than to the leader a dimension can bring the user at most.
+        """
+        key = (dimension, values, leader, rival)
+        lead = self.leads.get(key)
+        if lead is None:
+            weight = self.matcher.weights[dimension]
+            leader_param = self.matcher.traits[leader][dimension]
+            rival_param = self.matcher.traits[rival][dimension]
+            lead = self.leads[key] = max(self.term(value, leader_param, weight) - self.term(value, rival_param, weight)
+                                         for value in values)
+        return lead
+
+    def rivals(self, state):
+        """
+        Returns the current favourite of a state and the number of animals that can still overtake it.
+        """
+        values = self.values(state)
+        leader = self.matcher.names.index(self.matcher.match(self.estimate(state)))
+        rivals = 0
+        for rival in range(len(self.matcher.names)):
+            if rival == leader:
+                continue
+            lead = round(sum(self.lead(d, dimension_values, leader, rival)
+                             for d, dimension_values in enumerate(values)), PRECISION)
+            # on a tie the animal listed first wins, as in TotemMatcher
+            if lead > 0 or (lead == 0 and rival < leader):
+                rivals += 1
+        return leader, rivals
+
+    def _decide(self, state):
+        """
+        Returns the animal the quiz results in whatever the remaining answers are, or None if it is still open.
+        """
+        leader, rivals = self.rivals(state)
+        return self.matcher.names[leader] if rivals == 0 else None
+
+    def _next_question(self, state):
+        """
+        Returns the index of the question to ask next, or None once the result is decided.
+        """
+        if self.decide(state) is not None:
+            return None
+        best, best_score = None, None
+        for question in range(2 * self.half):
+            if state[question] is not None:
+                continue
+            score = sum(self.rivals(state[:question] + (rank,) + state[question + 1:])[1]
+                        for rank in self.answer_ranks[question])
+            if best_score is None or score < best_score:
+                best, best_score = question, score
+        return best
+
+    def state(self, choices):
+        """
+        Builds the state of a session from its answer numbers by question (0: not answered).
+        """
+        state = [None] * self.count
+        for index, choice in enumerate(choices[:self.count]):
+            if choice:
+                state[index] = self.answer_ranks[index][choice - 1]
+        return tuple(state)
@@ -0,0 +1,273 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from decouple import config
+
+import resources
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ZQA1'
+# record header: magic, length of the rest of the record, length of its metadata
+HEADER = struct.Struct('<4sII')
+# column header: type code, number of items, name length
+COLUMN = struct.Struct('<cIH')
+# answer buttons carry the answer number in one hex digit
+ANSWER_SLOTS = 16
+
+
+def counters(size):
+    return array('Q', bytes(8 * size))
+
+
+class QuizAnalytics:
+    """
+    Streaming counters of quiz outcomes: quizzes started and completed, answers by question and answer
+    number, answers by step (how far users get before dropping off) and results by animal.
+    Counters are fixed-size arrays updated in place under a lock, so recording an event is O(1)
+    and allocates nothing. Every `interval` seconds the counts since the previous snapshot are appended
+    to `path` as one columnar record, and the counters start again from zero. Records are only ever
+    appended, in a single write each, so several bot processes can share the file; `read_snapshots`
+    and the CLI (`python analytics.py`) add them up.
+    """
+    def __init__(self, animals, question_count, path=None, interval=None):
+        self.path = path or resources.path(config('ANALYTICS_FILE', default='settings/analytics.zqa'))
+        self.interval = interval or config('ANALYTICS_INTERVAL', default=60.0, cast=float)
+        self.animals = tuple(animals)
+        self.animal_index = {name: index for index, name in enumerate(self.animals)}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.reset(question_count)
+
+    def reset(self, question_count):
+        """
+        Zeroes the counters, sized for `question_count` questions.
+        """
+        self.question_count = question_count
+        self.since = time.time()
+        self.events = 0
+        self.totals = counters(2)
+        self.answers = counters(question_count * ANSWER_SLOTS)
+        self.steps = counters(question_count)
+        self.results = counters(len(self.animals) + 1)
+
+    def start(self):
+        """
+        Counts a quiz started.
+        """
+        with self.lock:
+            self.totals[0] += 1
+            self.events += 1
+
+    def answer(self, question_index, answer_num, step):
+        """
+        Counts an answer to a question; `step` is the number of questions the user has answered with this one.
+        """
+        with self.lock:
+            if question_index >= self.question_count or step > self.question_count:
+                self._grow(max(question_index + 1, step))
+            self.answers[question_index * ANSWER_SLOTS + answer_num] += 1
+            self.steps[step - 1] += 1
+            self.events += 1
+
+    def result(self, animal):
+        """
+        Counts a completed quiz and its animal; animals missing from the catalogue are counted in the last slot.
+        """
+        with self.lock:
+            self.totals[1] += 1
+            self.results[self.animal_index.get(animal, len(self.animals))] += 1
+            self.events += 1
+
+    def _grow(self, question_count):
+        """
+        Makes room for more questions after a content reload; called with the lock held.
+        """
+        extra = question_count - self.question_count
+        self.answers.extend(counters(extra * ANSWER_SLOTS))
+        self.steps.extend(counters(extra))
+        self.question_count = question_count
+
+    def snapshot(self):
+        """
+        Appends the counts since the previous snapshot to the analytics file and zeroes them.
+        Returns False if there was nothing to write or the write failed; the counts are kept in that case.
+        """
+        with self.lock:
+            if not self.events:
+                return False
+            meta = {'since': self.since, 'until': time.time(), 'pid': os.getpid(),
+                    'answer_slots': ANSWER_SLOTS, 'animals': list(self.animals) + [None]}
+            columns = (('totals', self.totals), ('answers', self.answers), ('steps', self.steps),
+                       ('results', self.results))
+            record = encode_record(meta, columns)
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, record)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.error("Unable to write analytics snapshot to '%s': %s", self.path, e)
+                return False
+            self.reset(self.question_count)
+            return True
+
+    def start_snapshots(self):
+        """
+        Starts the background thread writing a snapshot every `interval` seconds.
+        """
+        self.thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the snapshot thread and writes the last counts.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.snapshot()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.snapshot()
+
+
+def encode_record(meta, columns):
+    """
+    Encodes one snapshot: a header, JSON metadata, then each column as its header, name and raw array bytes.
+    """
+    body = [json.dumps(meta, separators=(',', ':')).encode()]
+    meta_length = len(body[0])
+    for name, values in columns:
+        encoded_name = name.encode()
+        data = values.tobytes() if sys.byteorder == 'little' else _swapped(values).tobytes()
+        body += [COLUMN.pack(values.typecode.encode(), len(values), len(encoded_name)), encoded_name, data]
+    body = b''.join(body)
+    return HEADER.pack(MAGIC, len(body), meta_length) + body
+
+
+def _swapped(values):
+    values = array(values.typecode, values)
+    values.byteswap()
+    return values
+
+
+def read_snapshots(path, since=None):
+    """
+    Yields (metadata, {column name: array}) for every snapshot in the file, oldest first.
+    A record cut short by a crash ends the file; snapshots that ended before `since` are skipped unread.
+    """
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            magic, length, meta_length = HEADER.unpack(header)
+            if magic != MAGIC:
+                logger.warning("Unexpected data in '%s', stopping there", path)
+                return
+            body = file.read(length)
+            if len(body) < length:
+                return
+            meta = json.loads(body[:meta_length])
+            if since is not None and meta['until'] < since:
+                continue
+            columns = {}
+            offset = meta_length
+            while offset < length:
+                typecode, count, name_length = COLUMN.unpack_from(body, offset)
+                offset += COLUMN.size
+                name = body[offset:offset + name_length].decode()
+                offset += name_length
+                values = array(typecode.decode())
+                size = count * values.itemsize
+                values.frombytes(body[offset:offset + size])
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                offset += size
+                columns[name] = values
+            yield meta, columns
+
+
+def aggregate(snapshots):
+    """
+    Adds up snapshots into totals: quizzes started and completed, answers by question and answer number,
+    answers by step and results by animal.
+    """
+    totals = {'snapshots': 0, 'started': 0, 'completed': 0, 'since': None, 'until': None,
+              'answers': {}, 'steps': {}, 'results': {}}
+    for meta, columns in snapshots:
+        totals['snapshots'] += 1
+        totals['since'] = meta['since'] if totals['since'] is None else min(totals['since'], meta['since'])
+        totals['until'] = meta['until'] if totals['until'] is None else max(totals['until'], meta['until'])
+        totals['started'] += columns['totals'][0]
+        totals['completed'] += columns['totals'][1]
+        slots = meta['answer_slots']
+        for position, count in enumerate(columns['answers']):
+            if count:
+                question = totals['answers'].setdefault(position // slots + 1, {})
+                question[position % slots] = question.get(position % slots, 0) + count
+        for position, count in enumerate(columns['steps']):
+            if count:
+                totals['steps'][position + 1] = totals['steps'].get(position + 1, 0) + count
+        for animal, count in zip(meta['animals'], columns['results']):
+            if count:
+                totals['results'][animal] = totals['results'].get(animal, 0) + count
+    return totals
+
+
+def parse_age(text):
+    """
+    Parses an age like '30m', '12h' or '7d' into seconds.
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text[-1:] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def print_report(totals):
+    if not totals['snapshots']:
+        print('No snapshots.')
+        return
+    period = f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(totals['since']))} - " \
+             f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(totals['until']))}"
+    rate = totals['completed'] / totals['started'] if totals['started'] else 0
+    print(f"{period}: {totals['started']} quizzes started, {totals['completed']} completed ({rate:.1%})")
+    print('\nresults:')
+    for animal, count in sorted(totals['results'].items(), key=lambda item: -item[1]):
+        print(f"  {animal or '(unknown)':<20} {count:>8} {count / totals['completed']:>7.1%}")
+    print('\nanswers by question (answer number: count):')
+    for question, answers in sorted(totals['answers'].items()):
+        print(f'  Q{question:<3} ' + '  '.join(f'{answer}: {count}' for answer, count in sorted(answers.items())))
+    print('\ndrop-off (users still answering at each step):')
+    for step, count in sorted(totals['steps'].items()):
+        share = count / totals['started'] if totals['started'] else 0
+        print(f'  step {step:<3} {count:>8} {share:>7.1%}')
+
+
+if __name__ == '__main__':
+    """
+    Query CLI: adds up the snapshots of the analytics file, optionally only the recent ones.
+    """
+    parser = argparse.ArgumentParser(description='Summarize the quiz analytics snapshots')
+    parser.add_argument('--file', default=resources.path(config('ANALYTICS_FILE', default='settings/analytics.zqa')))
+    parser.add_argument('--last', help="only snapshots of the last period, e.g. '30m', '12h', '7d'")
+    parser.add_argument('--json', action='store_true', help='print the totals as JSON')
+    args = parser.parse_args()
+    since = time.time() - parse_age(args.last) if args.last else None
+    totals = aggregate(read_snapshots(args.file, since))
+    if args.json:
+        print(json.dumps(totals, indent=1))
+    else:
+        print_report(totals)
@@ -1,335 +1,265 @@
+import argparse
+import logging
+
 import telebot
-from telebot import types
-import time
 from decouple import config
 
+import metrics
+from manager import BaseBotManager, LogoFileNotFoundException
+from markups import markups
+from media_cache import MediaCache
+from outbound import OutboundGateway
 from quiz import Quiz
+from resources import startup
+from scheduler import MessageScheduler
 
-from service import send_email, greetings_generator1, greetings_generator2, start_generator, \
-    get_totem_animal_data
+import views
 
-from textinfo import default_response_text, help_text, \
-    logo_photo, info_text, info_guardian_url, \
-    guardian_text, send_message_text, contacts_text, share_result_text, serious_text
+from textinfo import logo_photo, share_result_text
 
+logger = logging.getLogger(__name__)
 
-class LogoFileNotFoundException(Exception):
-    pass
 
+class LoggingExceptionHandler(telebot.ExceptionHandler):
+    """
+    Logs errors raised by handlers and marks them handled, so one failing update does not stop polling.
+    """
+    def handle(self, exception):
+        logger.error('Unhandled error while processing an update: %s', exception, exc_info=exception)
+        return True
 
-class BotManager:
-    def __init__(self, token):
+
+class BotManager(BaseBotManager):
+    def __init__(self, token, threaded=True):
         """
         Initializes the BotManager with the provided Telegram API token.
-        Sets up the bot instance and quiz object, and configures message and callback handlers.
-        """
-        self.bot = telebot.TeleBot(token)
-        self.quiz = Quiz(self.bot)
-        self.setup_handlers()
-        self.totem_animal_data = None
-        self.result_animal = None
+        With `threaded=False` handlers run in the caller's thread, as the webhook server expects;
+        otherwise they run on a pool of BOT_THREADS threads.
+        Sets up the bot instance and the rate-limited outbound API gateway every component sends through,
+        then the components shared with the async runtime.
+        """
+        with startup.phase('bot and outbound gateway'):
+            self.bot = telebot.TeleBot(token, threaded=threaded,
+                                       num_threads=config('BOT_THREADS', default=2, cast=int),
+                                       exception_handler=LoggingExceptionHandler())
+            self.api = OutboundGateway(self.bot)
+        self.setup_components(self.api, MessageScheduler, MediaCache, Quiz)
 
-    def start_bot(self):
+    def register_metrics(self, registry=metrics.registry):
         """
-        Starts the bot's polling loop to continuously listen for new messages.
+        Exposes the outbound queue depth along with the gauges shared with the async runtime.
         """
-        self.bot.polling(none_stop=True)
+        super().register_metrics(registry)
+        registry.gauge('zoobot_outbound_queue_depth', 'Bot API requests waiting to be sent.', self.api.queue_depth)
 
-    def setup_handlers(self):
+    def start_bot(self):
         """
-        Sets up both message and callback handlers for the bot.
+        Starts the bot's polling loop to continuously listen for new messages.
         """
-        self.setup_message_handler()
-        self.setup_callback_handler()
-
-    def setup_message_handler(self):
-        """
-        Configures how the bot responds to different types of messages.
-        Handles feedback messages and general commands like '/start', '/help', etc.
-        """
-        @self.bot.message_handler(func=lambda message: message.text.startswith('Feedback'))
-        def handle_feedback_message(message):
-            """
-            Processes feedback messages from users, formats them into emails, and sends them.
-            """
-            try:
-                if self.totem_animal_data is not None:
-                    user_id = str(message.from_user.id)
-                    full_name = f"{message.from_user.first_name} {message.from_user.last_name}"
-                    subject = f'Feedback from User: {full_name}, ID: {user_id}'
-                    results = message.text
-                    print(results)
-                    if send_email(results, subject):
-                        send_message = 'Thank you for your feedback! It has been received and processed.'
-                        self.bot.reply_to(message, send_message)
-                    else:
-                        send_message = 'Failed to process your request, please try again later.'
-                        self.bot.reply_to(message, send_message)
-            except TypeError:
-                send_message = 'Quiz not completed yet, maybe you haven\'t formed an opinion yet.'
-                answer = self.bot.send_message(message.chat.id, send_message)
-                time.sleep(2)
-                self.bot.delete_message(message.chat.id, message.message_id)
-                time.sleep(4)
-                self.bot.delete_message(message.chat.id, answer.message_id)
-
-        @self.bot.message_handler(func=lambda message: True)
-        def handle_messages(message):
-            """
-            General message handler that dispatches messages to appropriate handlers based on the command.
-            """
-            command_handlers = {
-                'hello': self.send_greeting_with_buttons,
-                '/start': self.send_start_menu_keyboard,
-                '/help': self.send_help_message,
-                '/info': self.send_info_message,
-                '/contacts': self.send_contacts,
-                'confirm': self.agreement
-            }
-            command = message.text.lower()
-            handler = command_handlers.get(command, self.send_default_response)
-            handler(message)
-
-    def setup_callback_handler(self):
-        """
-        Configures how the bot responds to inline button presses (callback queries).
-        """
-        @self.bot.callback_query_handler(func=lambda call: True)
-        def callback_handler(call):
-            """
-            Handles various inline button actions such as starting a quiz, showing results, etc.
-            """
-            command_handlers = {
-                'learn_more': self.send_info_message,
-                'become_guardian?': self.send_become_guardian_info,
-                'start_quiz': self.send_start_quiz_message,
-                'start': self.send_start_menu_keyboard,
-                'help': self.send_help_message,
-                'info': self.send_info_message,
-                'contacts': self.send_contacts,
-                'continue': self.processing_of_results,
-                'restart_quiz': self.send_start_quiz_message,
-                'show_result': self.show_totem_animal_info,
-                'get_res': self.load_result_list,
-                'become_a_guardian': self.become_a_guardian,
-                'some_serious': self.some_serious,
-
-            }
-            for i in range(1, 5):
-                command_handlers[f'answer_{i}'] = lambda message, idx=i: self.quiz.process_answer(message.chat.id, idx)
-            command = call.data
-            handler = command_handlers.get(command)
-            if handler:
-                handler(call.message)
-
-    def send_greeting_with_buttons(self, message):
-        """
-        Sends a greeting message along with interactive buttons for further navigation.
-        """
-        markup = types.InlineKeyboardMarkup(row_width=2)
-        button_start = types.InlineKeyboardButton("START", callback_data='start')
-        button_help = types.InlineKeyboardButton("Help", callback_data='help')
-        button_info = types.InlineKeyboardButton("Info", callback_data='info')
-        markup.add(button_start)
-        markup.add(button_help, button_info)
-        user_name = message.from_user.first_name
-        greet1 = greetings_generator1.get_random_text()
-        greet2 = greetings_generator2.get_random_text()
-        greeting = f"{greet1}, {user_name}! {greet2}"
-        self.bot.send_message(message.chat.id, greeting, reply_markup=markup)
+        metrics.MetricsServer().start()
+        try:
+            self.bot.polling(none_stop=True)
+        finally:
+            self.shutdown()
 
-    def send_start_menu_keyboard(self, message):
-        """
-        Displays a menu with options for learning more about the app, becoming a zoo guardian, or taking a quiz.
-        """
-        greet2 = greetings_generator2.get_random_text()
-        greeting = f"{greet2}"
-        markup = types.InlineKeyboardMarkup()
-        button_learn_more = types.InlineKeyboardButton("Learn More", callback_data='learn_more')
-        button_become_guardian = types.InlineKeyboardButton("Become a Guardian?", callback_data='become_guardian?')
-        button_start_quiz = types.InlineKeyboardButton("QUIZ", callback_data='start_quiz')
-        markup.add(button_start_quiz)
-        markup.add(button_become_guardian, button_learn_more)
+    def start_webhook(self):
+        """
+        Registers the webhook with Telegram and serves updates from the local HTTP server.
+        """
+        from webhook import WebhookServer
+        server = WebhookServer(self.bot)
+        metrics.registry.gauge('zoobot_webhook_pending', 'Webhook updates accepted but not handled yet.',
+                               lambda: server.pending)
+        metrics.MetricsServer().start()
+        self.bot.remove_webhook()
+        self.bot.set_webhook(url=config('WEBHOOK_URL'), secret_token=server.secret_token or None,
+                             max_connections=server.max_concurrency)
         try:
-            self.bot.send_message(message.chat.id, greeting)
-            logo_greeting = logo_photo
-            with open(logo_greeting, 'rb') as logo:
-                start_greet = start_generator.get_random_text()
-                start_menu_message = f"{start_greet}:"
-                self.bot.send_photo(message.chat.id, logo, caption=start_menu_message, reply_markup=markup)
+            server.run()
+        finally:
+            self.shutdown()
 
-        except FileNotFoundError:
-            raise LogoFileNotFoundException("Logo file not found.")
-    def send_help_message(self, message):
+    def stop_sending(self):
         """
-        Sends a help message containing instructions or information about the bot's functionality.
+        Stops the outbound gateway once the scheduler has queued its last requests.
         """
-        help_message = help_text
-        self.bot.send_message(message.chat.id, help_message)
+        self.api.stop()
 
-    def send_contacts(self, message):
+    def dispatcher(self, route):
         """
-        Sends contact information for the organization or service.
+        Returns a TeleBot handler running the handler an update is routed to.
         """
-        contacts_message = contacts_text
-        self.bot.send_message(message.chat.id, contacts_message)
+        def dispatch(update):
+            handler, args = route(update)
+            if handler is None:
+                return
+            with self.observed(handler.__name__):
+                handler(*args)
+        return dispatch
 
-    def send_info_message(self, message):
+    def send_reply(self, message, reply):
         """
-        Sends information about the organization or service, including a link to the website.
+        Sends a reply decided by `views` and schedules its deletion.
         """
-        info_url = "https://moscowzoo.ru/"
-        markup = types.InlineKeyboardMarkup()
-        info_button = types.InlineKeyboardButton("Visit Zoo Website", url=info_url)
-        markup.add(info_button)
-        info_message = info_text
-        self.bot.send_message(message.chat.id, info_message, reply_markup=markup)
-
-    def send_become_guardian_info(self, message):
-        """
-        Provides information about becoming a zoo guardian, including a link to learn more.
-        """
-        guardian_message = guardian_text
-        info_guardian = info_guardian_url
-        keyboard = types.InlineKeyboardMarkup()
-        button_info_guardian = types.InlineKeyboardButton('Learn About Program', url=info_guardian)
-        button_get_contacts = types.InlineKeyboardButton('Contacts', callback_data='contacts')
-        keyboard.add(button_info_guardian)
-        keyboard.add(button_get_contacts)
-        self.bot.send_message(message.chat.id, guardian_message, reply_markup=keyboard)
+        if reply.reply_to:
+            answer = self.api.reply_to(message, reply.text, **self.reply_kwargs(reply))
+        else:
+            answer = self.api.send_message(message.chat.id, reply.text, **self.reply_kwargs(reply))
+        self.schedule_deletions(message, reply, answer)
+        return answer
 
-    def send_start_quiz_message(self, message):
+    def handle_feedback_message(self, message):
         """
-        Starts the quiz for the user.
+        Processes feedback messages from users and adds them to the feedback digest.
         """
-        self.quiz.start_quiz(message.chat.id)
-        self.totem_animal_data = None
+        feedback = views.feedback_record(self.sessions.get(message.chat.id), message)
+        if feedback is None:
+            return self.send_reply(message, views.feedback_too_early_reply)
+        logger.debug('Feedback from chat %s: %s', message.chat.id, message.text)
+        accepted = self.digest.add('feedback', feedback)
+        self.send_reply(message, views.feedback_reply(accepted))
 
-    def send_default_response(self, message):
+    def send_start_menu_keyboard(self, message):
         """
-        Sends a default response when no specific action matches the input.
+        Displays a menu with options for learning more about the app, becoming a zoo guardian, or taking a quiz.
         """
-        default_response = default_response_text
-        answer = self.bot.send_message(message.chat.id, default_response)
-        time.sleep(3)
-        self.bot.delete_message(message.chat.id, message.message_id)
-        time.sleep(6)
-        self.bot.delete_message(message.chat.id, answer.message_id)
+        greeting, start_menu_message = views.start_menu_texts(message.chat.id)
+        try:
+            self.api.send_message(message.chat.id, greeting)
+            self.media.send_photo(message.chat.id, logo_photo, caption=start_menu_message,
+                                  reply_markup=markups.get('start_menu'))
+        except FileNotFoundError:
+            raise LogoFileNotFoundException("Logo file not found.")
 
     def show_totem_animal_info(self, message):
         """
         Displays information about the user's totem animal after completing the quiz.
         """
+        session = self.sessions.get(message.chat.id)
         try:
-            if not self.totem_animal_data:
-                self.result_animal = self.quiz.calculate_results()
-                print("Animal determined:", self.result_animal)
-                self.totem_animal_data = get_totem_animal_data(self.result_animal)
-            animal_data = self.totem_animal_data
-            print("Received animal data:", animal_data)
-            photo_url = animal_data.get('image_url', '')
-            text = f"<b>{animal_data['name']}</b>\n"
-            text += f"{animal_data['description']}\n"
-            msg = '<b>Results obtained! Move ahead!</b>'
-            markup = types.InlineKeyboardMarkup()
-            button_continue = types.InlineKeyboardButton('Adventures Continue...', callback_data='continue')
-            markup.add(button_continue)
+            photo_url = self.quiz.result_data(session, self.cards).get('image_url', '')
             if photo_url:
-                photo = open(photo_url, 'rb')
-                self.bot.send_photo(message.chat.id, photo, caption=text, parse_mode='HTML')
-                time.sleep(3)
-                answer = self.bot.send_message(message.chat.id, msg, reply_markup=markup, parse_mode='HTML')
+                text = self.cards.caption(session.result_animal)
+                self.media.send_photo(message.chat.id, photo_url, caption=text, parse_mode='HTML')
+                self.scheduler.send_message_later(3, message.chat.id, views.results_text,
+                                                  reply_markup=markups.get('continue'), parse_mode='HTML')
         except Exception as e:
-            error_message = "Take the quiz to receive results."
-            answer = self.bot.send_message(message.chat.id, error_message)
-            print(f"Error: {e}. Empty results list.")
-            time.sleep(3)
-            self.bot.delete_message(message.chat.id, answer.message_id)
+            logger.info('Chat %s has no results to show: %s', message.chat.id, e)
+            self.send_reply(message, views.no_results_reply)
 
     def processing_of_results(self, message):
         """
         Shows intermediate steps after completing a quiz before finalizing the user's journey.
         """
-        if not self.totem_animal_data:
-            self.totem_animal_data = get_totem_animal_data(self.result_animal)
-        animal_data = self.totem_animal_data
-        website_url = animal_data.get('website_url', '')
-        text = '<b>You have come a long way, only one step remains! But choosing is hard...</b>'
-        keyboard = types.InlineKeyboardMarkup()
-        button_info = types.InlineKeyboardButton("Learn More About Animal", url=website_url)
-        button_get_result = types.InlineKeyboardButton('Download Result', callback_data='get_res')
-        button_get_res_mail = types.InlineKeyboardButton('A Bit Serious...', callback_data='some_serious')
-        button_info_guardian = types.InlineKeyboardButton('Become a Guardian?', callback_data='become_guardian?')
-        button_become_guardian = types.InlineKeyboardButton('Become a Guardian!', callback_data='become_a_guardian')
-        button_quiz_repeat = types.InlineKeyboardButton("Try Again?", callback_data='start')
-        keyboard.row(button_info)
-        keyboard.row(button_get_result)
-        keyboard.row(button_get_res_mail)
-        keyboard.row(button_info_guardian)
-        keyboard.row(button_become_guardian)
-        keyboard.row(button_quiz_repeat)
-        self.bot.send_message(message.chat.id, text, reply_markup=keyboard, parse_mode='HTML')
+        session = self.sessions.get(message.chat.id)
+        website_url = self.quiz.result_data(session, self.cards).get('website_url', '')
+        markup = markups.result(website_url, session.result_animal)
+        self.api.send_message(message.chat.id, views.processing_text, reply_markup=markup, parse_mode='HTML')
 
     def load_result_list(self, message):
         """
         Sends the result list for the user's totem animal.
         """
-        if self.result_animal is not None:
-            self.bot.send_document(message.chat.id,
-                                  document=open(f'./assets/totem_animals/{self.result_animal}.jpg', 'rb'),
-                                  caption='Totem Animal')
-            time.sleep(2)
-            share_result_message = share_result_text
-            self.bot.send_message(message.chat.id, share_result_message)
-        else:
-            answer = self.bot.send_message(message.chat.id, "Result not found.")
-            time.sleep(3)
-            self.bot.delete_message(message.chat.id, answer.message_id)
+        session = self.sessions.get(message.chat.id)
+        if session.result_animal is None:
+            return self.send_reply(message, views.result_not_found_reply)
+        self.cards.send_card(message.chat.id, session.result_animal, caption='Totem Animal')
+        self.scheduler.send_message_later(2, message.chat.id, share_result_text)
 
-    def become_a_guardian(self, message):
+    def answer_inline_query(self, inline_query):
         """
-        Provides information about becoming a zoo guardian.
+        Offers the result cards of the animals matching an inline query, to be shared in any chat.
+        Telegram caches the answer for cache_time seconds.
         """
-        send_message = send_message_text
-        self.bot.send_message(message.chat.id, send_message, parse_mode='HTML')
+        if not self.sharing.username:
+            self.sharing.username = self.bot.get_me().username
+        self.api.answer_inline_query(inline_query.id, self.sharing.search(inline_query.query),
+                                     cache_time=self.sharing.cache_time)
 
-    def some_serious(self, message):
-        """
-        Sends a message with serious content.
-        """
-        send_message = serious_text
-        self.bot.send_message(message.chat.id, send_message, parse_mode='HTML')
+    def show_shared_result(self, message):
+        """
+        Shows the result a `/start result_<animal>` link points to and invites the user to take the quiz.
+        Links to unknown animals open the start menu.
+        """
+        animal = self.sharing.animal_from_start(message.text)
+        card = self.cards.card_path(animal) if animal is not None else None
+        if card is None:
+            self.send_start_menu_keyboard(message)
+            return
+        self.media.send_photo(message.chat.id, card, caption=self.cards.caption(animal), parse_mode='HTML',
+                              reply_markup=markups.get('shared_result'))
+
+    def profile_command(self, message):
+        """
+        Admin command switching the handler profiler: `/profile on`, `/profile off` or `/profile dump`.
+        Chats not listed in ADMIN_CHAT_IDS get the default response.
+        """
+        action = self.profile_action(message)
+        if action is None:
+            return self.send_default_response(message)
+        if action == 'on':
+            self.profiler.enable()
+        elif action == 'off':
+            self.profiler.disable()
+        elif action == 'dump' and self.profiler.enabled:
+            self.profiler.dump()
+        self.send_reply(message, views.profile_reply(self.profiler))
 
     def agreement(self, message):
         """
-        Collects and processes quiz-related user data for potential email notifications.
-        """
-        try:
-            user_id = message.from_user.id
-            full_name = f"{message.from_user.first_name} {message.from_user.last_name}"
-            user_info = self.quiz.collection_of_information(user_id, full_name)
-            subject = 'Quiz Results from Zoo-Bot'
-            animal_data = self.totem_animal_data
-            results = str({**user_info, **animal_data})
-            print(results)
-            if send_email(results, subject):
-                send_message = 'Sent'
-            else:
-                send_message = 'Unable to send, try again later'
-            self.bot.send_message(message.chat.id, send_message)
-        except TypeError:
-            send_message = 'Quiz not completed yet, this keyword should be used later'
-            answer = self.bot.send_message(message.chat.id, send_message)
-            time.sleep(2)
-            self.bot.delete_message(message.chat.id, message.message_id)
-            time.sleep(4)
-            self.bot.delete_message(message.chat.id, answer.message_id)
+        Collects quiz-related user data, stores the consent and adds it to the results digest.
+        """
+        full_name = views.full_name(message.from_user)
+        results = self.quiz.collection_of_information(self.sessions.get(message.chat.id), message.from_user.id,
+                                                      full_name)
+        if results is None:
+            return self.send_reply(message, views.consent_too_early_reply)
+        logger.debug('Chat %s consented to send: %s', message.chat.id, results)
+        self.store.save_consent(message.chat.id, message.from_user.id, full_name, results)
+        accepted = self.digest.add('consent', {'chat_id': message.chat.id, **results})
+        self.send_reply(message, views.consent_reply(accepted))
 
 
 if __name__ == '__main__':
     """
     Main execution block that initializes the bot manager and starts the bot.
     """
+    parser = argparse.ArgumentParser(description='Moscow Zoo Telegram bot')
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default=config('BOT_MODE', default='polling'),
+                        help='receive updates by long polling or through the webhook server')
+    parser.add_argument('--runtime', choices=('sync', 'async'), default=config('BOT_RUNTIME', default='sync'),
+                        help='run handlers on the threaded TeleBot or on AsyncTeleBot')
+    parser.add_argument('--workers', type=int, default=config('BOT_WORKERS', default=1, cast=int),
+                        help='number of worker processes; chats are sharded between them by chat_id')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print import times and the startup time of each component, then exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=config('LOG_LEVEL', default='INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.profile_startup:
+        from resources import startup_report
+        startup_report('app', lambda: BotManager(config('AYGO_ZOO_BOT', default='0:profile'))).shutdown()
+        raise SystemExit
+    if args.workers > 1 and args.runtime == 'async':
+        parser.error('--workers is supported with the sync runtime only')
     bot_key = config('AYGO_ZOO_BOT')
-    bot_manager = BotManager(bot_key)
-    bot_manager.start_bot()
\ No newline at end of file
+    if args.workers > 1:
+        from sharding import ShardedBot
+        sharded_bot = ShardedBot(bot_key, shard_count=args.workers)
+        if args.mode == 'webhook':
+            sharded_bot.run_webhook()
+        else:
+            sharded_bot.run_polling()
+    elif args.runtime == 'async':
+        from async_app import AsyncBotManager
+        bot_manager = AsyncBotManager(bot_key)
+        if args.mode == 'webhook':
+            bot_manager.start_webhook()
+        else:
+            bot_manager.start_bot()
+    elif args.mode == 'webhook':
+        bot_manager = BotManager(bot_key, threaded=False)
+        bot_manager.start_webhook()
+    else:
+        bot_manager = BotManager(bot_key)
+        bot_manager.start_bot()
\ No newline at end of file
@@ -0,0 +1,201 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+from decouple import config
+
+import resources
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MAX_SIDE = 1280
+FORMATS = {
+    'jpeg': ('.jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('.webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def relative(path):
+    """
+    Returns the manifest key of a path: relative to the bot directory, so the manifest does not depend on where it is.
+    """
+    return os.path.relpath(path, resources.BASE_DIR).replace(os.sep, '/')
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def build_variants(source, source_hash, output_dir, max_side):
+    """
+    Writes the downscaled JPEG and WebP variants of one image and returns their manifest records.
+    Variant file names carry their content hash, so a changed variant is a new file.
+    Runs in a worker process, so it only takes plain values.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {}
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        for kind, (extension, options) in FORMATS.items():
+            tmp_path = os.path.join(output_dir, f'.{stem}-{source_hash[:10]}{extension}.{os.getpid()}.tmp')
+            image.save(tmp_path, **options)
+            digest = file_sha256(tmp_path)
+            path = os.path.join(output_dir, f'{stem}-{digest[:10]}{extension}')
+            os.replace(tmp_path, path)
+            variants[kind] = {'path': path, 'sha256': digest, 'size': os.path.getsize(path),
+                              'width': image.width, 'height': image.height}
+    return source, variants
+
+
+class AssetManifest:
+    """
+    Maps the bot's image assets to size-tuned variants made by the build step (`python asset_manifest.py`).
+    Telegram shows photos at most MAX_SIDE pixels wide, so larger originals only cost upload time and disk reads.
+    The manifest is read once at startup; an asset is resolved to its variant only while the source file
+    still has the size and mtime recorded at build time and the variant exists, otherwise to itself.
+    """
+    def __init__(self, manifest_path=None, output_dir=None, kind=None):
+        self.manifest_path = manifest_path or \
+            resources.path(config('ASSET_MANIFEST', default='settings/asset_manifest.json'))
+        self.output_dir = output_dir or resources.path(config('ASSET_BUILD_DIR', default='settings/assets_build'))
+        self.kind = kind or config('ASSET_FORMAT', default='jpeg')
+        self.entries = {}
+        self.resolved = {}
+        self.load()
+
+    def load(self):
+        """
+        Reads the manifest and computes the path every asset resolves to.
+        """
+        self.entries = {}
+        self.resolved = {}
+        if not os.path.isfile(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Asset manifest '%s' is unreadable: %s", self.manifest_path, e)
+            return
+        if data.get('version') != MANIFEST_VERSION:
+            return
+        self.entries = data['assets']
+        for source, entry in self.entries.items():
+            variant = entry['variants'].get(self.kind)
+            source = resources.path(source)
+            if variant is None or not os.path.isfile(source) or not os.path.isfile(resources.path(variant['path'])):
+                continue
+            if source_signature(source) == {key: entry['source'][key] for key in ('size', 'mtime_ns')}:
+                self.resolved[source] = resources.path(variant['path'])
+
+    def resolve(self, path):
+        """
+        Returns the path to send for an asset: its variant when it is up to date, otherwise the asset itself.
+        Relative paths are taken relative to the bot directory.
+        """
+        path = resources.path(path)
+        return self.resolved.get(path, path)
+
+    def save(self):
+        data = json.dumps({'version': MANIFEST_VERSION, 'max_side': MAX_SIDE, 'assets': self.entries},
+                          ensure_ascii=False, indent=1, sort_keys=True)
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(tmp_path, self.manifest_path)
+
+    def build(self, sources, workers=None, max_side=MAX_SIDE):
+        """
+        Builds the variants of the given images in a process pool, skipping images whose content has
+        not changed since the last build, records them in the manifest and removes stale variant files.
+        Returns the number of images encoded.
+        """
+        if Image is None:
+            raise RuntimeError('Building asset variants requires Pillow')
+        os.makedirs(self.output_dir, exist_ok=True)
+        entries = {}
+        jobs = []
+        for source in sources:
+            source = resources.path(source)
+            key = relative(source)
+            signature = source_signature(source)
+            entry = self.entries.get(key)
+            if entry and entry['source']['size'] == signature['size'] and \
+                    entry['source']['mtime_ns'] == signature['mtime_ns']:
+                source_hash = entry['source']['sha256']
+            else:
+                source_hash = file_sha256(source)
+            if entry and entry['source']['sha256'] == source_hash and \
+                    all(os.path.isfile(resources.path(variant['path'])) for variant in entry['variants'].values()):
+                entries[key] = {'source': dict(signature, sha256=source_hash), 'variants': entry['variants']}
+            else:
+                entries[key] = {'source': dict(signature, sha256=source_hash), 'variants': {}}
+                jobs.append((source, source_hash, self.output_dir, max_side))
+        if jobs:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for source, variants in pool.map(build_variants, *zip(*jobs)):
+                    for variant in variants.values():
+                        variant['path'] = relative(variant['path'])
+                    entries[relative(source)]['variants'] = variants
+        self.entries = entries
+        self.save()
+        live = {resources.path(variant['path']) for entry in entries.values() for variant in entry['variants'].values()}
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if path not in live:
+                os.remove(path)
+        self.load()
+        return len(jobs)
+
+
+def find_sources(root):
+    """
+    Lists the raster images under a directory; vector originals (.ai, .eps) are not sent and are skipped.
+    """
+    sources = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS:
+                sources.append(os.path.join(directory, name).replace(os.sep, '/'))
+    return sorted(sources)
+
+
+manifest = AssetManifest()
+
+
+if __name__ == '__main__':
+    """
+    Build step: encodes the variants of every image under assets/ and writes the manifest.
+    """
+    parser = argparse.ArgumentParser(description='Build size-tuned variants of the bot images')
+    parser.add_argument('--root', default='assets', help='directory of the source images')
+    parser.add_argument('--workers', type=int, help='encoding processes')
+    args = parser.parse_args()
+    logging.basicConfig(level='INFO', format='%(levelname)s %(name)s: %(message)s')
+    sources = find_sources(resources.path(args.root))
+    encoded = manifest.build(sources, workers=args.workers)
+    before = sum(os.path.getsize(source) for source in sources)
+    print(f'{len(sources)} images, {encoded} encoded; {before} bytes of originals')
+    for kind in FORMATS:
+        after = sum(entry['variants'][kind]['size'] for entry in manifest.entries.values())
+        print(f'{kind}: {after} bytes ({after / before:.1%})')
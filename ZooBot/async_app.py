@@ -0,0 +1,198 @@
+import asyncio
+import logging
+
+from decouple import config
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+import metrics
+from async_quiz import AsyncQuiz
+from manager import BaseBotManager, LogoFileNotFoundException
+from markups import markups
+from media_cache import AsyncMediaCache
+from scheduler import AsyncMessageScheduler
+from webhook import WebhookServer
+
+import views
+
+from textinfo import logo_photo, share_result_text
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBotManager(BaseBotManager):
+    def __init__(self, token):
+        """
+        Initializes the asyncio runtime on AsyncTeleBot. All API calls of the process share one
+        aiohttp session whose connection pool size is set by ASYNC_REQUEST_LIMIT.
+        Content, session storage, mail delivery, texts, keyboards and the answers of handlers are
+        the same as in the sync BotManager.
+        """
+        asyncio_helper.REQUEST_LIMIT = config('ASYNC_REQUEST_LIMIT', default=100, cast=int)
+        self.bot = AsyncTeleBot(token)
+        self.setup_components(self.bot, AsyncMessageScheduler, AsyncMediaCache, AsyncQuiz)
+
+    def start_bot(self):
+        """
+        Runs the bot's polling loop on a new event loop.
+        """
+        metrics.MetricsServer().start()
+        try:
+            asyncio.run(self.bot.infinity_polling())
+        finally:
+            self.shutdown()
+
+    def start_webhook(self):
+        """
+        Registers the webhook with Telegram and serves updates from the local HTTP server.
+        """
+        server = WebhookServer(self.bot)
+        metrics.registry.gauge('zoobot_webhook_pending', 'Webhook updates accepted but not handled yet.',
+                               lambda: server.pending)
+        metrics.MetricsServer().start()
+
+        async def serve():
+            await self.bot.remove_webhook()
+            await self.bot.set_webhook(url=config('WEBHOOK_URL'), secret_token=server.secret_token or None,
+                                       max_connections=server.max_concurrency)
+            await server.serve_forever()
+
+        try:
+            asyncio.run(serve())
+        finally:
+            self.shutdown()
+
+    def dispatcher(self, route):
+        """
+        Returns an AsyncTeleBot handler awaiting the handler an update is routed to.
+        """
+        async def dispatch(update):
+            handler, args = route(update)
+            if handler is None:
+                return
+            with self.observed(handler.__name__):
+                await handler(*args)
+        return dispatch
+
+    async def send_reply(self, message, reply):
+        """
+        Sends a reply decided by `views` and schedules its deletion.
+        """
+        if reply.reply_to:
+            answer = await self.bot.reply_to(message, reply.text, **self.reply_kwargs(reply))
+        else:
+            answer = await self.bot.send_message(message.chat.id, reply.text, **self.reply_kwargs(reply))
+        self.schedule_deletions(message, reply, answer)
+        return answer
+
+    async def handle_feedback_message(self, message):
+        """
+        Processes feedback messages from users and adds them to the feedback digest.
+        """
+        feedback = views.feedback_record(await self.sessions.get_async(message.chat.id), message)
+        if feedback is None:
+            return await self.send_reply(message, views.feedback_too_early_reply)
+        logger.debug('Feedback from chat %s: %s', message.chat.id, message.text)
+        accepted = await asyncio.to_thread(self.digest.add, 'feedback', feedback)
+        await self.send_reply(message, views.feedback_reply(accepted))
+
+    async def send_start_menu_keyboard(self, message):
+        """
+        Displays the start menu with the quiz, guardianship and information options.
+        """
+        greeting, start_menu_message = views.start_menu_texts(message.chat.id)
+        try:
+            await self.bot.send_message(message.chat.id, greeting)
+            await self.media.send_photo(message.chat.id, logo_photo, caption=start_menu_message,
+                                        reply_markup=markups.get('start_menu'))
+        except FileNotFoundError:
+            raise LogoFileNotFoundException("Logo file not found.")
+
+    async def show_totem_animal_info(self, message):
+        """
+        Displays information about the user's totem animal after completing the quiz.
+        """
+        session = await self.sessions.get_async(message.chat.id)
+        try:
+            photo_url = self.quiz.result_data(session, self.cards).get('image_url', '')
+            if photo_url:
+                text = self.cards.caption(session.result_animal)
+                await self.media.send_photo(message.chat.id, photo_url, caption=text, parse_mode='HTML')
+                self.scheduler.send_message_later(3, message.chat.id, views.results_text,
+                                                  reply_markup=markups.get('continue'), parse_mode='HTML')
+        except Exception as e:
+            logger.info('Chat %s has no results to show: %s', message.chat.id, e)
+            await self.send_reply(message, views.no_results_reply)
+
+    async def processing_of_results(self, message):
+        """
+        Shows the final steps after the quiz result.
+        """
+        session = await self.sessions.get_async(message.chat.id)
+        website_url = self.quiz.result_data(session, self.cards).get('website_url', '')
+        markup = markups.result(website_url, session.result_animal)
+        await self.bot.send_message(message.chat.id, views.processing_text, reply_markup=markup, parse_mode='HTML')
+
+    async def load_result_list(self, message):
+        """
+        Sends the result list for the user's totem animal.
+        """
+        session = await self.sessions.get_async(message.chat.id)
+        if session.result_animal is None:
+            return await self.send_reply(message, views.result_not_found_reply)
+        card = await asyncio.to_thread(self.cards.card_path, session.result_animal)
+        if card is None:
+            raise FileNotFoundError(f'No result card for {session.result_animal}')
+        await self.media.send_document(message.chat.id, card, caption='Totem Animal')
+        self.scheduler.send_message_later(2, message.chat.id, share_result_text)
+
+    async def answer_inline_query(self, inline_query):
+        """
+        Offers the result cards of the animals matching an inline query, to be shared in any chat.
+        """
+        if not self.sharing.username:
+            self.sharing.username = (await self.bot.get_me()).username
+        results = await asyncio.to_thread(self.sharing.search, inline_query.query)
+        await self.bot.answer_inline_query(inline_query.id, results, cache_time=self.sharing.cache_time)
+
+    async def show_shared_result(self, message):
+        """
+        Shows the result a `/start result_<animal>` link points to and invites the user to take the quiz.
+        """
+        animal = self.sharing.animal_from_start(message.text)
+        card = await asyncio.to_thread(self.cards.card_path, animal) if animal is not None else None
+        if card is None:
+            await self.send_start_menu_keyboard(message)
+            return
+        await self.media.send_photo(message.chat.id, card, caption=self.cards.caption(animal), parse_mode='HTML',
+                                    reply_markup=markups.get('shared_result'))
+
+    async def profile_command(self, message):
+        """
+        Admin command switching the handler profiler: `/profile on`, `/profile off` or `/profile dump`.
+        Chats not listed in ADMIN_CHAT_IDS get the default response.
+        """
+        action = self.profile_action(message)
+        if action is None:
+            return await self.send_default_response(message)
+        if action == 'on':
+            self.profiler.enable()
+        elif action == 'off':
+            await asyncio.to_thread(self.profiler.disable)
+        elif action == 'dump' and self.profiler.enabled:
+            await asyncio.to_thread(self.profiler.dump)
+        await self.send_reply(message, views.profile_reply(self.profiler))
+
+    async def agreement(self, message):
+        """
+        Collects quiz-related user data, stores the consent and adds it to the results digest.
+        """
+        full_name = views.full_name(message.from_user)
+        results = self.quiz.collection_of_information(await self.sessions.get_async(message.chat.id),
+                                                      message.from_user.id, full_name)
+        if results is None:
+            return await self.send_reply(message, views.consent_too_early_reply)
+        logger.debug('Chat %s consented to send: %s', message.chat.id, results)
+        self.store.save_consent(message.chat.id, message.from_user.id, full_name, results)
+        accepted = await asyncio.to_thread(self.digest.add, 'consent', {'chat_id': message.chat.id, **results})
+        await self.send_reply(message, views.consent_reply(accepted))
@@ -0,0 +1,108 @@
+import logging
+
+from telebot.asyncio_helper import ApiTelegramException
+
+from quiz import Quiz
+
+from textinfo import result_text, logo_end_photo, logo_start_quiz_photo
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncQuiz(Quiz):
+    """
+    Quiz for the async runtime. Answer bookkeeping, results and keyboards are inherited from Quiz;
+    only the methods talking to Telegram are coroutines here.
+    """
+    async def show_step(self, session, previous_image=None):
+        """
+        Edit mode: replaces the picture (if it changes), caption and keyboard of the quiz message with the
+        current step, or sends a new quiz message if there is none or it can no longer be edited.
+        """
+        chat_id = session.chat_id
+        image, caption, parse_mode, markup = self.step_view(session)
+        if session.message_id is not None:
+            try:
+                if image == previous_image:
+                    await self.bot.edit_message_caption(caption, chat_id, session.message_id, parse_mode=parse_mode,
+                                                        reply_markup=markup)
+                else:
+                    await self.media.edit_photo(chat_id, session.message_id, image, caption=caption,
+                                                parse_mode=parse_mode, reply_markup=markup)
+                return
+            except ApiTelegramException as e:
+                logger.info('Chat %s quiz message could not be edited, sending a new one: %s', chat_id, e)
+        message = await self.media.send_photo(chat_id, image, caption=caption, parse_mode=parse_mode,
+                                              reply_markup=markup)
+        session.message_id = message.message_id
+        self.sessions.save(session)
+
+    async def end_quiz(self, chat_id):
+        """
+        Ends the quiz and displays the result message with an option to view the result or restart the quiz.
+        """
+        await self.media.send_photo(chat_id, logo_end_photo, caption=result_text,
+                                    reply_markup=self.create_result_keyboard(), parse_mode='HTML')
+
+    async def start_quiz(self, chat_id):
+        """
+        Starts the quiz by resetting the session, then sends the first question.
+        """
+        session = await self.sessions.get_async(chat_id)
+        self.begin(session)
+        if self.mode == 'edit':
+            await self.show_step(session)
+            return
+        await self.media.send_photo(chat_id, logo_start_quiz_photo)
+        self.scheduler.call_later(self.start_delay, self.send_question, chat_id)
+
+    async def send_question(self, chat_id):
+        """
+        Sends the question image, then the question text with answer buttons a few seconds later.
+        """
+        session = await self.sessions.get_async(chat_id)
+        if session.current_question_index < len(self.questions):
+            await self.media.send_photo(chat_id, self.question_image(session.current_question_index))
+            self.scheduler.call_later(self.question_delay, self.send_question_text, chat_id,
+                                      session.current_question_index)
+        else:
+            await self.end_quiz(chat_id)
+
+    async def send_question_text(self, chat_id, question_index):
+        """
+        Sends the question text with answer buttons, unless the quiz has moved on or restarted meanwhile.
+        """
+        session = await self.sessions.get_async(chat_id)
+        if session.current_question_index != question_index or session.message_id is not None:
+            return
+        question_data = self.questions[question_index]
+        session.current_question_text = question_data.question
+        message = await self.bot.send_message(chat_id, session.current_question_text,
+                                              reply_markup=self.create_answer_markup(
+                                                  question_data.answers, question_index, session.nonce),
+                                              parse_mode='Markdown')
+        if session.current_question_index == question_index:
+            session.message_id = message.message_id
+            self.sessions.save(session)
+
+    async def process_answer(self, chat_id, answer_num, question_index=None, nonce=None):
+        """
+        Processes the user's answer to a question and sends the next question.
+        """
+        session = await self.sessions.get_async(chat_id)
+        if self.is_stale(session, question_index, nonce):
+            return
+        previous_image = self.question_image(session.current_question_index)
+        response_message = self.record_answer(session, answer_num)
+        if response_message is None:
+            return
+        if self.mode == 'edit':
+            self.sessions.save(session)
+            await self.show_step(session, previous_image)
+            return
+        await self.bot.send_message(chat_id, response_message, parse_mode='Markdown')
+        if session.message_id:
+            message_id, session.message_id = session.message_id, None
+            await self.bot.delete_message(chat_id, message_id)
+        self.sessions.save(session)
+        await self.send_question(chat_id)
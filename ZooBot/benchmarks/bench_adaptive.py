@@ -0,0 +1,68 @@
+"""
+Simulation of the adaptive quiz: random users answer through the AdaptiveEngine, and every result is
+checked against the result of answering all questions. Reports the questions asked per quiz and the
+time the engine takes to pick a question.
+
+Run from the ZooBot directory:
+    python benchmarks/bench_adaptive.py --users 5000 --metric l1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive import AdaptiveEngine  # noqa: E402
+from content import ContentStore  # noqa: E402
+from matcher import METRICS, TotemMatcher  # noqa: E402
+from service import choice  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate adaptive quizzes and compare them with full ones')
+    parser.add_argument('--users', type=int, default=5000, help='simulated quiz-takers')
+    parser.add_argument('--metric', choices=sorted(METRICS), default='l1', help='TOTEM_METRIC')
+    parser.add_argument('--weights', type=lambda text: [float(w) for w in text.split(',')],
+                        help="TOTEM_WEIGHTS, one per trait, e.g. '2,1,1,1,1'")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    questions = ContentStore().questions
+    matcher = TotemMatcher(choice, metric=args.metric, weights=args.weights)
+    engine = AdaptiveEngine(questions, matcher)
+    asked = Counter()
+    mismatches = 0
+    decisions = 0
+    start = time.perf_counter()
+    for _ in range(args.users):
+        answers = [random.randint(1, len(question.answers)) for question in questions]
+        full = matcher.match(matcher.trait_vector([question.answers[answer - 1].rank
+                                                   for question, answer in zip(questions, answers)]))
+        choices = [0] * len(questions)
+        while True:
+            index = engine.next_question(engine.state(choices))
+            decisions += 1
+            if index is None:
+                break
+            choices[index] = answers[index]
+        state = engine.state(choices)
+        mismatches += engine.decide(state) != full or matcher.match(engine.estimate(state)) != full
+        asked[sum(1 for answer in choices if answer)] += 1
+    elapsed = time.perf_counter() - start
+
+    mean = sum(count * users for count, users in asked.items()) / args.users
+    print(f'{args.users} users, {len(questions)} questions, metric {args.metric}: '
+          f'{mean:.2f} questions per quiz ({1 - mean / len(questions):.1%} fewer), '
+          f'{mismatches} results differ from the full quiz')
+    for count in sorted(asked):
+        print(f'  {count:>3} questions: {asked[count] / args.users:.1%}')
+    print(f'{elapsed / decisions * 1e6:.0f} us per decision (engine caches warm as users share states)')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of reply keyboard cost per send: building the InlineKeyboardMarkup objects and encoding
+them to JSON on every send, as the handlers did, against the keyboards pre-encoded by markups.MarkupRegistry.
+Both sides go through the Bot API client's own markup conversion, as a real send does.
+
+Run from the ZooBot directory:
+    python benchmarks/bench_markups.py --number 20000 --rate 1000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telebot.apihelper import _convert_markup  # noqa: E402
+
+import views  # noqa: E402
+from content import ContentStore  # noqa: E402
+from markups import MarkupRegistry  # noqa: E402
+
+
+def cases(registry, questions):
+    """
+    Returns (name, per-send legacy call, per-send registry call) for every kind of keyboard.
+    """
+    answers = questions[0].answers
+    url = 'https://moscowzoo.ru/'
+    return [
+        ('answer', lambda: _convert_markup(views.answer_markup(answers, 0, 0x1234)),
+         lambda: _convert_markup(registry.answer(answers, 0, 0x1234))),
+        ('result', lambda: _convert_markup(views.result_keyboard()),
+         lambda: _convert_markup(registry.get('result'))),
+        ('greeting', lambda: _convert_markup(views.greeting_markup()),
+         lambda: _convert_markup(registry.get('greeting'))),
+        ('start_menu', lambda: _convert_markup(views.start_menu_markup()),
+         lambda: _convert_markup(registry.get('start_menu'))),
+        ('results', lambda: _convert_markup(views.results_markup(url, 'manul')),
+         lambda: _convert_markup(registry.result(url, 'manul'))),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-send keyboard building with pre-encoded keyboards')
+    parser.add_argument('--number', type=int, default=20000, help='sends timed per keyboard')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs, the best one is reported')
+    parser.add_argument('--rate', type=float, default=1000, help='messages per second for the CPU estimate')
+    args = parser.parse_args()
+
+    registry = MarkupRegistry()
+    questions = ContentStore().questions
+    registry.warm(questions)
+    print(f"{'keyboard':<12} {'built us':>9} {'cached us':>10} {'speedup':>8}")
+    saved = []
+    for name, legacy, cached in cases(registry, questions):
+        assert legacy() == cached(), name
+        built = min(timeit.repeat(legacy, number=args.number, repeat=args.repeat)) / args.number
+        reused = min(timeit.repeat(cached, number=args.number, repeat=args.repeat)) / args.number
+        saved.append(built - reused)
+        print(f'{name:<12} {built * 1e6:>9.2f} {reused * 1e6:>10.2f} {built / reused:>7.0f}x')
+    mean_saved = sum(saved) / len(saved)
+    print(f'at {args.rate:.0f} messages/s: {mean_saved * args.rate * 1000:.1f} ms of CPU saved per second '
+          f'({mean_saved * args.rate:.1%} of a core)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of update dispatch cost: the per-update dict building of the original handlers
+against the routing tables compiled once by routing.Router.
+
+Run from the ZooBot directory:
+    python benchmarks/bench_routing.py --number 200000
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import Router, encode_answer  # noqa: E402
+from views import callback_commands, message_commands, prefix_commands  # noqa: E402
+
+
+class Handlers:
+    """
+    Stand-in for BotManager whose handlers do nothing, so only dispatch is measured.
+    """
+    def __getattr__(self, name):
+        return self.noop
+
+    def noop(self, *args):
+        pass
+
+
+def legacy_message(owner, message):
+    """
+    Message dispatch as the handlers did it before the router: predicate, then a dict built per update.
+    """
+    if message.text.startswith('Feedback'):
+        return owner.noop(message)
+    command_handlers = {command: getattr(owner, name) for command, name in message_commands.items()}
+    command_handlers.get(message.text.lower(), owner.noop)(message)
+
+
+def legacy_callback(owner, call):
+    """
+    Callback dispatch as the handlers did it before the router: 13 entries and 4 answer lambdas per press.
+    """
+    chat_id = call.message.chat.id
+    callback_handlers = {data: getattr(owner, name) for data, name in callback_commands.items()}
+    for i in range(1, 5):
+        callback_handlers[f'answer_{i}'] = lambda message, i=i: owner.noop(chat_id, i)
+    handler = callback_handlers.get(call.data)
+    if handler is not None:
+        handler(call.message)
+
+
+def routed_message(router, message):
+    handler, args = router.route_message(message)
+    handler(*args)
+
+
+def routed_callback(router, call):
+    handler, args = router.route_callback(call)
+    if handler is not None:
+        handler(*args)
+
+
+def sample_updates():
+    chat = SimpleNamespace(id=42)
+    message = SimpleNamespace(chat=chat, message_id=1)
+    texts = ['/start', 'hello', 'Feedback: great zoo', 'what is this?']
+    messages = [SimpleNamespace(chat=chat, message_id=1, text=text) for text in texts]
+    calls = [SimpleNamespace(message=message, data=data) for data in ('start_quiz', 'show_result', 'unknown')]
+    calls += [SimpleNamespace(message=message, data=encode_answer(3, n, 0xbeef)) for n in range(1, 5)]
+    legacy_calls = [SimpleNamespace(message=message, data=data)
+                    for data in ('start_quiz', 'show_result', 'unknown', 'answer_1', 'answer_2', 'answer_3', 'answer_4')]
+    return messages, calls, legacy_calls
+
+
+def measure(label, func, target, updates, number):
+    """
+    Prints the mean dispatch time and the peak memory allocated while dispatching an update.
+    """
+    def run():
+        for update in updates:
+            func(target, update)
+
+    seconds = min(timeit.repeat(run, number=number // len(updates), repeat=3))
+    per_update = seconds / (number // len(updates) * len(updates))
+    tracemalloc.start()
+    peak = 0
+    for update in updates:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func(target, update)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    print(f'{label:<18} {per_update * 1e9:8.0f} ns/update {peak / len(updates):8.0f} B peak/update')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark update dispatch')
+    parser.add_argument('--number', type=int, default=100000, help='updates dispatched per measurement')
+    args = parser.parse_args()
+    owner = Handlers()
+    router = Router(owner, message_commands, prefix_commands, callback_commands,
+                    default='send_default_response', answer_handler=owner.noop)
+    messages, calls, legacy_calls = sample_updates()
+    measure('legacy messages', legacy_message, owner, messages, args.number)
+    measure('router messages', routed_message, router, messages, args.number)
+    measure('legacy callbacks', legacy_callback, owner, legacy_calls, args.number)
+    measure('router callbacks', routed_callback, router, calls, args.number)
+
+
+if __name__ == '__main__':
+    main()
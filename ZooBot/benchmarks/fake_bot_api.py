@@ -0,0 +1,204 @@
+"""
+Local stand-in for the Telegram Bot API, for load tests.
+
+Answers sendMessage, sendPhoto, sendDocument, the message edits, deleteMessage, getUpdates and the
+webhook/getMe calls with plausible results after a configurable latency, and can reject a share of
+requests with 429 Too Many Requests. Point pyTelegramBotAPI at it with
+
+    telebot.apihelper.API_URL = server.api_url
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText', 'editMessageCaption',
+                   'editMessageMedia'}
+
+
+class FakeBotApi:
+    """
+    Fake Bot API server running on its own event loop thread.
+    `listener(method, params, result)` is called on that loop for every successful call, which lets
+    a load generator react to what the bot sends. Updates for getUpdates are queued with `push_update`.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, flood_ratio=0.0, retry_after=1,
+                 listener=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_ratio = flood_ratio
+        self.retry_after = retry_after
+        self.listener = listener
+        self.message_ids = itertools.count(1000)
+        self.file_ids = itertools.count(1)
+        self.calls = {}
+        self.floods = 0
+        self.updates = []
+        self.updates_ready = None
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def api_url(self):
+        return f'http://{self.host}:{self.port}/bot{{0}}/{{1}}'
+
+    def start(self):
+        """
+        Starts the server in a background thread and returns once it is listening.
+        """
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.updates_ready = asyncio.Event()
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle_connection, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name='fake-bot-api', daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def push_update(self, update):
+        """
+        Queues an update for the next getUpdates call. Safe to call from any thread.
+        """
+        def push():
+            self.updates.append(update)
+            self.updates_ready.set()
+        self.loop.call_soon_threadsafe(push)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback, *args)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, params, keep_alive = request
+                status, body = await self.handle(method, params)
+                head = (f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                        f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader):
+        """
+        Reads one request and returns (api method, query parameters, keep_alive), or None at end of stream.
+        Uploaded files are read and discarded.
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        _, target, version = request_line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0) or 0)
+        if length:
+            await reader.readexactly(length)
+        url = urlsplit(target)
+        keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+        return url.path.rsplit('/', 1)[-1], dict(parse_qsl(url.query)), keep_alive
+
+    async def handle(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getUpdates':
+            return 200, self.ok(await self.get_updates(params))
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.flood_ratio and method in MESSAGE_METHODS | {'deleteMessage'} \
+                and random.random() < self.flood_ratio:
+            self.floods += 1
+            body = {'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after}}
+            return 429, json.dumps(body).encode()
+        result = self.result(method, params)
+        if self.listener is not None:
+            self.listener(method, params, result)
+        return 200, self.ok(result)
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates:
+            self.updates_ready.clear()
+            try:
+                await asyncio.wait_for(self.updates_ready.wait(), float(params.get('timeout', 0) or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit', 100) or 100)
+        return self.updates[:limit]
+
+    def result(self, method, params):
+        if method not in MESSAGE_METHODS:
+            if method == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'ZooBot', 'username': 'zoo_bot'}
+            return True
+        chat_id = int(params.get('chat_id', 0))
+        message_id = int(params['message_id']) if 'message_id' in params else next(self.message_ids)
+        message = {'message_id': message_id, 'date': int(time.time()),
+                   'chat': {'id': chat_id, 'type': 'private'},
+                   'from': {'id': 1, 'is_bot': True, 'first_name': 'ZooBot'}}
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        if 'reply_markup' in params:
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        if method == 'sendPhoto':
+            file_id = params.get('photo') or f'photo-{next(self.file_ids)}'
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 640, 'height': 480}]
+        elif method == 'sendDocument':
+            file_id = params.get('document') or f'document-{next(self.file_ids)}'
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id}
+        elif method == 'editMessageMedia':
+            media = json.loads(params['media'])
+            file_id = media['media'] if not media['media'].startswith('attach://') else f'photo-{next(self.file_ids)}'
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 640, 'height': 480}]
+            if 'caption' in media:
+                message['caption'] = media['caption']
+        return message
+
+    @staticmethod
+    def ok(result):
+        return json.dumps({'ok': True, 'result': result}).encode()
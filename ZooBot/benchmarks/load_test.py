@@ -0,0 +1,332 @@
+"""
+Load test of the full BotManager flow against the fake Bot API server.
+
+Every simulated user goes through hello -> /start -> quiz answers -> show_result -> continue -> get_res,
+waiting for the bot's reply to each step before the next one. The report gives throughput, p50/p99
+latency per step and memory per session; --max-p99 / --min-throughput turn it into a regression gate.
+
+Run from the ZooBot directory:
+    python benchmarks/load_test.py --users 2000 --latency 0.05 --flood-ratio 0.01
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_bot_api import FakeBotApi  # noqa: E402
+import resources  # noqa: E402
+
+STEPS = ('hello', '/start', 'start_quiz', 'answer', 'show_result', 'continue', 'get_res')
+
+
+def button_data(result):
+    """
+    Returns the callback_data of the inline buttons of a message sent by the bot.
+    """
+    markup = result.get('reply_markup') if isinstance(result, dict) else None
+    if not markup:
+        return ()
+    return tuple(button['callback_data'] for row in markup.get('inline_keyboard', ())
+                 for button in row if 'callback_data' in button)
+
+
+class SimulatedUser:
+    """
+    One quiz-taker. Each step sends an update and waits for the reply that unlocks the next step.
+    Runs entirely on the fake server's event loop.
+    """
+    def __init__(self, test, chat_id):
+        self.test = test
+        self.chat_id = chat_id
+        self.step = None
+        self.expected = None
+        self.started = 0.0
+        self.seq = 0
+        self.answers = 0
+
+    def begin(self):
+        self.act('hello', text='hello', expect='start')
+
+    def act(self, step, text=None, callback_data=None, expect=None):
+        self.step, self.expected = step, expect
+        self.seq += 1
+        self.started = time.perf_counter()
+        self.test.send(self.chat_id, text=text, callback_data=callback_data)
+        self.test.api.loop.call_later(self.test.step_timeout, self.timeout, self.seq)
+
+    def on_bot_message(self, method, result):
+        if self.expected is None:
+            return
+        data = button_data(result)
+        if self.expected == 'document':
+            if method != 'sendDocument':
+                return
+            next_step = None
+        elif self.expected == 'answer_or_result':
+            if 'show_result' in data:
+                next_step = ('show_result', None, 'show_result', 'continue')
+            elif any(self.test.decode_answer(item) for item in data):
+                next_step = ('answer', None, self.pick_answer(data), 'answer_or_result')
+            else:
+                return
+        elif self.expected in data:
+            next_step = {
+                'start': ('/start', '/start', None, 'start_quiz'),
+                'start_quiz': ('start_quiz', None, 'start_quiz', 'answer_or_result'),
+                'continue': ('continue', None, 'continue', 'get_res'),
+                'get_res': ('get_res', None, 'get_res', 'document'),
+            }[self.expected]
+        else:
+            return
+        self.test.record(self.step, time.perf_counter() - self.started)
+        self.expected = None
+        if next_step is None:
+            self.test.finish(self, ok=True)
+            return
+        step, text, callback_data, expect = next_step
+        think = random.uniform(0, self.test.think)
+        self.test.api.loop.call_later(think, lambda: self.act(step, text, callback_data, expect))
+
+    def pick_answer(self, data):
+        self.answers += 1
+        return random.choice([item for item in data if self.test.decode_answer(item)])
+
+    def timeout(self, seq):
+        if seq == self.seq and self.expected is not None:
+            self.test.fail(self)
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.users_total = args.users
+        self.think = args.think
+        self.step_timeout = args.step_timeout
+        self.latencies = {step: [] for step in STEPS}
+        self.failures = {step: 0 for step in STEPS}
+        self.users = {}
+        self.completed = 0
+        self.failed = 0
+        self.done = threading.Event()
+        self.api = FakeBotApi(latency=args.latency, jitter=args.jitter, flood_ratio=args.flood_ratio,
+                              retry_after=args.retry_after, listener=self.on_api_call)
+        self.manager = None
+        self.decode_answer = None
+
+    def configure(self, workdir):
+        """
+        Points the bot's state files to a scratch directory, sets the quiz pauses and rate limits for
+        the test, and writes totem animal records so the result steps have data to show.
+        """
+        animals_dir = os.path.join(workdir, 'totem_animals')
+        os.makedirs(animals_dir)
+        from service import choice
+        for name in choice.values():
+            image = f'settings/totem_animals/{name}.jpg'
+            with open(os.path.join(animals_dir, name), 'w', encoding='utf-8') as file:
+                file.write(f'name: {name}\ndescription: Load test record of {name}\n'
+                           f'image_url: {image if os.path.exists(resources.path(image)) else "assets/start_logo.jpg"}\n'
+                           f'website_url: https://moscowzoo.ru/\n')
+        os.environ.update({
+            'TOTEM_ANIMALS_DIR': animals_dir,
+            'CONTENT_SNAPSHOT_FILE': os.path.join(workdir, 'content.snapshot'),
+            'STORAGE_PATH': os.path.join(workdir, 'zoobot.sqlite3'),
+            'MEDIA_CACHE_FILE': os.path.join(workdir, 'media_cache.json'),
+            'RESULT_CARDS_DIR': os.path.join(workdir, 'result_cards'),
+            'MAIL_OUTBOX_DIR': os.path.join(workdir, 'outbox'),
+            'ANALYTICS_FILE': os.path.join(workdir, 'analytics.zqa'),
+            'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+            'SMTP_HOST': '127.0.0.1',
+            'SMTP_PORT': '9',
+            'METRICS_PORT': '0',
+            'QUIZ_START_DELAY': str(self.args.quiz_delay),
+            'QUIZ_QUESTION_DELAY': str(self.args.quiz_delay),
+            'QUIZ_MODE': self.args.quiz_mode,
+            'BOT_THREADS': str(self.args.threads),
+            'OUTBOUND_WORKERS': str(self.args.threads),
+            'OUTBOUND_GLOBAL_RATE': str(self.args.global_rate),
+            'OUTBOUND_CHAT_RATE': str(self.args.chat_rate),
+            'OUTBOUND_CHAT_BURST': str(self.args.chat_burst),
+        })
+
+    def run(self):
+        self.api.start()
+        import telebot
+        telebot.apihelper.API_URL = self.api.api_url
+        from app import BotManager
+        from routing import decode_answer
+        self.decode_answer = decode_answer
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.manager = BotManager('1:load-test', threaded=True)
+        poller = None
+        if self.args.ingress == 'polling':
+            poller = threading.Thread(target=self.manager.bot.polling,
+                                      kwargs={'non_stop': True, 'interval': 0, 'timeout': 1,
+                                              'long_polling_timeout': 1},
+                                      daemon=True)
+            poller.start()
+        started = time.perf_counter()
+        for index in range(self.users_total):
+            chat_id = 10_000_000 + index
+            user = self.users[chat_id] = SimulatedUser(self, chat_id)
+            self.api.call_later(index * self.args.ramp / max(1, self.users_total), user.begin)
+        self.done.wait()
+        elapsed = time.perf_counter() - started
+        sessions_bytes = self.session_bytes()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if poller is not None:
+            self.manager.bot.stop_polling()
+        self.shutdown()
+        return self.report(elapsed, sessions_bytes, (rss_after - rss_before) * 1024)
+
+    def send(self, chat_id, text=None, callback_data=None):
+        from webhook_harness import synthetic_update
+        update = synthetic_update(chat_id, text=text, callback_data=callback_data)
+        if self.args.ingress == 'polling':
+            self.api.push_update(update)
+        else:
+            from telebot import types
+            self.manager.bot.process_new_updates([types.Update.de_json(update)])
+
+    def on_api_call(self, method, params, result):
+        user = self.users.get(int(params.get('chat_id', 0) or 0))
+        if user is not None:
+            user.on_bot_message(method, result)
+
+    def record(self, step, seconds):
+        self.latencies[step].append(seconds)
+
+    def finish(self, user, ok):
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+        if self.completed + self.failed == self.users_total:
+            self.done.set()
+
+    def fail(self, user):
+        self.failures[user.step] += 1
+        user.expected = None
+        self.finish(user, ok=False)
+
+    def session_bytes(self):
+        """
+        Returns the mean size of the in-memory quiz sessions, arrays and strings included.
+        """
+        gc.collect()
+        sizes = []
+        for shard in self.manager.sessions.shards:
+            for session in list(shard.values()):
+                size = sys.getsizeof(session)
+                for name in session.__slots__:
+                    value = getattr(session, name, None)
+                    if value is not None and not isinstance(value, (int, float)):
+                        size += sys.getsizeof(value)
+                sizes.append(size)
+        return sum(sizes) / len(sizes) if sizes else 0
+
+    def shutdown(self):
+        manager = self.manager
+        manager.scheduler.stop()
+        manager.api.stop()
+        manager.mailer.stop(timeout=1)
+        manager.content.stop_watching()
+        manager.store.close()
+        self.api.stop()
+
+    def report(self, elapsed, session_bytes, rss_growth):
+        steps = sum(len(values) for values in self.latencies.values())
+        result = {
+            'users': self.users_total,
+            'completed': self.completed,
+            'failed': self.failed,
+            'elapsed_s': round(elapsed, 3),
+            'steps_per_s': round(steps / elapsed, 1),
+            'flows_per_min': round(self.completed / elapsed * 60, 1),
+            'api_calls': dict(sorted(self.api.calls.items())),
+            'api_429': self.api.floods,
+            'session_bytes': round(session_bytes),
+            'rss_growth_per_user_bytes': round(rss_growth / max(1, self.users_total)),
+            'steps': {},
+        }
+        for step in STEPS:
+            values = sorted(self.latencies[step])
+            if not values and not self.failures[step]:
+                continue
+            result['steps'][step] = {
+                'count': len(values),
+                'timeouts': self.failures[step],
+                'p50_ms': round(values[len(values) // 2] * 1000, 1) if values else None,
+                'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 1) if values else None,
+            }
+        return result
+
+
+def print_report(result):
+    print(f"{result['users']} users: {result['completed']} completed, {result['failed']} failed "
+          f"in {result['elapsed_s']:.1f}s")
+    print(f"throughput: {result['steps_per_s']} steps/s, {result['flows_per_min']} flows/min; "
+          f"{sum(result['api_calls'].values())} API calls, {result['api_429']} answered with 429")
+    print(f"memory: {result['session_bytes']} B per session, "
+          f"{result['rss_growth_per_user_bytes']} B RSS growth per user")
+    print(f"{'step':<12} {'count':>7} {'timeouts':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for step, stats in result['steps'].items():
+        print(f"{step:<12} {stats['count']:>7} {stats['timeouts']:>8} "
+              f"{stats['p50_ms'] if stats['p50_ms'] is not None else '-':>9} "
+              f"{stats['p99_ms'] if stats['p99_ms'] is not None else '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the bot against a fake Bot API server')
+    parser.add_argument('--users', type=int, default=500, help='simulated quiz-takers')
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds over which users arrive')
+    parser.add_argument('--think', type=float, default=0.2, help='max pause of a user before the next step')
+    parser.add_argument('--step-timeout', type=float, default=30.0, help='seconds to wait for a reply')
+    parser.add_argument('--quiz-delay', type=float, default=0.05, help='QUIZ_START_DELAY and QUIZ_QUESTION_DELAY')
+    parser.add_argument('--quiz-mode', choices=('messages', 'edit'), default='messages',
+                        help='QUIZ_MODE: a message per question, or one message edited at every step')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake API latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='extra random API latency in seconds')
+    parser.add_argument('--flood-ratio', type=float, default=0.0, help='share of sends answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after of injected 429 answers')
+    parser.add_argument('--threads', type=int, default=16, help='handler threads and outbound workers')
+    parser.add_argument('--global-rate', type=float, default=100000, help='OUTBOUND_GLOBAL_RATE for the run')
+    parser.add_argument('--chat-rate', type=float, default=1000, help='OUTBOUND_CHAT_RATE for the run')
+    parser.add_argument('--chat-burst', type=int, default=1000, help='OUTBOUND_CHAT_BURST for the run')
+    parser.add_argument('--ingress', choices=('direct', 'polling'), default='direct',
+                        help='hand updates to the bot directly (as the webhook does) or through getUpdates')
+    parser.add_argument('--log-level', default='ERROR', help='log level of the bot during the run')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--max-p99', type=float, help='fail if any step p99 exceeds this many ms')
+    parser.add_argument('--min-throughput', type=float, help='fail if fewer steps per second are completed')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    test = LoadTest(args)
+    with tempfile.TemporaryDirectory(prefix='zoobot-load-') as workdir:
+        test.configure(workdir)
+        result = test.run()
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+    failed = result['failed'] > 0
+    if args.max_p99 is not None:
+        failed |= any(stats['p99_ms'] is not None and stats['p99_ms'] > args.max_p99
+                      for stats in result['steps'].values())
+    if args.min_throughput is not None:
+        failed |= result['steps_per_s'] < args.min_throughput
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
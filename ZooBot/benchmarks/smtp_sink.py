@@ -0,0 +1,147 @@
+"""
+Local SMTP sink for exercising the mail path without a real mail server.
+
+Accepts every message on a local port and keeps it in memory. Run as a script, it feeds consents and
+feedback through the DigestAggregator and MailDispatcher into the sink and checks that they arrive as
+digests with one HTML row and one CSV row per record:
+
+    python benchmarks/smtp_sink.py --records 1000 --max-items 200
+"""
+import argparse
+import asyncio
+import csv
+import email
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SmtpSink:
+    """
+    Minimal SMTP server on its own event loop thread; received messages are parsed into `messages`.
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+            self.port = server.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+            server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def handle_connection(self, reader, writer):
+        async def reply(line):
+            writer.write(f'{line}\r\n'.encode())
+            await writer.drain()
+
+        try:
+            await reply('220 sink ready')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('latin-1').strip().upper()
+                if command.startswith(('EHLO', 'HELO')):
+                    await reply('250 sink')
+                elif command == 'DATA':
+                    await reply('354 end with .')
+                    lines = []
+                    while True:
+                        data = await reader.readline()
+                        if data in (b'.\r\n', b'.\n', b''):
+                            break
+                        lines.append(data[1:] if data.startswith(b'..') else data)
+                    self.messages.append(email.message_from_bytes(b''.join(lines)))
+                    await reply('250 queued')
+                elif command == 'QUIT':
+                    await reply('221 bye')
+                    break
+                else:
+                    await reply('250 ok')
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def digest_rows(message):
+    """
+    Returns the number of HTML table rows and CSV rows of a digest email.
+    """
+    html_rows = csv_rows = 0
+    for part in message.walk():
+        if part.get_content_type() == 'text/html':
+            html_rows = part.get_payload(decode=True).decode('utf-8').count('<tr>') - 1
+        elif part.get_filename():
+            csv_rows = len(list(csv.reader(io.StringIO(part.get_payload(decode=True).decode('utf-8'))))) - 1
+    return html_rows, csv_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send digests of fake consents and feedback into a local SMTP sink')
+    parser.add_argument('--records', type=int, default=1000, help='records of each kind')
+    parser.add_argument('--max-items', type=int, default=200, help='DIGEST_MAX_ITEMS')
+    args = parser.parse_args()
+
+    sink = SmtpSink().start()
+    workdir = tempfile.mkdtemp(prefix='zoobot-digest-')
+    from digest import DigestAggregator
+    from mailer import MailDispatcher
+    mailer = MailDispatcher(outbox_dir=os.path.join(workdir, 'outbox'), host=sink.host, port=sink.port,
+                            starttls=False)
+    digest = DigestAggregator(mailer, max_items=args.max_items, max_age=3600)
+    start = time.perf_counter()
+    for i in range(args.records):
+        digest.add('consent', {'chat_id': i, 'user_id': i, 'full_name': f'User {i}', 'name': 'Manul',
+                               'results': [['manul', 3.5], ['otter', 1.0]]})
+        digest.add('feedback', {'chat_id': i, 'user_id': i, 'full_name': f'User {i}', 'text': f'<b>Nice</b> {i}'})
+    digest.stop()
+    while mailer.queue_depth():
+        time.sleep(0.05)
+    mailer.stop()
+    elapsed = time.perf_counter() - start
+    sink.stop()
+
+    rows = {}
+    for message in sink.messages:
+        kind = 'consent' if message['Subject'].startswith('Quiz') else 'feedback'
+        html_rows, csv_rows = digest_rows(message)
+        if html_rows != csv_rows:
+            print(f'row mismatch in "{message["Subject"]}": {html_rows} HTML, {csv_rows} CSV')
+            return 1
+        rows[kind] = rows.get(kind, 0) + csv_rows
+    print(f'{2 * args.records} records -> {len(sink.messages)} emails in {elapsed:.2f}s; rows per kind: {rows}')
+    return 0 if rows == {'consent': args.records, 'feedback': args.records} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+from decouple import config
+
+import resources
+from service import load_quiz_data, read_totem_animal_file
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class Answer(NamedTuple):
+    number: int
+    text: str
+    rank: float
+
+
+class Question(NamedTuple):
+    question: str
+    answers: tuple
+
+
+class Content(NamedTuple):
+    questions: tuple
+    animals: MappingProxyType
+    signature: tuple
+
+
+class ContentStore:
+    """
+    Parses quiz questions and totem animal records once and shares them, read-only, with all sessions.
+    The parsed content is cached in a binary snapshot for fast cold starts, and a watcher thread
+    re-parses it in the background when the source files change, so requests never parse files.
+    """
+    def __init__(self, questions_path=None, animals_dir=None, snapshot_path=None, check_interval=None):
+        self.questions_path = questions_path or \
+            resources.path(config('QUIZ_QUESTIONS_FILE', default='settings/quiz-questions/questions.txt'))
+        self.animals_dir = animals_dir or resources.path(config('TOTEM_ANIMALS_DIR', default='assets/totem_animals'))
+        self.snapshot_path = snapshot_path or \
+            resources.path(config('CONTENT_SNAPSHOT_FILE', default='settings/content.snapshot'))
+        self.check_interval = check_interval if check_interval is not None else \
+            config('CONTENT_CHECK_INTERVAL', default=5.0, cast=float)
+        self.content = self.load()
+        self.stop_event = threading.Event()
+        self.watcher = None
+
+    @property
+    def questions(self):
+        return self.content.questions
+
+    def animal(self, name):
+        """
+        Returns the record of a totem animal, or None if there is no data for it.
+        """
+        if name is None:
+            return None
+        return self.content.animals.get(name.lower())
+
+    def source_files(self):
+        """
+        Lists the files the content is built from.
+        """
+        files = [self.questions_path]
+        if os.path.isdir(self.animals_dir):
+            files.extend(os.path.join(self.animals_dir, name) for name in sorted(os.listdir(self.animals_dir))
+                         if '.' not in name and os.path.isfile(os.path.join(self.animals_dir, name)))
+        return files
+
+    def signature(self):
+        """
+        Returns the (path, mtime, size) of every source file, used to detect changes.
+        """
+        result = []
+        for path in self.source_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(result)
+
+    def load(self):
+        """
+        Loads the content from the snapshot if it is still current, otherwise parses the sources.
+        """
+        signature = self.signature()
+        content = self.read_snapshot(signature)
+        if content is None:
+            content = self.parse(signature)
+            self.write_snapshot(content)
+        return content
+
+    def parse(self, signature):
+        """
+        Parses the quiz questions and totem animal records into immutable structures.
+        """
+        questions = ()
+        if os.path.isfile(self.questions_path):
+            questions = tuple(
+                Question(item['question'], tuple(Answer(**answer) for answer in item['answers']))
+                for item in load_quiz_data(self.questions_path))
+        else:
+            logger.warning("File '%s' does not exist.", self.questions_path)
+        animals = {}
+        for path in self.source_files()[1:]:
+            animals[os.path.basename(path).lower()] = MappingProxyType(read_totem_animal_file(path))
+        return Content(questions, MappingProxyType(animals), signature)
+
+    def read_snapshot(self, signature):
+        if not os.path.isfile(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, 'rb') as file:
+                version, snapshot_signature, questions, animals = pickle.load(file)
+            if version != SNAPSHOT_VERSION or snapshot_signature != signature:
+                return None
+            animals = MappingProxyType({name: MappingProxyType(record) for name, record in animals.items()})
+        except Exception as e:
+            # a truncated or foreign snapshot can fail to unpickle with almost any error; it is only a cache
+            logger.warning("Ignoring unreadable content snapshot '%s': %s", self.snapshot_path, e)
+            return None
+        return Content(questions, animals, signature)
+
+    def write_snapshot(self, content):
+        animals = {name: dict(record) for name, record in content.animals.items()}
+        data = (SNAPSHOT_VERSION, content.signature, content.questions, animals)
+        directory, name = os.path.split(os.path.abspath(self.snapshot_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+        except OSError as e:
+            logger.warning("Unable to write content snapshot '%s': %s", self.snapshot_path, e)
+            return
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            os.unlink(tmp_path)
+            logger.warning("Unable to write content snapshot '%s': %s", self.snapshot_path, e)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def reload_if_changed(self):
+        """
+        Re-parses the content if any source file changed; returns True when it was reloaded.
+        """
+        signature = self.signature()
+        if signature == self.content.signature:
+            return False
+        try:
+            content = self.parse(signature)
+        except (OSError, ValueError, IndexError, KeyError) as e:
+            logger.error('Content reload failed, keeping the previous version: %s', e)
+            return False
+        self.content = content
+        self.write_snapshot(content)
+        logger.info('Quiz content reloaded.')
+        return True
+
+    def start_watching(self):
+        """
+        Starts a background thread that checks the source files every `check_interval` seconds.
+        """
+        if self.watcher is None and self.check_interval > 0:
+            self.watcher = threading.Thread(target=self._watch, name='content-watcher', daemon=True)
+            self.watcher.start()
+
+    def stop_watching(self):
+        self.stop_event.set()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.check_interval):
+            self.reload_if_changed()
@@ -0,0 +1,220 @@
+import csv
+import html
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = {
+    'consent': 'Quiz Results from Zoo-Bot',
+    'feedback': 'Feedback from Zoo-Bot users',
+}
+
+
+def cell(value):
+    """
+    Formats a record value for a table cell; lists and dicts are written as JSON.
+    """
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return '' if value is None else str(value)
+
+
+def read_records(path):
+    """
+    Yields the records of a spool file one at a time, skipping a line cut short by a crash.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning('Skipping malformed record in %s', path)
+
+
+class DigestAggregator:
+    """
+    Collects consents and feedback into batches and mails one digest per batch instead of one email per user.
+    Records are appended to a spool file per kind as they arrive, so nothing is lost on a crash.
+    A batch is sent when it holds `max_items` records or its oldest record is `max_age` seconds old,
+    and on shutdown. The digest is an HTML table with the same rows attached as CSV; it is built in memory
+    and stored whole in the mailer's outbox, so `max_items` is what bounds the size of a digest.
+    """
+    def __init__(self, mailer, spool_dir=None, max_items=None, max_age=None):
+        self.mailer = mailer
+        self.spool_dir = spool_dir or config('DIGEST_SPOOL_DIR', default=os.path.join(mailer.outbox_dir, 'digest'))
+        self.max_items = max_items or config('DIGEST_MAX_ITEMS', default=200, cast=int)
+        self.max_age = max_age or config('DIGEST_MAX_AGE', default=900.0, cast=float)
+        self.counts = {}
+        self.oldest = {}
+        self.condition = threading.Condition()
+        self.running = True
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.recover()
+        self.thread = threading.Thread(target=self._run, name='digest', daemon=True)
+        self.thread.start()
+
+    def spool_path(self, kind):
+        return os.path.join(self.spool_dir, f'{kind}.jsonl')
+
+    def recover(self):
+        """
+        Sends the batches a previous run had closed but not mailed, and resumes its open spool files.
+        """
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if name.endswith('.batch.jsonl'):
+                self._send(name.split('-', 1)[0], path)
+            elif name.endswith('.jsonl'):
+                kind = name[:-len('.jsonl')]
+                with open(path, 'rb+') as file:
+                    if file.seek(0, os.SEEK_END):
+                        file.seek(-1, os.SEEK_END)
+                        if file.read(1) != b'\n':
+                            file.write(b'\n')
+                count = 0
+                for record in read_records(path):
+                    if count == 0:
+                        self.oldest[kind] = record['time']
+                    count += 1
+                if count:
+                    self.counts[kind] = count
+
+    def add(self, kind, record):
+        """
+        Appends a record to the current batch of its kind and returns True once it is stored on disk.
+        """
+        record = {'time': time.time(), **record}
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self.condition:
+            try:
+                with open(self.spool_path(kind), 'a', encoding='utf-8') as file:
+                    file.write(line)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except OSError as e:
+                logger.error('Unable to store %s record in the digest spool: %s', kind, e)
+                return False
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.oldest.setdefault(kind, record['time'])
+            full = self.counts[kind] >= self.max_items
+            if self.counts[kind] == 1:
+                self.condition.notify()
+        if full:
+            self.flush(kind)
+        return True
+
+    def pending(self):
+        """
+        Returns the number of records waiting for their digest.
+        """
+        with self.condition:
+            return sum(self.counts.values())
+
+    def flush(self, kind=None):
+        """
+        Closes the current batch of a kind, or of every kind, and mails it.
+        """
+        with self.condition:
+            kinds = [kind] if kind is not None else list(self.counts)
+            batches = []
+            for name in kinds:
+                if not self.counts.pop(name, 0):
+                    continue
+                self.oldest.pop(name, None)
+                batch_path = os.path.join(self.spool_dir, f'{name}-{time.time_ns()}.batch.jsonl')
+                try:
+                    os.replace(self.spool_path(name), batch_path)
+                except FileNotFoundError:
+                    continue
+                batches.append((name, batch_path))
+        for name, batch_path in batches:
+            self._send(name, batch_path)
+
+    def stop(self):
+        """
+        Mails the open batches and stops the timer thread.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
+
+    def _send(self, kind, batch_path):
+        """
+        Renders a closed batch and hands it to the mailer; the batch file is kept if that fails.
+        """
+        try:
+            msg, count = self.render(kind, batch_path)
+        except OSError as e:
+            logger.error('Unable to render digest %s: %s', batch_path, e)
+            return
+        if self.mailer.enqueue(msg):
+            os.remove(batch_path)
+            logger.info('Queued %s digest of %s records', kind, count)
+
+    @staticmethod
+    def columns(batch_path):
+        """
+        Returns the fields of a batch in order of first appearance, reading one record at a time.
+        """
+        columns = {}
+        for record in read_records(batch_path):
+            for key in record:
+                columns.setdefault(key, None)
+        return list(columns)
+
+    def render(self, kind, batch_path):
+        """
+        Builds the digest email of a batch: an HTML table in the body and a CSV attachment.
+        The whole message is held in memory; its size is bounded by `max_items` records.
+        """
+        from email.mime.application import MIMEApplication
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        columns = self.columns(batch_path)
+        count = 0
+        table = io.StringIO()
+        attachment = io.StringIO(newline='')
+        writer = csv.writer(attachment)
+        writer.writerow(columns)
+        table.write('<table border="1" cellspacing="0" cellpadding="4"><tr>')
+        table.write(''.join(f'<th>{html.escape(column)}</th>' for column in columns) + '</tr>\n')
+        for record in read_records(batch_path):
+            record['time'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['time']))
+            row = [cell(record.get(column)) for column in columns]
+            writer.writerow(row)
+            table.write('<tr>' + ''.join(f'<td>{html.escape(value)}</td>' for value in row) + '</tr>\n')
+            count += 1
+        table.write('</table>')
+        subject = f'{SUBJECTS.get(kind, kind)}: {count} records'
+        body = f'<html><body><h3>{html.escape(subject)}</h3>\n{table.getvalue()}</body></html>'
+        msg = MIMEMultipart()
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html', 'utf-8'))
+        csv_part = MIMEApplication(attachment.getvalue().encode('utf-8'), 'csv')
+        filename = f'{kind}-{time.strftime("%Y%m%d-%H%M%S")}.csv'
+        csv_part.add_header('Content-Disposition', 'attachment', filename=filename)
+        msg.attach(csv_part)
+        return msg, count
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                now = time.time()
+                due = [kind for kind, oldest in self.oldest.items() if now - oldest >= self.max_age]
+                if not due:
+                    wait = min((oldest + self.max_age - now for oldest in self.oldest.values()), default=None)
+                    self.condition.wait(wait)
+                    continue
+            for kind in due:
+                self.flush(kind)
@@ -0,0 +1,185 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from decouple import config
+
+import metrics
+import resources
+
+logger = logging.getLogger(__name__)
+
+
+class MailDispatcher:
+    """
+    Delivers emails in the background so handlers only have to enqueue them.
+    Every message is first written to an on-disk outbox, so nothing is lost on a crash;
+    a single worker thread drains the outbox in batches over one reused SMTP connection
+    and retries failed messages with exponential backoff.
+    """
+    def __init__(self, outbox_dir=None, host=None, port=None, starttls=None, batch_size=20,
+                 max_attempts=8, base_delay=2.0, max_delay=600.0, idle_timeout=60.0):
+        self.outbox_dir = outbox_dir or resources.path(config('MAIL_OUTBOX_DIR', default='settings/outbox'))
+        self.failed_dir = os.path.join(self.outbox_dir, 'failed')
+        self.host = host or config('SMTP_HOST', default='smtp.gmail.com')
+        self.port = port or config('SMTP_PORT', default=587, cast=int)
+        self.starttls = starttls if starttls is not None else config('SMTP_STARTTLS', default=True, cast=bool)
+        self.sender = config('GMAIL_USER', default='')
+        self.password = config('GMAIL_KEY_PYTHON', default='')
+        self.recipient = config('MAILRU_USER', default='MAILRU_USER')
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+        self.connection = None
+        self.last_used = 0.0
+        self.pending = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        os.makedirs(self.failed_dir, exist_ok=True)
+        self.recover()
+        self.thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+        self.thread.start()
+
+    def recover(self):
+        """
+        Re-queues messages left in the outbox by a previous run.
+        """
+        for name in sorted(os.listdir(self.outbox_dir)):
+            if name.endswith('.json'):
+                self.pending.append(os.path.join(self.outbox_dir, name))
+
+    def enqueue(self, msg):
+        """
+        Stores a prepared email message in the outbox and wakes up the worker.
+        """
+        if msg['From'] is None:
+            msg['From'] = self.sender
+        if msg['To'] is None:
+            msg['To'] = self.recipient
+        entry = {'recipient': self.recipient, 'message': msg.as_string(), 'attempts': 0, 'next_attempt': 0}
+        path = os.path.join(self.outbox_dir, f'{time.time_ns()}-{next(self.counter)}.json')
+        try:
+            self._write(path, entry)
+        except OSError as e:
+            logger.error('Unable to store email in outbox: %s', e)
+            return False
+        with self.condition:
+            self.pending.append(path)
+            self.condition.notify()
+        return True
+
+    def queue_depth(self):
+        """
+        Returns the number of messages waiting in the outbox.
+        """
+        with self.condition:
+            return len(self.pending)
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker after the current batch; undelivered messages stay in the outbox.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    @staticmethod
+    def _write(path, entry):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(entry, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def _connect(self):
+        import smtplib
+        if self.connection is not None and time.monotonic() - self.last_used < self.idle_timeout:
+            return self.connection
+        self._disconnect()
+        connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            connection.starttls()
+        if self.sender and self.password:
+            connection.login(self.sender, self.password)
+        self.connection = connection
+        return connection
+
+    def _disconnect(self):
+        if self.connection is not None:
+            import smtplib
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def _next_batch(self):
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait(self.idle_timeout)
+                if not self.pending:
+                    self._disconnect()
+            if not self.running:
+                return []
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            return batch
+
+    def _deliver(self, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+        if entry['next_attempt'] > time.time():
+            return entry['next_attempt']
+        import smtplib
+        try:
+            start = time.perf_counter()
+            self._connect().sendmail(self.sender, entry['recipient'], entry['message'].encode('utf-8'))
+            metrics.smtp_seconds.observe(time.perf_counter() - start)
+            self.last_used = time.monotonic()
+        except (smtplib.SMTPException, OSError) as e:
+            metrics.smtp_errors.inc()
+            self._disconnect()
+            entry['attempts'] += 1
+            if entry['attempts'] >= self.max_attempts:
+                logger.error('Giving up on email %s: %s', os.path.basename(path), e)
+                os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+                return None
+            delay = min(self.base_delay * 2 ** (entry['attempts'] - 1), self.max_delay)
+            entry['next_attempt'] = time.time() + delay
+            self._write(path, entry)
+            logger.warning('Email %s failed (%s), retrying in %.0fs', os.path.basename(path), e, delay)
+            return entry['next_attempt']
+        os.remove(path)
+        return None
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                self._disconnect()
+                return
+            retry_at = []
+            for path in batch:
+                try:
+                    next_attempt = self._deliver(path)
+                except (OSError, ValueError) as e:
+                    logger.error('Skipping unreadable outbox entry %s: %s', path, e)
+                    if os.path.exists(path):
+                        os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+                    continue
+                if next_attempt is not None:
+                    retry_at.append(next_attempt)
+            if retry_at:
+                with self.condition:
+                    self.pending[:0] = [path for path in batch if os.path.exists(path)]
+                    wait = min(retry_at) - time.time()
+                    if self.running and wait > 0:
+                        self.condition.wait(wait)
@@ -0,0 +1,216 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from decouple import config
+
+import metrics
+from analytics import QuizAnalytics
+from content import ContentStore
+from digest import DigestAggregator
+from mailer import MailDispatcher
+from markups import markups
+from profiling import HandlerProfiler
+from resources import startup
+from result_cards import ResultCards
+from routing import Router
+from service import choice
+from sessions import SessionManager
+from sharing import SharingIndex
+from storage import SessionStore
+
+import views
+from views import callback_commands, message_commands, prefix_commands
+
+logger = logging.getLogger(__name__)
+
+
+class LogoFileNotFoundException(Exception):
+    pass
+
+
+class BaseBotManager:
+    """
+    The part of a bot manager both runtimes share. What a handler answers is decided by `views` and `Quiz`;
+    a runtime subclass only sends it, through `send_reply` and its own handlers for media, and wraps
+    handlers in `dispatcher`. Handlers defined here return the runtime's `send_reply` result, so the async
+    runtime awaits them like its own coroutines.
+    """
+    def setup_components(self, api, scheduler_class, media_class, quiz_class):
+        """
+        Sets up the shared content store, the persistent per-chat session store, the delayed-action
+        scheduler and the media file_id cache sending through `api`, the result cards and their sharing
+        index, the mail dispatcher with its digest batching, the quiz analytics, the runtime-toggled handler
+        profiler, the quiz object and its pre-encoded answer keyboards, and configures the handlers and the
+        gauges of the metrics endpoint.
+        """
+        with startup.phase('content store'):
+            self.content = ContentStore()
+            self.content.start_watching()
+        with startup.phase('session store'):
+            self.store = SessionStore()
+            self.sessions = SessionManager(store=self.store)
+        with startup.phase('scheduler, media cache and result cards'):
+            self.scheduler = scheduler_class(api)
+            self.media = media_class(api)
+            self.cards = ResultCards(self.content, self.media)
+            self.sharing = SharingIndex(self.cards, sorted(set(choice.values())))
+            self.sharing.start_warming()
+        with startup.phase('mail dispatcher and digest'):
+            self.mailer = MailDispatcher()
+            self.digest = DigestAggregator(self.mailer)
+        with startup.phase('quiz, analytics, routing and metrics'):
+            self.analytics = QuizAnalytics(choice.values(), len(self.content.questions))
+            self.analytics.start_snapshots()
+            self.profiler = HandlerProfiler(lambda: len(self.sessions))
+            self.profiler.install_signal()
+            self.admins = {int(chat_id) for chat_id in config('ADMIN_CHAT_IDS', default='').split(',')
+                           if chat_id.strip()}
+            self.quiz = quiz_class(api, self.sessions, self.scheduler, self.media, self.content,
+                                   self.analytics)
+            markups.warm(self.quiz.questions)
+            self.setup_handlers()
+            self.register_metrics()
+
+    def register_metrics(self, registry=metrics.registry):
+        """
+        Exposes queue depths, active sessions and cache counters as gauges read at scrape time.
+        """
+        registry.gauge('zoobot_sessions_active', 'Quiz sessions held in memory.', lambda: len(self.sessions))
+        registry.gauge('zoobot_scheduler_pending', 'Delayed actions waiting to run.', self.scheduler.pending)
+        registry.gauge('zoobot_mail_queue_depth', 'Emails waiting in the outbox.', self.mailer.queue_depth)
+        registry.gauge('zoobot_digest_pending', 'Consents and feedback waiting for their digest.', self.digest.pending)
+        registry.gauge('zoobot_media_cache_hits', 'Media sent by cached file_id.', lambda: self.media.hits)
+        registry.gauge('zoobot_media_cache_misses', 'Media uploaded from disk.', lambda: self.media.misses)
+        registry.gauge('zoobot_profiling_enabled', 'Whether handler profiling is switched on.',
+                       lambda: int(self.profiler.enabled))
+
+    def setup_handlers(self):
+        """
+        Compiles the routing tables and registers one message handler and one callback handler,
+        which look the handler up in the tables instead of testing predicates one by one,
+        and the inline query handler used for sharing results.
+        """
+        self.router = Router(self, message_commands, prefix_commands, callback_commands,
+                             default='send_default_response', answer_handler=self.quiz.process_answer)
+        self.bot.message_handler(func=lambda message: True)(self.dispatcher(self.router.route_message))
+        self.bot.callback_query_handler(func=lambda call: True)(self.dispatcher(self.router.route_callback))
+        self.bot.inline_handler(func=lambda query: True)(
+            self.dispatcher(lambda inline_query: (self.answer_inline_query, (inline_query,))))
+
+    @contextmanager
+    def observed(self, name):
+        """
+        Times the enclosed handler call for the metrics endpoint, profiling it while profiling is on.
+        """
+        start = time.perf_counter()
+        try:
+            if self.profiler.enabled:
+                with self.profiler.sample(name):
+                    yield
+            else:
+                yield
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - start, name)
+
+    def schedule_deletions(self, message, reply, answer):
+        """
+        Schedules the deletion of the user's message and of the answer, as far as the reply asks for it.
+        """
+        if reply.delete_request_after is not None:
+            self.scheduler.delete_message_later(reply.delete_request_after, message.chat.id, message.message_id)
+        if reply.delete_after is not None:
+            self.scheduler.delete_message_later(reply.delete_after, message.chat.id, answer.message_id)
+
+    @staticmethod
+    def reply_kwargs(reply):
+        """
+        Returns the keyword arguments of the Bot API call sending a reply.
+        """
+        kwargs = {}
+        if reply.markup is not None:
+            kwargs['reply_markup'] = markups.get(reply.markup)
+        if reply.parse_mode is not None:
+            kwargs['parse_mode'] = reply.parse_mode
+        return kwargs
+
+    def shutdown(self):
+        """
+        Stops the message scheduler and the runtime's sending, mails the open digests, writes the last
+        analytics snapshot and stops the mail worker and the session store writer.
+        Undelivered emails stay in the outbox for the next run.
+        """
+        self.scheduler.stop()
+        self.stop_sending()
+        self.profiler.disable()
+        self.analytics.stop()
+        self.digest.stop()
+        self.mailer.stop()
+        self.store.close()
+
+    def stop_sending(self):
+        """
+        Stops the runtime's outbound queue, if it has one.
+        """
+
+    def send_greeting_with_buttons(self, message):
+        """
+        Sends a greeting message along with interactive buttons for further navigation.
+        """
+        return self.send_reply(message, views.greeting_reply(message))
+
+    def send_help_message(self, message):
+        """
+        Sends a help message containing instructions or information about the bot's functionality.
+        """
+        return self.send_reply(message, views.help_reply)
+
+    def send_contacts(self, message):
+        """
+        Sends contact information for the organization or service.
+        """
+        return self.send_reply(message, views.contacts_reply)
+
+    def send_info_message(self, message):
+        """
+        Sends information about the organization or service, including a link to the website.
+        """
+        return self.send_reply(message, views.info_reply)
+
+    def send_become_guardian_info(self, message):
+        """
+        Provides information about becoming a zoo guardian, including a link to learn more.
+        """
+        return self.send_reply(message, views.guardian_info_reply)
+
+    def become_a_guardian(self, message):
+        """
+        Provides information about becoming a zoo guardian.
+        """
+        return self.send_reply(message, views.become_guardian_reply)
+
+    def some_serious(self, message):
+        """
+        Sends a message with serious content.
+        """
+        return self.send_reply(message, views.serious_reply)
+
+    def send_default_response(self, message):
+        """
+        Sends a default response when no specific action matches the input.
+        """
+        return self.send_reply(message, views.default_reply)
+
+    def send_start_quiz_message(self, message):
+        """
+        Starts the quiz for the user.
+        """
+        return self.quiz.start_quiz(message.chat.id)
+
+    def profile_action(self, message):
+        """
+        Returns the action of a `/profile` command, or None if the chat is not listed in ADMIN_CHAT_IDS.
+        """
+        if message.chat.id not in self.admins:
+            return None
+        return message.text[len('/profile'):].strip().lower()
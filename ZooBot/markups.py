@@ -0,0 +1,77 @@
+import views
+from routing import encode_answer
+
+# keyboards whose content never changes, by name
+STATIC_MARKUPS = {
+    'greeting': views.greeting_markup,
+    'start_menu': views.start_menu_markup,
+    'info': views.info_markup,
+    'guardian': views.guardian_markup,
+    'continue': views.continue_markup,
+    'result': views.result_keyboard,
+    'shared_result': views.shared_result_markup,
+}
+
+NONCE_SLOT = '\x00'
+
+
+def answer_template(answers, question_index):
+    """
+    Serializes the answer keyboard of a question once, split around the nonce of its buttons,
+    so a session's keyboard is the parts joined with its nonce.
+    """
+    markup = views.answer_markup(answers, question_index, 0)
+    data = markup.to_json()
+    for answer_num in range(1, len(answers) + 1):
+        placeholder = encode_answer(question_index, answer_num, 0)
+        data = data.replace(f'"{placeholder}"', f'"{placeholder[:-4]}{NONCE_SLOT}"')
+    return tuple(data.split(NONCE_SLOT))
+
+
+class MarkupRegistry:
+    """
+    Reply keyboards serialized to JSON once and reused for every send. The Bot API client passes a string
+    reply_markup through as is, so a cached keyboard costs neither building the markup objects nor encoding them.
+    Static keyboards are encoded at startup, answer keyboards once per question (with a slot for the session
+    nonce) and result keyboards once per animal.
+    """
+    def __init__(self):
+        self.static = {name: build().to_json() for name, build in STATIC_MARKUPS.items()}
+        self.answers = {}
+        self.results = {}
+
+    def get(self, name):
+        """
+        Returns the encoded static keyboard of a name in STATIC_MARKUPS.
+        """
+        return self.static[name]
+
+    def answer(self, answers, question_index, nonce):
+        """
+        Returns the encoded answer keyboard of a question for a session nonce.
+        The template is rebuilt when the question's answers change after a content reload.
+        """
+        entry = self.answers.get(question_index)
+        if entry is None or entry[0] is not answers:
+            entry = self.answers[question_index] = (answers, answer_template(answers, question_index))
+        return f'{nonce:04x}'.join(entry[1])
+
+    def warm(self, questions):
+        """
+        Encodes the answer keyboards of all questions ahead of the first quiz.
+        """
+        for question_index, question in enumerate(questions):
+            self.answer(question.answers, question_index, 0)
+
+    def result(self, website_url, animal=None):
+        """
+        Returns the encoded keyboard of final steps for an animal.
+        """
+        key = (website_url, animal)
+        markup = self.results.get(key)
+        if markup is None:
+            markup = self.results[key] = views.results_markup(website_url, animal).to_json()
+        return markup
+
+
+markups = MarkupRegistry()
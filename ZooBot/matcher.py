@@ -0,0 +1,90 @@
+import math
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# distances are rounded before comparison so ties resolve the same way with and without NumPy
+PRECISION = 9
+
+
+def _l1(diff, weights):
+    return sum(abs(d) for d in diff)
+
+
+def _weighted_l1(diff, weights):
+    return sum(w * abs(d) for d, w in zip(diff, weights))
+
+
+def _l2(diff, weights):
+    return math.sqrt(sum(d * d for d in diff))
+
+
+METRICS = {
+    'l1': _l1,
+    'weighted_l1': _weighted_l1,
+    'l2': _l2,
+}
+
+
+class TotemMatcher:
+    """
+    Finds the nearest totem animal for trait vectors.
+    The trait table is kept as a matrix so many users can be scored in one call;
+    ties are broken deterministically in favour of the animal listed first in the catalogue.
+    """
+    def __init__(self, choices, metric='l1', weights=None, cache_size=4096):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(METRICS)}.")
+        self.metric = metric
+        self.names = tuple(choices.values())
+        self.traits = tuple(tuple(float(value) for value in params) for params in choices)
+        self.dimensions = len(self.traits[0]) if self.traits else 0
+        if weights and len(weights) != self.dimensions:
+            raise ValueError(f'Expected {self.dimensions} trait weights, got {len(weights)}.')
+        self.weights = tuple(float(w) for w in weights) if weights else (1.0,) * self.dimensions
+        if np is not None:
+            self.matrix = np.array(self.traits, dtype=np.float64)
+            self.weight_vector = np.array(self.weights, dtype=np.float64)
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def trait_vector(self, answers):
+        """
+        Averages the answer ranks pairwise (first half with second half) into a trait vector.
+        Raises ValueError unless there are exactly two answers per trait, so an unfinished quiz has no result.
+        """
+        if len(answers) != 2 * self.dimensions:
+            raise ValueError(f'Expected {2 * self.dimensions} answers, got {len(answers)}.')
+        half = self.dimensions
+        return tuple(round((answers[i] + answers[i + half]) / 2, 1) for i in range(half))
+
+    def distances(self, vector):
+        """
+        Returns the distance from a trait vector to every animal, in catalogue order.
+        """
+        function = METRICS[self.metric]
+        return [round(function([v - p for v, p in zip(vector, params)], self.weights), PRECISION)
+                for params in self.traits]
+
+    def _match(self, vector):
+        distances = self.distances(vector)
+        return self.names[distances.index(min(distances))]
+
+    def match_many(self, vectors):
+        """
+        Matches a batch of trait vectors at once and returns the animal names in the same order.
+        """
+        if not vectors:
+            return []
+        if np is None:
+            return [self.match(tuple(vector)) for vector in vectors]
+        diff = np.asarray(vectors, dtype=np.float64)[:, None, :] - self.matrix[None, :, :]
+        if self.metric == 'l1':
+            distances = np.abs(diff).sum(axis=2)
+        elif self.metric == 'weighted_l1':
+            distances = (np.abs(diff) * self.weight_vector).sum(axis=2)
+        else:
+            distances = np.sqrt((diff * diff).sum(axis=2))
+        return [self.names[i] for i in distances.round(PRECISION).argmin(axis=1)]
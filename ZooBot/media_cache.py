@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from decouple import config
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+import resources
+
+logger = logging.getLogger(__name__)
+
+# descriptions of the Bot API errors that mean a file_id is no longer usable
+FILE_ID_ERRORS = ('file identifier', 'file_id', 'file reference', 'remote file')
+
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def is_file_id_error(error):
+    """
+    Tells whether a Bot API error rejects the file_id that was sent, as opposed to the request as a whole
+    (a message that cannot be edited, a chat that blocked the bot, flood limits).
+    """
+    description = (error.description or '').lower()
+    return error.error_code == 400 and any(marker in description for marker in FILE_ID_ERRORS)
+
+
+class MediaCache:
+    """
+    Remembers the Telegram file_id of every uploaded asset so it is uploaded only once.
+    Entries are keyed by asset path and content hash and persisted to a JSON file,
+    so they survive restarts and are replaced as soon as the asset file changes.
+    An asset sent both as a photo and as a document has one file_id per kind.
+    """
+    def __init__(self, bot, cache_path=None):
+        self.bot = bot
+        self.cache_path = cache_path or resources.path(config('MEDIA_CACHE_FILE', default='settings/media_cache.json'))
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+        self.entries = self.load()
+
+    def load(self):
+        """
+        Reads cached file_ids from disk, dropping entries whose asset no longer exists.
+        Entries written before file_ids were kept per kind are read as photos.
+        """
+        if not os.path.isfile(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Media cache '%s' is unreadable: %s", self.cache_path, e)
+            return {}
+        for entry in entries.values():
+            if 'file_id' in entry:
+                entry['photo'] = entry.pop('file_id')
+        return {path: entry for path, entry in entries.items() if os.path.isfile(path)}
+
+    def save(self):
+        """
+        Atomically writes the cached file_ids to disk. Each save writes its own temporary file,
+        so concurrent saves of this process and of other processes sharing the file never mix.
+        """
+        with self.lock:
+            data = json.dumps(self.entries, ensure_ascii=False, indent=1)
+            directory, name = os.path.split(os.path.abspath(self.cache_path))
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    file.write(data)
+                os.replace(tmp_path, self.cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def digest(self, path):
+        """
+        Returns the content hash of an asset, re-hashing only when its size or mtime changes.
+        """
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self.digests.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(65536), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.digests[path] = (signature, digest)
+        return digest
+
+    def file_id(self, path, kind='photo'):
+        """
+        Returns the cached file_id of an asset sent as `kind` ('photo' or 'document'),
+        or None if it is unknown or the file has changed.
+        """
+        digest = self.digest(path)
+        entry = self.entries.get(path)
+        if entry and entry['hash'] == digest:
+            return entry.get(kind)
+        return None
+
+    def cached_file_id(self, path, kind='photo'):
+        """
+        Returns the cached file_id of an asset without checking the file, for assets whose path
+        changes with their content.
+        """
+        entry = self.entries.get(path)
+        return entry.get(kind) if entry else None
+
+    def remember(self, path, file_id, kind='photo'):
+        """
+        Stores the file_id Telegram assigned to an asset sent as `kind`.
+        """
+        digest = self.digest(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if not entry or entry['hash'] != digest:
+                entry = self.entries[path] = {'hash': digest}
+            entry[kind] = file_id
+        self.save()
+
+    def send_photo(self, chat_id, path, **kwargs):
+        """
+        Sends an asset as a photo, by file_id when it was uploaded before.
+        """
+        return self._send(self.bot.send_photo, lambda message: message.photo[-1].file_id,
+                          'photo', chat_id, path, kwargs)
+
+    def send_document(self, chat_id, path, **kwargs):
+        """
+        Sends an asset as a document, by file_id when it was uploaded before.
+        """
+        return self._send(self.bot.send_document, lambda message: message.document.file_id,
+                          'document', chat_id, path, kwargs)
+
+    def edit_photo(self, chat_id, message_id, path, caption=None, parse_mode=None, **kwargs):
+        """
+        Replaces the photo and caption of a message with an asset, by file_id when it was uploaded before.
+        """
+        def edit_media(chat_id, photo, **kwargs):
+            media = types.InputMediaPhoto(photo, caption=caption, parse_mode=parse_mode)
+            return self.bot.edit_message_media(media, chat_id, message_id, **kwargs)
+
+        return self._send(edit_media, lambda message: message.photo[-1].file_id, 'photo', chat_id, path, kwargs)
+
+    def _send(self, method, extract_file_id, kind, chat_id, path, kwargs):
+        file_id = self.file_id(path, kind)
+        if file_id:
+            try:
+                message = method(chat_id, file_id, **kwargs)
+                self.hits += 1
+                return message
+            except ApiTelegramException as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Cached file_id for '%s' rejected, uploading again: %s", path, e)
+        self.misses += 1
+        with open(path, 'rb') as file:
+            message = method(chat_id, file, **kwargs)
+        self.remember(path, extract_file_id(message), kind)
+        return message
+
+
+class AsyncMediaCache(MediaCache):
+    """
+    MediaCache for the async runtime, sending through an AsyncTeleBot.
+    Hashing and reading asset files and saving the cache run in worker threads, off the event loop.
+    """
+    async def send_photo(self, chat_id, path, **kwargs):
+        return await self._send_async(self.bot.send_photo, lambda message: message.photo[-1].file_id,
+                                      'photo', chat_id, path, kwargs)
+
+    async def send_document(self, chat_id, path, **kwargs):
+        return await self._send_async(self.bot.send_document, lambda message: message.document.file_id,
+                                      'document', chat_id, path, kwargs)
+
+    async def edit_photo(self, chat_id, message_id, path, caption=None, parse_mode=None, **kwargs):
+        async def edit_media(chat_id, photo, **kwargs):
+            media = types.InputMediaPhoto(photo, caption=caption, parse_mode=parse_mode)
+            return await self.bot.edit_message_media(media, chat_id, message_id, **kwargs)
+
+        return await self._send_async(edit_media, lambda message: message.photo[-1].file_id,
+                                      'photo', chat_id, path, kwargs)
+
+    async def _send_async(self, method, extract_file_id, kind, chat_id, path, kwargs):
+        # imported here so the threaded runtime does not load aiohttp
+        from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+        file_id = await asyncio.to_thread(self.file_id, path, kind)
+        if file_id:
+            try:
+                message = await method(chat_id, file_id, **kwargs)
+                self.hits += 1
+                return message
+            except AsyncApiTelegramException as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Cached file_id for '%s' rejected, uploading again: %s", path, e)
+        self.misses += 1
+        data = await asyncio.to_thread(read_file, path)
+        message = await method(chat_id, data, **kwargs)
+        await asyncio.to_thread(self.remember, path, extract_file_id(message), kind)
+        return message
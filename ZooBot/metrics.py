@@ -0,0 +1,203 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(label_name, label_value):
+    if label_name is None:
+        return ''
+    return f'{{{label_name}="{escape(label_value)}"}}'
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by the values of one label.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, label_value=None, amount=1):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for label_value, value in values:
+            yield self.name, format_labels(self.label, label_value), value
+
+
+class Gauge:
+    """
+    Value read from a callback when the metrics are scraped, so the hot path pays nothing for it.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def samples(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning('Gauge %s failed: %s', self.name, e)
+            return
+        yield self.name, '', value
+
+
+class Histogram:
+    """
+    Latency histogram with fixed bucket bounds, optionally split by the values of one label.
+    Each series is a list of per-bucket counts plus the sum and count of the observations.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = [(label_value, list(counts), total, count)
+                        for label_value, (counts, total, count) in self.series.items()]
+        for label_value, counts, total, count in snapshot:
+            prefix = '' if self.label is None else f'{self.label}="{escape(label_value)}",'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', f'{{{prefix}le="{le}"}}', cumulative
+            labels = format_labels(self.label, label_value)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    """
+    Holds the metrics of the process and renders them in the Prometheus text format.
+    Registering a name twice returns the existing metric, except for gauges, whose callback is replaced.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None and metric.kind != 'gauge':
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, label=None):
+        return self._register(Counter(name, help_text, label))
+
+    def gauge(self, name, help_text, function):
+        return self._register(Gauge(name, help_text, function))
+
+    def histogram(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, label, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram('zoobot_handler_seconds', 'Time spent in update handlers.', label='handler')
+api_seconds = registry.histogram('zoobot_api_call_seconds', 'Bot API call latency.', label='method')
+api_errors = registry.counter('zoobot_api_errors_total', 'Failed Bot API calls by error code.', label='code')
+smtp_seconds = registry.histogram('zoobot_smtp_send_seconds', 'Time to hand one email to the SMTP server.')
+smtp_errors = registry.counter('zoobot_smtp_errors_total', 'Failed SMTP deliveries.')
+
+
+class MetricsServer:
+    """
+    Serves the registry at /metrics from a background thread.
+    """
+    def __init__(self, registry=registry, host=None, port=None):
+        self.registry = registry
+        self.host = host or config('METRICS_HOST', default='127.0.0.1')
+        self.port = port if port is not None else config('METRICS_PORT', default=9100, cast=int)
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        """
+        Starts serving; does nothing when the port is 0.
+        """
+        if not self.port:
+            return None
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning('Metrics endpoint disabled, cannot listen on %s:%s: %s', self.host, self.port, e)
+            return None
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        logger.info('Serving metrics on http://%s:%s/metrics', self.host, self.server.server_port)
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,290 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from decouple import config
+from telebot.apihelper import ApiTelegramException
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_QUESTION = 0
+PRIORITY_NORMAL = 1
+PRIORITY_CLEANUP = 2
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+    A 429 response blocks the bucket until its retry_after has passed.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """
+        Returns how many seconds to wait before a token is available.
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'args', 'kwargs', 'future', 'key', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, method, args, kwargs, key):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.key = key
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def log_failure(self, future):
+        """
+        Logs the error of a queued edit or delete, whose Future the caller usually does not wait for.
+        """
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning('%s for chat %s failed: %s', self.method, self.chat_id, future.exception())
+
+
+class OutboundGateway:
+    """
+    Sends Bot API requests within Telegram's flood limits.
+    Every request waits for a token from its chat's bucket and from the global bucket; requests ready
+    to go are sent in priority order (question delivery before ordinary replies before cleanup deletes),
+    429 responses are retried after their retry_after, and redundant deletes and edits are merged.
+    Sends whose result the handlers need block until delivered; deletes and edits return a Future,
+    and their failures are logged.
+    """
+    def __init__(self, bot, per_chat_rate=None, per_chat_burst=None, global_rate=None, workers=None,
+                 max_attempts=5):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate or config('OUTBOUND_CHAT_RATE', default=1.0, cast=float)
+        self.per_chat_burst = per_chat_burst or config('OUTBOUND_CHAT_BURST', default=3, cast=int)
+        global_rate = global_rate or config('OUTBOUND_GLOBAL_RATE', default=30.0, cast=float)
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, global_rate, time.monotonic())
+        self.chat_buckets = {}
+        self.ready = []
+        self.delayed = []
+        self.pending_keys = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.last_purge = time.monotonic()
+        workers = workers or config('OUTBOUND_WORKERS', default=8, cast=int)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbound')
+        self.thread = threading.Thread(target=self._run, name='outbound-dispatcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, method, chat_id, *args, priority=PRIORITY_NORMAL, key=None, **kwargs):
+        """
+        Queues `bot.<method>(*args, **kwargs)` for the given chat and returns a Future of its result.
+        Once the gateway is stopped the Future is returned cancelled.
+        """
+        with self.condition:
+            if not self.running:
+                future = Future()
+                future.cancel()
+                return future
+            if key is not None:
+                previous = self.pending_keys.get(key)
+                if previous is not None and not previous.future.done():
+                    if key[0] == 'delete':
+                        return previous.future
+                    previous.future.set_result(None)
+            request = Request(priority, next(self.counter), chat_id, method, args, kwargs, key)
+            if key is not None:
+                request.future.add_done_callback(request.log_failure)
+                self.pending_keys[key] = request
+                if key[0] == 'delete':
+                    edit = self.pending_keys.pop(('edit',) + key[1:], None)
+                    if edit is not None and not edit.future.done():
+                        edit.future.set_result(None)
+            heapq.heappush(self.ready, request)
+            self.condition.notify()
+        return request.future
+
+    def send_message(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        return self.submit('send_message', chat_id, chat_id, text, priority=priority, **kwargs).result()
+
+    def send_photo(self, chat_id, photo, priority=PRIORITY_NORMAL, **kwargs):
+        return self.submit('send_photo', chat_id, chat_id, photo, priority=priority, **kwargs).result()
+
+    def send_document(self, chat_id, document, priority=PRIORITY_NORMAL, **kwargs):
+        return self.submit('send_document', chat_id, chat_id, document, priority=priority, **kwargs).result()
+
+    def reply_to(self, message, text, priority=PRIORITY_NORMAL, **kwargs):
+        return self.submit('reply_to', message.chat.id, message, text, priority=priority, **kwargs).result()
+
+    def answer_inline_query(self, inline_query_id, results, priority=PRIORITY_QUESTION, **kwargs):
+        """
+        Answers an inline query. It belongs to no chat, so only the global limit applies.
+        """
+        return self.submit('answer_inline_query', None, inline_query_id, results, priority=priority,
+                           **kwargs).result()
+
+    def edit_message_text(self, text, chat_id, message_id, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Queues an edit of a message's text; a newer edit of the same message replaces a pending one.
+        """
+        return self.submit('edit_message_text', chat_id, text, chat_id, message_id, priority=priority,
+                           key=('edit', chat_id, message_id), **kwargs)
+
+    def edit_message_caption(self, caption, chat_id, message_id, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Queues an edit of a message's caption; a newer edit of the same message replaces a pending one.
+        """
+        return self.submit('edit_message_caption', chat_id, caption, chat_id, message_id, priority=priority,
+                           key=('edit', chat_id, message_id), **kwargs)
+
+    def edit_message_media(self, media, chat_id, message_id, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Replaces the media of a message. Like sends, it blocks until delivered, as the caller needs the file_id.
+        """
+        return self.submit('edit_message_media', chat_id, media, chat_id, message_id, priority=priority,
+                           **kwargs).result()
+
+    def delete_message(self, chat_id, message_id, priority=PRIORITY_CLEANUP):
+        """
+        Queues a message deletion; repeated deletes of one message are sent once and pending edits are dropped.
+        """
+        return self.submit('delete_message', chat_id, chat_id, message_id, priority=priority,
+                           key=('delete', chat_id, message_id))
+
+    def queue_depth(self):
+        """
+        Returns the number of requests waiting to be sent.
+        """
+        with self.condition:
+            return len(self.ready) + len(self.delayed)
+
+    def stop(self):
+        """
+        Stops the dispatcher and waits for the requests being sent. Requests still queued, including
+        429 retries, are cancelled, so handlers blocked on their result are released.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+        with self.condition:
+            queued = self.ready + [request for _, _, request in self.delayed]
+            self.ready.clear()
+            self.delayed.clear()
+            self.pending_keys.clear()
+        cancelled = sum(request.future.cancel() for request in queued)
+        if cancelled:
+            logger.warning('Cancelled %s Bot API requests still queued at shutdown', cancelled)
+
+    def _bucket(self, chat_id, now):
+        if chat_id is None:
+            return self.global_bucket
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst, now)
+        return bucket
+
+    def _purge_buckets(self, now):
+        idle = self.per_chat_burst / self.per_chat_rate
+        self.chat_buckets = {chat_id: bucket for chat_id, bucket in self.chat_buckets.items()
+                             if now - bucket.updated < idle or now < bucket.blocked_until}
+        self.last_purge = now
+
+    def _next_request(self):
+        """
+        Waits until a request may be sent under both rate limits and returns it, or None when stopped.
+        """
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    heapq.heappush(self.ready, heapq.heappop(self.delayed)[2])
+                if now - self.last_purge > 60:
+                    self._purge_buckets(now)
+                if not self.ready:
+                    self.condition.wait(self.delayed[0][0] - now if self.delayed else None)
+                    continue
+                wait = self.global_bucket.delay(now)
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                request = heapq.heappop(self.ready)
+                if request.future.done():
+                    continue
+                bucket = self._bucket(request.chat_id, now)
+                wait = bucket.delay(now)
+                if wait > 0:
+                    heapq.heappush(self.delayed, (now + wait, request.seq, request))
+                    continue
+                bucket.take()
+                if bucket is not self.global_bucket:
+                    self.global_bucket.take()
+                if request.key is not None and self.pending_keys.get(request.key) is request:
+                    del self.pending_keys[request.key]
+                return request
+        return None
+
+    def _execute(self, request):
+        if request.future.done():
+            return
+        start = time.perf_counter()
+        try:
+            result = getattr(self.bot, request.method)(*request.args, **request.kwargs)
+        except ApiTelegramException as e:
+            metrics.api_seconds.observe(time.perf_counter() - start, request.method)
+            metrics.api_errors.inc(e.error_code)
+            if e.error_code == 429 and request.attempts + 1 < self.max_attempts:
+                self._retry_later(request, e)
+                return
+            request.future.set_exception(e)
+        except Exception as e:
+            metrics.api_errors.inc('network')
+            request.future.set_exception(e)
+        else:
+            metrics.api_seconds.observe(time.perf_counter() - start, request.method)
+            request.future.set_result(result)
+
+    def _retry_later(self, request, error):
+        retry_after = (error.result_json or {}).get('parameters', {}).get('retry_after', 1)
+        logger.warning('Flood limit hit on %s for chat %s, retrying in %ss', request.method, request.chat_id, retry_after)
+        request.attempts += 1
+        with self.condition:
+            now = time.monotonic()
+            self._bucket(request.chat_id, now).blocked_until = now + retry_after
+            heapq.heappush(self.delayed, (now + retry_after, request.seq, request))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            self.executor.submit(self._execute, request)
+
@@ -1,81 +1,219 @@
-import time
+import html
+import logging
+import os
 
-from telebot import types
+from decouple import Csv, config
+from telebot.apihelper import ApiTelegramException
 
-from service import (load_quiz_data, choice, best_matching)
+import resources
+from adaptive import AdaptiveEngine
+from asset_manifest import manifest
+from markups import markups
+from matcher import TotemMatcher
+from outbound import PRIORITY_QUESTION
+from service import choice
 
 from textinfo import result_text, logo_end_photo, logo_start_quiz_photo
 
+logger = logging.getLogger(__name__)
+
+CAPTION_LIMIT = 1024
+
 
 class Quiz:
-    def __init__(self, bot):
+    def __init__(self, bot, sessions, scheduler, media, content, analytics=None):
         """
-        Initializes the Quiz class with the provided Telegram bot instance.
-        Sets up necessary attributes for managing quiz questions, user responses, and results.
+        Initializes the Quiz class with the outbound API gateway, session manager, scheduler, media cache,
+        content store and, optionally, the QuizAnalytics counting starts, answers and results.
+        Per-chat progress, answers and results are kept in the sessions, not in the Quiz itself.
+        QUIZ_START_DELAY and QUIZ_QUESTION_DELAY set the pauses before the first question and before
+        each question's text. QUIZ_MODE=edit runs the quiz in a single message instead (see `show_step`).
+        With QUIZ_ADAPTIVE=true questions are asked in the order an AdaptiveEngine picks, and the quiz ends
+        as soon as the remaining answers can no longer change the result.
         """
-        self.result_tuples = None
-        self.user_responses = []
         self.bot = bot
-        self.questions = self.load_quiz_data()
-        self.current_question_index = 0
-        self.answers = []
-        self.message_id = None
-        self.current_question_text = None
+        self.sessions = sessions
+        self.scheduler = scheduler
+        self.media = media
+        self.content = content
+        self.analytics = analytics
+        self.matcher = TotemMatcher(choice, metric=config('TOTEM_METRIC', default='l1'),
+                                    weights=config('TOTEM_WEIGHTS', default='', cast=Csv(float)))
+        self.start_delay = config('QUIZ_START_DELAY', default=3.0, cast=float)
+        self.question_delay = config('QUIZ_QUESTION_DELAY', default=6.0, cast=float)
+        self.mode = config('QUIZ_MODE', default='messages')
+        self.adaptive = config('QUIZ_ADAPTIVE', default=False, cast=bool)
+        self.adaptive_engine = None
 
-    @staticmethod
-    def create_answer_markup(answers):
+    @property
+    def questions(self):
+        """
+        Returns the currently loaded quiz questions.
+        """
+        return self.content.questions
+
+    @property
+    def engine(self):
+        """
+        Returns the adaptive engine of the currently loaded questions, rebuilding it after a content reload.
+        """
+        questions = self.questions
+        engine = self.adaptive_engine
+        if engine is None or engine.questions is not questions:
+            engine = self.adaptive_engine = AdaptiveEngine(questions, self.matcher)
+        return engine
+
+    def next_question_index(self, session):
+        """
+        Returns the index of the question the adaptive engine asks next, or the number of questions
+        once the result is decided.
+        """
+        engine = self.engine
+        index = engine.next_question(engine.state(session.choices))
+        return len(self.questions) if index is None else index
+
+    def begin(self, session):
         """
-        Creates an inline keyboard markup for displaying answer options.
+        Resets the session for a new attempt and sets its first question.
         """
-        markup = types.InlineKeyboardMarkup(row_width=1)
-        for i, answer in enumerate(answers, start=1):
-            button_text = answer["text"]
-            button_data = f"answer_{i}"
-            button = types.InlineKeyboardButton(button_text, callback_data=button_data)
-            markup.add(button)
-        return markup
+        with session.lock:
+            session.reset()
+            if self.adaptive:
+                session.current_question_index = self.next_question_index(session)
+            self.sessions.save(session)
+        if self.analytics is not None:
+            self.analytics.start()
 
     @staticmethod
-    def create_result_keyboard():
+    def create_answer_markup(answers, question_index, nonce):
         """
-        Creates an inline keyboard for showing results and restarting the quiz.
+        Returns the encoded inline keyboard with the answer options of a question.
         """
-        keyboard = types.InlineKeyboardMarkup()
-        result_button = types.InlineKeyboardButton("View Result", callback_data="show_result")
-        restart_button = types.InlineKeyboardButton("Restart Quiz", callback_data='restart_quiz')
-        keyboard.add(result_button, restart_button)
-        return keyboard
+        return markups.answer(answers, question_index, nonce)
 
     @staticmethod
-    def load_quiz_data():
+    def create_result_keyboard():
         """
-        Loads quiz data from a file.
+        Returns the encoded inline keyboard for showing results and restarting the quiz.
         """
-        file_name = 'Questions'
-        return load_quiz_data(file_name)
+        return markups.get('result')
 
-    def calculate_results(self):
+    def calculate_results(self, chat_id):
         """
-        Calculates the final result based on user answers.
+        Calculates the final result based on the chat's answers.
+        Raises ValueError while the quiz is unfinished, e.g. for a result button of an earlier attempt.
         """
-        first_ranks = self.answers[:5]
-        last_ranks = self.answers[5:]
-        self.result_tuples = [round((first_ranks[i] + last_ranks[i]) / 2, 1) for i in range(5)]
-        print(self.result_tuples)
-        chosen_animal = best_matching(self.result_tuples, choice)
+        session = self.sessions.get(chat_id)
+        if self.adaptive:
+            state = self.engine.state(session.choices)
+            if self.engine.decide(state) is None:
+                raise ValueError('The quiz is not finished yet.')
+            session.result_tuples = self.engine.estimate(state)
+        else:
+            session.result_tuples = self.matcher.trait_vector(session.answers)
+        logger.debug('Chat %s traits: %s', chat_id, session.result_tuples)
+        chosen_animal = self.matcher.match(session.result_tuples)
+        session.result_animal = chosen_animal
+        if self.analytics is not None:
+            self.analytics.result(chosen_animal)
+        if self.sessions.store is not None:
+            self.sessions.store.save_result(session)
         return chosen_animal
 
-    def collection_of_information(self, user_id, full_name):
+    def result_data(self, session, cards):
+        """
+        Returns the animal data of a session's result, working the result out and saving it on first use.
+        Raises ValueError while the quiz is unfinished.
+        """
+        if not session.totem_animal_data:
+            session.result_animal = self.calculate_results(session.chat_id)
+            logger.debug('Chat %s animal determined: %s', session.chat_id, session.result_animal)
+            session.totem_animal_data = cards.animal_data(session.result_animal)
+            self.sessions.save(session)
+        return session.totem_animal_data
+
+    def user_responses(self, session):
+        """
+        Renders the answered questions of a session as readable lines.
+        """
+        responses = []
+        for index, answer_num in enumerate(session.choices):
+            if not answer_num:
+                continue
+            question_data = self.questions[index]
+            selected_answer = question_data.answers[answer_num - 1].text
+            responses.append(f"{question_data.question}\nYour Answer: {selected_answer}")
+        return responses
+
+    def collection_of_information(self, session, user_id, full_name):
         """
         Collects user information and quiz results for potential email notifications.
+        Returns None while the chat has not completed the quiz.
         """
+        if session.totem_animal_data is None:
+            return None
         user_info = {
             'user_id': user_id,
             'full_name': full_name,
-            'user_responses': self.user_responses,
-            'results': self.result_tuples,
+            'user_responses': self.user_responses(session),
+            'results': session.result_tuples,
         }
-        return user_info
+        return {**user_info, **session.totem_animal_data}
+
+    def summary_caption(self, session):
+        """
+        Returns the caption of the last step of an edit-mode quiz: the result text followed by
+        the answers given, as many as fit in a photo caption.
+        """
+        caption = result_text
+        lines = ["\n\n<b>Your answers:</b>"]
+        for index, answer_num in enumerate(session.choices, start=1):
+            if not answer_num:
+                continue
+            answer = self.questions[index - 1].answers[answer_num - 1].text
+            lines.append(f"\n{index}. {html.escape(answer)}")
+        for line in lines:
+            if len(caption) + len(line) > CAPTION_LIMIT:
+                break
+            caption += line
+        return caption
+
+    def step_view(self, session):
+        """
+        Returns the image, caption, parse mode and keyboard of the current step of an edit-mode quiz:
+        the current question, or the result prompt once every question is answered.
+        """
+        index = session.current_question_index
+        if index < len(self.questions):
+            question_data = self.questions[index]
+            session.current_question_text = question_data.question
+            markup = self.create_answer_markup(question_data.answers, index, session.nonce)
+            return self.question_image(index), question_data.question, 'Markdown', markup
+        return logo_end_photo, self.summary_caption(session), 'HTML', self.create_result_keyboard()
+
+    def show_step(self, session, previous_image=None):
+        """
+        Edit mode: the quiz is one photo message whose picture, caption and keyboard are replaced at every
+        step, one request per answer instead of an echo, a delete, a photo and a question. The picture is
+        only replaced when it changes. If the message can no longer be edited, a new one is sent.
+        """
+        chat_id = session.chat_id
+        image, caption, parse_mode, markup = self.step_view(session)
+        if session.message_id is not None:
+            try:
+                if image == previous_image:
+                    self.bot.edit_message_caption(caption, chat_id, session.message_id, parse_mode=parse_mode,
+                                                  reply_markup=markup, priority=PRIORITY_QUESTION).result()
+                else:
+                    self.media.edit_photo(chat_id, session.message_id, image, caption=caption,
+                                          parse_mode=parse_mode, reply_markup=markup, priority=PRIORITY_QUESTION)
+                return
+            except ApiTelegramException as e:
+                logger.info('Chat %s quiz message could not be edited, sending a new one: %s', chat_id, e)
+        message = self.media.send_photo(chat_id, image, caption=caption, parse_mode=parse_mode,
+                                        reply_markup=markup, priority=PRIORITY_QUESTION)
+        session.message_id = message.message_id
+        self.sessions.save(session)
 
     def end_quiz(self, chat_id):
         """
@@ -83,59 +221,137 @@ class Quiz:
         """
         result_message = result_text
         logo_end = logo_end_photo
-        with open(logo_end, "rb") as photo:
-            self.bot.send_photo(chat_id, photo, caption=result_message,
-                                reply_markup=self.create_result_keyboard(), parse_mode='HTML')
+        self.media.send_photo(chat_id, logo_end, caption=result_message,
+                              reply_markup=self.create_result_keyboard(), parse_mode='HTML')
 
 
     def start_quiz(self, chat_id):
         """
         Starts the quiz by resetting the question index and answers, then sends the first question.
         """
-        self.current_question_index = 0
-        self.answers = []
+        session = self.sessions.get(chat_id)
+        self.begin(session)
+        if self.mode == 'edit':
+            self.show_step(session)
+            return
         logo_start_quiz = logo_start_quiz_photo
-        with open(logo_start_quiz, "rb") as photo:
-            self.bot.send_photo(chat_id, photo)
-            time.sleep(3)
-        self.send_question(chat_id)
+        self.media.send_photo(chat_id, logo_start_quiz)
+        self.scheduler.call_later(self.start_delay, self.send_question, chat_id)
 
 
 
+    @staticmethod
+    def question_image(question_index):
+        """
+        Returns the path of the picture shown before a question, or the generic quiz picture
+        for questions that have none of their own.
+        """
+        path = resources.path(f'assets/Eng/logo_quiz_{question_index + 1}.jpg')
+        if not os.path.isfile(path):
+            path = resources.path('assets/Eng/logo_quiz.jpg')
+        return manifest.resolve(path)
+
     def send_question(self, chat_id):
         """
-        Sends the next question in the quiz sequence.
-        """
-        if self.current_question_index < len(self.questions):
-            image_number = self.current_question_index + 1
-            image_path = f'assets/Eng/logo_quiz_{image_number}.jpg'
-            with open(image_path, 'rb') as image_file:
-                self.bot.send_photo(chat_id, image_file)
-                time.sleep(6)
-            question_data = self.questions[self.current_question_index]
-            self.current_question_text = question_data['question']
-            markup = self.create_answer_markup(question_data["answers"])
-            message = self.bot.send_message(chat_id, self.current_question_text,
-                                           reply_markup=markup, parse_mode='Markdown')
-            self.message_id = message.message_id
+        Sends the next question in the quiz sequence: the question image first,
+        then the question text with answer buttons a few seconds later.
+        """
+        session = self.sessions.get(chat_id)
+        if session.current_question_index < len(self.questions):
+            image_path = self.question_image(session.current_question_index)
+            self.media.send_photo(chat_id, image_path, priority=PRIORITY_QUESTION)
+            self.scheduler.call_later(self.question_delay, self.send_question_text, chat_id,
+                                      session.current_question_index)
         else:
             self.end_quiz(chat_id)
 
+    def send_question_text(self, chat_id, question_index):
+        """
+        Sends the question text with answer buttons, unless the quiz has moved on or restarted meanwhile.
+        """
+        session = self.sessions.get(chat_id)
+        if session.current_question_index != question_index or session.message_id is not None:
+            return
+        question_data = self.questions[question_index]
+        session.current_question_text = question_data.question
+        markup = self.create_answer_markup(question_data.answers, question_index, session.nonce)
+        message = self.bot.send_message(chat_id, session.current_question_text, priority=PRIORITY_QUESTION,
+                                       reply_markup=markup, parse_mode='Markdown')
+        with session.lock:
+            if session.current_question_index == question_index:
+                # a quick answer may already have been processed while the send was in flight
+                session.message_id = message.message_id
+                self.sessions.save(session)
+
 
 
-    def process_answer(self, chat_id, answer_num):
+    def record_answer(self, session, answer_num):
+        """
+        Stores the answer to the current question in the session and moves on to the next question.
+        Returns the "Your Answer" echo text, or None if there is no question to answer.
+        Adaptive sessions keep answers by question index, with 0 for the questions skipped.
+        """
+        if session.current_question_index >= len(self.questions):
+            return None
+        index = session.current_question_index
+        question_data = self.questions[index]
+        if not 1 <= answer_num <= len(question_data.answers):
+            return None
+        rank = question_data.answers[answer_num - 1].rank
+        if self.adaptive:
+            missing = len(self.questions) - len(session.choices)
+            if missing > 0:
+                session.answers.extend([0.0] * missing)
+                session.choices.extend([0] * missing)
+            session.answers[index] = rank
+            session.choices[index] = answer_num
+            session.current_question_index = self.next_question_index(session)
+        else:
+            session.answers.append(rank)
+            session.choices.append(answer_num)
+            session.current_question_index += 1
+        logger.debug('Chat %s answered question %s: rank %s', session.chat_id, index + 1, rank)
+        if self.analytics is not None:
+            step = sum(1 for choice_num in session.choices if choice_num) if self.adaptive else len(session.choices)
+            self.analytics.answer(index, answer_num, step)
+        selected_answer = question_data.answers[answer_num - 1].text
+        return f"{question_data.question}\nYour Answer: {selected_answer}"
+
+    @staticmethod
+    def is_stale(session, question_index, nonce):
+        """
+        Tells whether a button press belongs to another question or to an earlier attempt of the quiz.
+        Presses without a question index come from keyboards sent before answers carried one.
+        """
+        if question_index is None:
+            return False
+        return question_index != session.current_question_index or nonce != session.nonce
+
+    def process_answer(self, chat_id, answer_num, question_index=None, nonce=None):
         """
         Processes the user's answer to a question, updates the answer list, and sends the next question.
+        The question message is edited into the "Your Answer" echo, which replaces sending the echo
+        and deleting the question with a single request. In edit mode the quiz message moves on to the next step.
+        The session lock makes the stale check and recording the answer atomic, so a button pressed twice
+        at once is recorded once.
         """
-        rank = self.questions[self.current_question_index - 1]["answers"][answer_num - 1]["rank"]
-        self.answers.append(rank)
-        self.current_question_index += 1
-        print(f'Answered question {self.current_question_index}: Rank {rank}')
-        selected_answer = self.questions[self.current_question_index - 1]["answers"][answer_num - 1]["text"]
-        response_message = f"{self.current_question_text}\nYour Answer: {selected_answer}"
-        self.user_responses.append(response_message)
-        print(self.user_responses)
-        self.bot.send_message(chat_id, response_message, parse_mode='Markdown')
-        if self.message_id:
-            self.bot.delete_message(chat_id, self.message_id)
+        session = self.sessions.get(chat_id)
+        with session.lock:
+            if self.is_stale(session, question_index, nonce):
+                return
+            previous_image = self.question_image(session.current_question_index)
+            response_message = self.record_answer(session, answer_num)
+            if response_message is None:
+                return
+            message_id = None
+            if self.mode != 'edit':
+                message_id, session.message_id = session.message_id, None
+            self.sessions.save(session)
+        if self.mode == 'edit':
+            self.show_step(session, previous_image)
+            return
+        if message_id:
+            self.bot.edit_message_text(response_message, chat_id, message_id, parse_mode='Markdown')
+        else:
+            self.bot.send_message(chat_id, response_message, parse_mode='Markdown')
         self.send_question(chat_id)
\ No newline at end of file
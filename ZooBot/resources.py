@@ -0,0 +1,139 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def path(relative_path):
+    """
+    Resolves a path of the bot's data files against the bot directory instead of the working directory.
+    """
+    return os.path.normpath(os.path.join(BASE_DIR, relative_path))
+
+
+class LazyResource:
+    """
+    Value built by `loader(*args)` on first use and shared afterwards.
+    """
+    def __init__(self, name, loader, args):
+        self.name = name
+        self.loader = loader
+        self.args = args
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.value = None
+        self.load_seconds = None
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                start = time.perf_counter()
+                self.value = self.loader(*self.args)
+                self.load_seconds = time.perf_counter() - start
+                self.loaded = True
+        return self.value
+
+
+class ResourceRegistry:
+    """
+    Named resources that are loaded on first use instead of at import time, so starting
+    (and restarting) a process only pays for what its first requests actually touch.
+    """
+    def __init__(self):
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, loader, *args):
+        """
+        Registers a resource and returns it; registering a name twice returns the first resource.
+        """
+        with self.lock:
+            resource = self.resources.get(name)
+            if resource is None:
+                resource = self.resources[name] = LazyResource(name, loader, args)
+            return resource
+
+    def get(self, name):
+        return self.resources[name].get()
+
+    def load_all(self):
+        """
+        Loads every registered resource, e.g. to warm a process up before it takes traffic.
+        """
+        with self.lock:
+            resources = list(self.resources.values())
+        for resource in resources:
+            resource.get()
+
+
+class StartupTimer:
+    """
+    Records the wall-clock time of the phases of process startup for the startup profile.
+    """
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+
+registry = ResourceRegistry()
+startup = StartupTimer()
+
+
+def import_times(module, top=15):
+    """
+    Imports a module in a fresh interpreter with `-X importtime` and returns its direct imports
+    as (cumulative microseconds, self microseconds, module name), slowest first, plus its total.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), int(self_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return sorted(children, reverse=True)[:top], int(cumulative_us)
+            children = []
+    return [], 0
+
+
+def startup_report(module, build):
+    """
+    Prints the startup profile of the bot: the slowest imports of `module` as measured by `-X importtime`,
+    the wall-clock time of each startup phase of the object returned by `build()`, and the load time
+    of each deferred resource when it is first used. Returns the built object.
+    """
+    imports, total = import_times(module)
+    print(f'import {module}: {total / 1000:.1f} ms (fresh interpreter)')
+    for cumulative, own, name in imports:
+        print(f'  {cumulative / 1000:8.1f} ms  {own / 1000:7.1f} ms self  {name}')
+    start = time.perf_counter()
+    built = build()
+    print(f'startup: {(time.perf_counter() - start) * 1000:.1f} ms')
+    for name, seconds in startup.phases:
+        print(f'  {seconds * 1000:8.1f} ms  {name}')
+    registry.load_all()
+    print('deferred resources (loaded on first use):')
+    for resource in registry.resources.values():
+        print(f'  {resource.load_seconds * 1000:8.1f} ms  {resource.name}')
+    return built
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import textwrap
+import threading
+
+from decouple import config
+
+import resources
+import views
+from textinfo import logo_photo
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CARD_VERSION = 1
+CARD_SIZE = (1080, 1350)
+PHOTO_HEIGHT = 900
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def render_card(photo_path, name, description, output_path):
+    """
+    Renders a result card: the animal photo on top, its name and description below.
+    Without Pillow the photo itself is used as the card. Runs in a worker process, so it only takes plain values.
+    """
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    if Image is None:
+        shutil.copyfile(photo_path, tmp_path)
+        os.replace(tmp_path, output_path)
+        return output_path
+    from PIL import ImageDraw, ImageFont, ImageOps
+    card = Image.new('RGB', CARD_SIZE, 'white')
+    if photo_path:
+        with Image.open(photo_path) as photo:
+            photo = ImageOps.fit(ImageOps.exif_transpose(photo).convert('RGB'), (CARD_SIZE[0], PHOTO_HEIGHT))
+            card.paste(photo, (0, 0))
+    draw = ImageDraw.Draw(card)
+    title_font = ImageFont.load_default(size=72)
+    text_font = ImageFont.load_default(size=36)
+    draw.text((60, PHOTO_HEIGHT + 40), name, fill='black', font=title_font)
+    y = PHOTO_HEIGHT + 150
+    for line in textwrap.wrap(description, width=52)[:6]:
+        draw.text((60, y), line, fill='#333333', font=text_font)
+        y += 46
+    card.save(tmp_path, 'JPEG', quality=85, optimize=True)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class ResultCards:
+    """
+    Shareable result cards, rendered once per totem animal.
+    A card is named after a hash of its inputs (photo, name, description), so it is rendered again only
+    when one of them changes; rendering runs in a process pool, either all at once with `build`
+    or for a single animal on its first request. Once a card has been uploaded, sending it is
+    a file_id hit in the media cache. Captions are formatted once per content version.
+    """
+    def __init__(self, content, media, cards_dir=None, photos_dir=None, workers=None):
+        self.content = content
+        self.media = media
+        self.cards_dir = cards_dir or resources.path(config('RESULT_CARDS_DIR', default='settings/result_cards'))
+        self.photos_dir = photos_dir or resources.path(config('TOTEM_PHOTOS_DIR', default='settings/totem_animals'))
+        self.workers = workers or config('RESULT_CARD_WORKERS', default=os.cpu_count() or 1, cast=int)
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.paths = {}
+        self.captions = {}
+        self.records = {}
+        self.content_version = None
+        os.makedirs(self.cards_dir, exist_ok=True)
+
+    def _check_version(self):
+        """
+        Forgets the memoised cards and captions when the content store has reloaded.
+        """
+        if self.content.content is not self.content_version:
+            self.content_version = self.content.content
+            self.paths.clear()
+            self.captions.clear()
+            self.records.clear()
+
+    def photo_path(self, animal):
+        """
+        Finds the photo of an animal: the record's image_url if it is a local file, otherwise
+        <photos_dir>/<animal>.<ext> in any letter case, and the zoo logo for animals without a photo.
+        """
+        record = self.content.animal(animal) or {}
+        image = record.get('image_url', '')
+        if image and os.path.isfile(resources.path(image)):
+            return resources.path(image)
+        if os.path.isdir(self.photos_dir):
+            for name in os.listdir(self.photos_dir):
+                stem, extension = os.path.splitext(name)
+                if stem.lower() == animal.lower() and extension.lower() in PHOTO_EXTENSIONS:
+                    return os.path.join(self.photos_dir, name)
+        return logo_photo if os.path.isfile(logo_photo) else None
+
+    def animal_data(self, animal):
+        """
+        Returns the record of an animal, filled in from its name and photo where the record is missing.
+        """
+        if animal is None:
+            return None
+        with self.lock:
+            self._check_version()
+            record = self.records.get(animal)
+        if record is None:
+            record = dict(self.content.animal(animal) or {})
+            record.setdefault('name', animal.replace('_', ' ').title())
+            record.setdefault('description', '')
+            record.setdefault('website_url', views.info_url)
+            if not record.get('image_url') or os.path.isfile(resources.path(record['image_url'])):
+                record['image_url'] = self.photo_path(animal) or ''
+            with self.lock:
+                self.records[animal] = record
+        return record
+
+    def caption(self, animal):
+        """
+        Returns the HTML caption of an animal's result.
+        """
+        with self.lock:
+            self._check_version()
+            caption = self.captions.get(animal)
+        if caption is None:
+            caption = views.animal_caption(self.animal_data(animal))
+            with self.lock:
+                self.captions[animal] = caption
+        return caption
+
+    def job(self, animal):
+        """
+        Returns the render_card arguments of an animal, or None if it has no photo.
+        """
+        photo = self.photo_path(animal)
+        if photo is None:
+            return None
+        record = self.animal_data(animal)
+        key = hashlib.sha256('\0'.join((
+            str(CARD_VERSION), str(Image is not None), self.media.digest(photo), record['name'],
+            record['description'])).encode('utf-8')).hexdigest()[:12]
+        return photo, record['name'], record['description'], os.path.join(self.cards_dir, f'{animal}-{key}.jpg')
+
+    def card_path(self, animal):
+        """
+        Returns the path of an animal's card, rendering it first if needed; None if it cannot be made.
+        Concurrent first requests wait for a single render.
+        """
+        with self.lock:
+            self._check_version()
+            path = self.paths.get(animal)
+        if path is not None:
+            return path
+        with self.render_lock:
+            with self.lock:
+                path = self.paths.get(animal)
+            if path is not None:
+                return path
+            job = self.job(animal)
+            if job is None:
+                logger.warning('No photo for %s, cannot render its result card', animal)
+                return None
+            path = job[-1] if os.path.isfile(job[-1]) else self._render([job])[0]
+            with self.lock:
+                self.paths[animal] = path
+        return path
+
+    def build(self, animals):
+        """
+        Renders the missing cards of the given animals in parallel and returns {animal: path}.
+        """
+        jobs = {animal: self.job(animal) for animal in animals}
+        with self.render_lock:
+            missing = [(animal, job) for animal, job in jobs.items()
+                       if job is not None and not os.path.isfile(job[-1])]
+            for (animal, _), path in zip(missing, self._render([job for _, job in missing])):
+                logger.info('Rendered result card of %s: %s', animal, path)
+        paths = {animal: job[-1] for animal, job in jobs.items() if job is not None}
+        with self.lock:
+            self._check_version()
+            self.paths.update(paths)
+        return paths
+
+    def _render(self, jobs):
+        """
+        Renders cards in a process pool, or in this process where child processes are not allowed.
+        """
+        if not jobs:
+            return []
+        from concurrent.futures.process import BrokenProcessPool, ProcessPoolExecutor
+        if len(jobs) > 1 or self.workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                    return list(pool.map(render_card, *zip(*jobs)))
+            except (AssertionError, OSError, BrokenProcessPool) as e:
+                logger.warning('Rendering result cards in-process: %s', e)
+        return [render_card(*job) for job in jobs]
+
+    def send_card(self, chat_id, animal, **kwargs):
+        """
+        Sends an animal's card as a document, by file_id once it has been uploaded.
+        """
+        path = self.card_path(animal)
+        if path is None:
+            raise FileNotFoundError(f'No result card for {animal}')
+        return self.media.send_document(chat_id, path, **kwargs)
+
+
+if __name__ == '__main__':
+    """
+    Renders the cards of every animal in the catalogue ahead of deployment.
+    """
+    from content import ContentStore
+    from media_cache import MediaCache
+    from service import choice
+
+    parser = argparse.ArgumentParser(description='Render the totem animal result cards')
+    parser.add_argument('--workers', type=int, help='rendering processes')
+    args = parser.parse_args()
+    logging.basicConfig(level='INFO', format='%(levelname)s %(name)s: %(message)s')
+    if Image is None:
+        logger.warning('Pillow is not installed, the animal photos are used as cards')
+    cards = ResultCards(ContentStore(), MediaCache(None), workers=args.workers)
+    built = cards.build(sorted(set(choice.values())))
+    missing = sorted(set(choice.values()) - set(built))
+    print(f'{len(built)} cards in {cards.cards_dir}' + (f'; no photo for {", ".join(missing)}' if missing else ''))
@@ -0,0 +1,66 @@
+ANSWER_PREFIX = 'a'
+LEGACY_ANSWER_PREFIX = 'answer_'
+NONCE_MODULUS = 0x10000
+
+
+def encode_answer(question_index, answer_num, nonce):
+    """
+    Encodes an answer button as fixed-width callback_data: 'a', question (2 hex), answer (1 hex), nonce (4 hex).
+    """
+    return f'{ANSWER_PREFIX}{question_index:02x}{answer_num:x}{nonce:04x}'
+
+
+def decode_answer(data):
+    """
+    Decodes answer callback_data into (question_index, answer_num, nonce), or None if it is not an answer.
+    Buttons from before structured callback_data ('answer_<n>') decode with question and nonce set to None.
+    """
+    if len(data) == 8 and data[0] == ANSWER_PREFIX:
+        try:
+            return int(data[1:3], 16), int(data[3], 16), int(data[4:], 16)
+        except ValueError:
+            pass
+    if data.startswith(LEGACY_ANSWER_PREFIX) and data[len(LEGACY_ANSWER_PREFIX):].isdigit():
+        return None, int(data[len(LEGACY_ANSWER_PREFIX):]), None
+    return None
+
+
+class Router:
+    """
+    Update routing tables compiled once at startup.
+    Text messages are matched first against prefix commands (case-sensitive, longest prefix wins),
+    then against exact commands (case-insensitive); callback_data is looked up in an exact table or
+    decoded as a structured answer. Each route returns (handler, args) for the caller to invoke.
+    """
+    def __init__(self, owner, message_commands, prefix_commands, callback_commands, default, answer_handler):
+        self.message_table = {command.lower(): getattr(owner, name) for command, name in message_commands.items()}
+        self.prefix_table = {prefix: getattr(owner, name) for prefix, name in prefix_commands.items()}
+        self.prefixes = tuple(sorted(self.prefix_table, key=len, reverse=True))
+        self.callback_table = {data: getattr(owner, name) for data, name in callback_commands.items()}
+        self.default = getattr(owner, default)
+        self.answer_handler = answer_handler
+
+    def route_message(self, message):
+        """
+        Returns the handler and arguments for a text message.
+        """
+        text = message.text or ''
+        if self.prefixes and text.startswith(self.prefixes):
+            for prefix in self.prefixes:
+                if text.startswith(prefix):
+                    return self.prefix_table[prefix], (message,)
+        return self.message_table.get(text.lower(), self.default), (message,)
+
+    def route_callback(self, call):
+        """
+        Returns the handler and arguments for a button press, or (None, ()) for unknown callback_data.
+        """
+        data = call.data or ''
+        handler = self.callback_table.get(data)
+        if handler is not None:
+            return handler, (call.message,)
+        answer = decode_answer(data)
+        if answer is not None:
+            question_index, answer_num, nonce = answer
+            return self.answer_handler, (call.message.chat.id, answer_num, question_index, nonce)
+        return None, ()
@@ -0,0 +1,152 @@
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+
+class MessageScheduler:
+    """
+    Runs delayed bot actions ("send after N seconds", "delete after N seconds") without blocking handlers.
+    Pending actions are kept in a heap ordered by due time and watched by a single timer thread;
+    due actions are handed to a small worker pool so a slow API call does not delay the others.
+    """
+    def __init__(self, bot, workers=None):
+        self.bot = bot
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        workers = workers if workers is not None else config('SCHEDULER_WORKERS', default=4, cast=int)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scheduler')
+        self.thread = threading.Thread(target=self._run, name='scheduler-timer', daemon=True)
+        self.thread.start()
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """
+        Schedules `callback(*args, **kwargs)` to run after `delay` seconds.
+        """
+        due = time.monotonic() + delay
+        with self.condition:
+            heapq.heappush(self.queue, (due, next(self.counter), callback, args, kwargs))
+            if self.queue[0][0] == due:
+                self.condition.notify()
+
+    def send_message_later(self, delay, chat_id, text, on_sent=None, **kwargs):
+        """
+        Sends a text message after `delay` seconds; `on_sent` receives the sent message.
+        """
+        self.call_later(delay, self._send_message, chat_id, text, on_sent, kwargs)
+
+    def delete_message_later(self, delay, chat_id, message_id):
+        """
+        Deletes a message after `delay` seconds.
+        """
+        self.call_later(delay, self.bot.delete_message, chat_id, message_id)
+
+    def pending(self):
+        """
+        Returns the number of actions waiting for their due time.
+        """
+        with self.condition:
+            return len(self.queue)
+
+    def stop(self):
+        """
+        Stops the timer thread; actions that are not yet due are dropped.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    def _send_message(self, chat_id, text, on_sent, kwargs):
+        message = self.bot.send_message(chat_id, text, **kwargs)
+        if on_sent:
+            on_sent(message)
+
+    def _execute(self, callback, args, kwargs):
+        try:
+            callback(*args, **kwargs)
+        except Exception as e:
+            logger.exception('Scheduled action %s failed: %s', getattr(callback, '__name__', callback), e)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.queue or self.queue[0][0] > time.monotonic()):
+                    timeout = self.queue[0][0] - time.monotonic() if self.queue else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                _, _, callback, args, kwargs = heapq.heappop(self.queue)
+            self.executor.submit(self._execute, callback, args, kwargs)
+
+
+class AsyncMessageScheduler:
+    """
+    Event-loop counterpart of MessageScheduler for the async runtime.
+    Delayed actions are asyncio timers; coroutine callbacks are run as tasks when they are due.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.handles = set()
+        self.tasks = set()
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """
+        Schedules `callback(*args, **kwargs)` to run after `delay` seconds; must be called from the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        handle = None
+
+        def fire():
+            self.handles.discard(handle)
+            task = loop.create_task(self._execute(callback, args, kwargs))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        handle = loop.call_later(delay, fire)
+        self.handles.add(handle)
+
+    def send_message_later(self, delay, chat_id, text, on_sent=None, **kwargs):
+        """
+        Sends a text message after `delay` seconds; `on_sent` receives the sent message.
+        """
+        self.call_later(delay, self._send_message, chat_id, text, on_sent, kwargs)
+
+    def delete_message_later(self, delay, chat_id, message_id):
+        """
+        Deletes a message after `delay` seconds.
+        """
+        self.call_later(delay, self.bot.delete_message, chat_id, message_id)
+
+    def pending(self):
+        return len(self.handles)
+
+    def stop(self):
+        for handle in self.handles:
+            handle.cancel()
+        self.handles.clear()
+
+    async def _send_message(self, chat_id, text, on_sent, kwargs):
+        message = await self.bot.send_message(chat_id, text, **kwargs)
+        if on_sent:
+            on_sent(message)
+
+    @staticmethod
+    async def _execute(callback, args, kwargs):
+        try:
+            result = callback(*args, **kwargs)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.exception('Scheduled action %s failed: %s', getattr(callback, '__name__', callback), e)
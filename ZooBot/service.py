@@ -1,9 +1,10 @@
-import random
+import logging
 import os
-import smtplib
 
-from decouple import config
-from email.mime.text import MIMEText
+import resources
+from text_variants import TextVariants, engine, parse_variants
+
+logger = logging.getLogger(__name__)
 
 # parameters of totem animals
 # 1 size - small, medium, big
@@ -28,40 +29,22 @@ choice = {
     (3, 1, 2, 1, 1): 'musk_ox'
 }
 
-def best_matching(user_params, choices):
-    """
-    Finds the best matching totem animal based on user parameters.
-    """
-    best_match = None
-    min_difference = float('inf')
-    for params, animal in choices.items():
-        difference = sum(abs(user_param - param) for user_param, param in zip(user_params, params))
-        if difference < min_difference:
-            min_difference = difference
-            best_match = animal
-    return best_match
-
-def get_totem_animal_data(anim_name):
+def read_totem_animal_file(file_path):
     """
-    Retrieves information about a totem animal from a file.
+    Parses a totem animal record ("key: value" lines) from a file.
     """
-    file_path = os.path.join("assets/totem_animals", f"{anim_name.lower()}")
-    if not os.path.isfile(file_path):
-        return f"No data available for totem animal {anim_name}."
     animal_info = {}
     with open(file_path, 'r', encoding='utf-8') as file:
         for line in file:
-            key, value = line.strip().split(": ", 1)
-            animal_info[key] = value
+            if line.strip():
+                key, value = line.strip().split(": ", 1)
+                animal_info[key] = value
     return animal_info
 
-def load_quiz_data(quiz_data):
+def load_quiz_data(file_path):
     """
     Loads quiz data from a file.
     """
-    file_path = os.path.join("assets/quiz-questions", f"{quiz_data.lower()}")
-    if not os.path.isfile(file_path):
-        return f"File {quiz_data} not found."
     questions = []
     with open(file_path, 'r', encoding='utf-8') as file:
         question_data = {}
@@ -91,58 +74,47 @@ def load_quiz_data(quiz_data):
             questions.append(question_data)
     return questions
 
-def send_email(results, subject):
-    """
-    Sends an email with the provided results and subject.
-    """
-    sender = config('GMAIL_USER')
-    password = config('GMAIL_KEY_PYTHON')
-    recipient = 'MAILRU_USER'
-
-    msg = MIMEText(results)
-    msg['Subject'] = subject
-    try:
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:  # connect to SMTP server
-            server.starttls()
-            server.login(sender, password)
-            server.sendmail(sender, recipient, msg.as_string())
-            print('Success!')
-            return True
-    except Exception as e:
-        print(f'{e}\nPlease check your login or password.')
-        return False
-
 
 
 
 class RandomTextGenerator:
-    def __init__(self, file_path):
+    def __init__(self, file_path, engine=engine):
         """
-        Initializes the RandomTextGenerator with the path to a text file.
+        Initializes the RandomTextGenerator with the path to a text file, relative to the bot directory.
+        The file is read on first use, not at import time, into a weighted variant set of the shared engine.
         """
-        self.file_path = file_path
-        self.text_list = self.read_text_from_file()
+        self.file_path = resources.path(file_path)
+        self.engine = engine
+        self.variants = resources.registry.register(f'texts:{file_path}', self.read_text_from_file)
+        self.set_number = engine.add(self.variants)
+
+    @property
+    def text_list(self):
+        return self.variants.get().texts
 
-    def get_random_text(self):
-            if not self.text_list:
-                return f"File '{self.file_path}' is empty."
-            random_text = random.choice(self.text_list)
-            return random_text.strip()
+    def get_random_text(self, chat_id=None):
+        """
+        Returns a random variant; with a chat_id, not one of the variants that chat has seen last.
+        """
+        text = self.engine.draw(self.set_number, chat_id)
+        if text is None:
+            return f"File '{self.file_path}' is empty."
+        return text
 
     def read_text_from_file(self):
         """
-        Reads text from the specified file and returns a list of lines.
+        Reads the text variants from the specified file: one per line, optionally followed by a tab and a weight.
         """
         if not os.path.isfile(self.file_path):
-            print(f"Warning: File '{self.file_path}' does not exist.")
-            return []
+            logger.warning("File '%s' does not exist.", self.file_path)
+            return TextVariants(())
         with open(self.file_path, 'r', encoding='utf-8') as file:
-            text_list = file.readlines()
-        return text_list
+            texts, weights = parse_variants(file)
+        return TextVariants(texts, weights)
 
 
 
 
-greetings_generator1 = RandomTextGenerator('settings/greetings/greet1_list')
-greetings_generator2 = RandomTextGenerator('settings/greetings/greet2_list')
-start_generator = RandomTextGenerator('settings/start_list')
\ No newline at end of file
+greetings_generator1 = RandomTextGenerator('settings/greetings/greet1_list.txt')
+greetings_generator2 = RandomTextGenerator('settings/greetings/greet2_list.txt')
+start_generator = RandomTextGenerator('settings/greetings/start_list.txt')
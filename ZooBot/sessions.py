@@ -0,0 +1,180 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from array import array
+
+from decouple import config
+
+from routing import NONCE_MODULUS
+
+
+class QuizSession:
+    """
+    Per-chat quiz state. Answers are kept as compact arrays instead of lists of Python objects.
+    Handlers of one chat can run in several threads at once; `lock` makes checking and advancing the quiz atomic.
+    """
+    __slots__ = ('chat_id', 'current_question_index', 'answers', 'choices', 'message_id',
+                 'current_question_text', 'result_tuples', 'totem_animal_data', 'result_animal',
+                 'nonce', 'last_seen', 'lock')
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.current_question_index = 0
+        self.answers = array('f')
+        self.choices = array('B')
+        self.message_id = None
+        self.current_question_text = None
+        self.result_tuples = None
+        self.totem_animal_data = None
+        self.result_animal = None
+        self.nonce = 0
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Rebuilds a session from a row saved by the session store.
+        """
+        (chat_id, question_index, answers, choices, message_id, result_tuples, result_animal, animal_data,
+         nonce, _) = row
+        session = cls(chat_id)
+        session.current_question_index = question_index
+        session.answers.frombytes(answers)
+        session.choices.frombytes(choices)
+        session.message_id = message_id
+        session.result_tuples = json.loads(result_tuples) if result_tuples else None
+        session.result_animal = result_animal
+        session.totem_animal_data = json.loads(animal_data) if animal_data else None
+        session.nonce = nonce
+        return session
+
+    def reset(self):
+        """
+        Clears quiz progress and results before a new attempt and draws a new nonce for its answer buttons.
+        """
+        self.current_question_index = 0
+        self.answers = array('f')
+        self.choices = array('B')
+        self.message_id = None
+        self.current_question_text = None
+        self.result_tuples = None
+        self.totem_animal_data = None
+        self.result_animal = None
+        self.nonce = random.randrange(NONCE_MODULUS)
+
+
+class SessionManager:
+    """
+    Stores quiz sessions keyed by chat_id.
+    Sessions are spread over independently locked shards, each kept in least-recently-used order,
+    so idle sessions expire after `ttl` seconds and the total never exceeds `max_sessions`.
+    With a `store`, sessions are persisted on `save` and rehydrated from it when a chat comes back.
+    """
+    def __init__(self, ttl=None, max_sessions=None, shard_count=64, store=None):
+        self.ttl = ttl if ttl is not None else config('SESSION_TTL', default=3600, cast=int)
+        self.max_sessions = max_sessions if max_sessions is not None else \
+            config('SESSION_MAX_COUNT', default=50000, cast=int)
+        self.shard_count = shard_count
+        self.store = store
+        self.shard_capacity = max(1, self.max_sessions // shard_count)
+        self.shards = [{} for _ in range(shard_count)]
+        self.locks = [threading.Lock() for _ in range(shard_count)]
+
+    def get(self, chat_id):
+        """
+        Returns the session for the chat, creating it if needed, and marks it as recently used.
+        """
+        index = hash(chat_id) % self.shard_count
+        shard = self.shards[index]
+        now = time.monotonic()
+        with self.locks[index]:
+            session = shard.pop(chat_id, None)
+            if session is None:
+                session = self._restore(chat_id)
+            session.last_seen = now
+            shard[chat_id] = session
+            self._evict(shard, now)
+        return session
+
+    async def get_async(self, chat_id):
+        """
+        get() for the event loop: a session in memory is returned directly, and one that has to be
+        restored from the store is read in a worker thread so the loop is not blocked on SQLite.
+        """
+        if self.store is None or chat_id in self.shards[hash(chat_id) % self.shard_count]:
+            return self.get(chat_id)
+        return await asyncio.to_thread(self.get, chat_id)
+
+    def save(self, session):
+        """
+        Persists the session's current state, if a store is configured.
+        """
+        if self.store is not None:
+            self.store.save_session(session)
+
+    def _restore(self, chat_id):
+        if self.store is not None:
+            row = self.store.load_session(chat_id)
+            if row is not None:
+                return QuizSession.from_row(row)
+        return QuizSession(chat_id)
+
+    def peek(self, chat_id):
+        """
+        Returns the session for the chat without creating or touching it.
+        """
+        index = hash(chat_id) % self.shard_count
+        with self.locks[index]:
+            return self.shards[index].get(chat_id)
+
+    def discard(self, chat_id):
+        """
+        Removes the session for the chat, if any.
+        """
+        index = hash(chat_id) % self.shard_count
+        with self.locks[index]:
+            return self.shards[index].pop(chat_id, None)
+
+    def retain(self, predicate):
+        """
+        Drops the sessions whose chat_id does not satisfy `predicate` and returns how many were removed.
+        """
+        removed = 0
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                for chat_id in [chat_id for chat_id in shard if not predicate(chat_id)]:
+                    del shard[chat_id]
+                    removed += 1
+        return removed
+
+    def evict_idle(self):
+        """
+        Drops expired sessions from every shard and returns how many were removed.
+        """
+        removed = 0
+        now = time.monotonic()
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                removed += self._evict(shard, now)
+        return removed
+
+    def _evict(self, shard, now):
+        """
+        Removes the oldest sessions of a shard while they are expired or the shard is over capacity.
+        The caller must hold the shard lock.
+        """
+        removed = 0
+        deadline = now - self.ttl
+        while shard:
+            chat_id = next(iter(shard))
+            if len(shard) <= self.shard_capacity and shard[chat_id].last_seen > deadline:
+                break
+            del shard[chat_id]
+            removed += 1
+        return removed
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
@@ -0,0 +1,305 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from decouple import config
+from telebot import apihelper, types
+
+import metrics
+import resources
+from webhook import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+MASK64 = (1 << 64) - 1
+
+
+def update_chat_id(update):
+    """
+    Returns the chat an update belongs to, taken from the raw update JSON.
+    Updates without a chat (inline queries and the like) fall back to the sender, then to the update id.
+    """
+    for kind in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if kind in update:
+            return update[kind]['chat']['id']
+    callback = update.get('callback_query')
+    if callback is not None:
+        message = callback.get('message')
+        if message is not None:
+            return message['chat']['id']
+        return callback['from']['id']
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return update['update_id']
+
+
+def weight(chat_id, shard):
+    """
+    Mixes a chat_id and a shard number into a well-spread 64-bit weight (splitmix64 finalizer).
+    """
+    x = (chat_id * 0x9E3779B97F4A7C15 + (shard + 1) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def owner(chat_id, shards):
+    """
+    Picks the shard of a chat by rendezvous hashing: when a shard leaves or comes back,
+    only the chats owned by that shard move.
+    """
+    return max(shards, key=lambda shard: weight(chat_id, shard))
+
+
+def wait_for_handlers(bot, timeout=30):
+    """
+    Returns once the handlers of the updates passed to the bot so far have finished. Every thread of the
+    bot's pool takes a task that waits at a barrier, which it can only reach after its previous task.
+    """
+    pool = getattr(bot, 'worker_pool', None)
+    if pool is None:
+        return
+    barrier = threading.Barrier(pool.num_threads + 1)
+    for _ in range(pool.num_threads):
+        pool.put(barrier.wait)
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        logger.warning('Handlers still running after %ss, handing over sessions anyway', timeout)
+
+
+def run_worker(token, index, shard_count, updates, acks):
+    """
+    Worker process: a regular BotManager fed with the updates of its chats through `updates`.
+    The global Bot API rate is split between the shards, and each shard gets its own mail outbox
+    and serves its metrics on METRICS_PORT + 1 + index. On a rebalance it drops the sessions of the chats
+    it no longer owns once their handlers are done, commits its buffered writes and confirms on `acks`.
+    """
+    logging.basicConfig(level=config('LOG_LEVEL', default='INFO').upper(),
+                        format=f'%(asctime)s %(levelname)s shard-{index} %(name)s: %(message)s')
+    os.environ['OUTBOUND_GLOBAL_RATE'] = str(config('OUTBOUND_GLOBAL_RATE', default=30.0, cast=float) / shard_count)
+    os.environ['MAIL_OUTBOX_DIR'] = os.path.join(resources.path(config('MAIL_OUTBOX_DIR', default='settings/outbox')),
+                                                 f'shard-{index}')
+    from app import BotManager
+    manager = BotManager(token)
+    metrics_port = config('METRICS_PORT', default=9100, cast=int)
+    metrics.MetricsServer(port=metrics_port + 1 + index if metrics_port else 0).start()
+    try:
+        while True:
+            kind, payload = updates.get()
+            if kind == 'update':
+                manager.bot.process_new_updates([types.Update.de_json(payload)])
+            elif kind == 'rebalance':
+                live, generation = payload
+                wait_for_handlers(manager.bot)
+                removed = manager.sessions.retain(lambda chat_id: owner(chat_id, live) == index)
+                manager.store.flush()
+                acks.put((index, generation))
+                logger.info('Shard %s: handed over %s sessions', index, removed)
+            elif kind == 'stop':
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.shutdown()
+
+
+class ShardedBot:
+    """
+    Sharded deployment: this process receives updates (by long polling or webhook) and forwards each one
+    to one of `shard_count` worker processes, chosen by a hash of its chat_id, so a chat's quiz session
+    always lives on the same worker.
+    Dead workers are detected every `check_interval` seconds: their chats and queued updates move to the
+    remaining workers until a replacement is started, and then the chats move back. Sessions follow
+    through the shared SQLite store: the chats move back only after the other workers have confirmed
+    that their sessions are committed, and updates for them are held until then.
+    """
+    def __init__(self, token, shard_count=None, check_interval=1.0, handover_timeout=30.0):
+        self.token = token
+        self.shard_count = shard_count or config('BOT_WORKERS', default=os.cpu_count() or 1, cast=int)
+        self.check_interval = check_interval
+        self.handover_timeout = handover_timeout
+        self.context = multiprocessing.get_context('spawn')
+        self.acks = self.context.Queue()
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.processes = {}
+        self.live = ()
+        self.joining = None
+        self.backlog = []
+        self.restarts = 0
+        self.running = False
+        self.monitor = None
+
+    def start(self):
+        """
+        Starts the worker processes and the thread that watches them.
+        """
+        self.running = True
+        with self.lock:
+            for index in range(self.shard_count):
+                self._spawn(index)
+            self.live = tuple(range(self.shard_count))
+        self.monitor = threading.Thread(target=self._watch, name='shard-monitor', daemon=True)
+        self.monitor.start()
+        metrics.registry.gauge('zoobot_shards_live', 'Worker processes receiving updates.', lambda: len(self.live))
+        metrics.registry.gauge('zoobot_shard_restarts', 'Worker processes restarted.', lambda: self.restarts)
+        metrics.MetricsServer().start()
+
+    def stop(self, timeout=10):
+        """
+        Asks the workers to finish their queued updates and exit, terminating those that do not.
+        """
+        self.running = False
+        with self.lock:
+            for updates in self.queues.values():
+                updates.put(('stop', None))
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def process_new_updates(self, updates):
+        """
+        Forwards raw updates to the workers owning their chats.
+        """
+        with self.lock:
+            for update in updates:
+                self._route(update)
+
+    def run_polling(self, timeout=20):
+        """
+        Receives updates by long polling and shards them until interrupted.
+        """
+        apihelper.delete_webhook(self.token)
+        self.start()
+        offset = None
+        try:
+            while True:
+                try:
+                    updates = apihelper.get_updates(self.token, offset=offset, timeout=timeout,
+                                                    long_polling_timeout=timeout)
+                except Exception as e:
+                    logger.error('Polling failed: %s', e)
+                    time.sleep(3)
+                    continue
+                if updates:
+                    offset = updates[-1]['update_id'] + 1
+                    self.process_new_updates(updates)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def run_webhook(self):
+        """
+        Registers the webhook with Telegram and shards the updates received by the local HTTP server.
+        """
+        server = WebhookServer(self, parse_updates=False)
+        apihelper.delete_webhook(self.token)
+        apihelper.set_webhook(self.token, url=config('WEBHOOK_URL'), secret_token=server.secret_token or None,
+                              max_connections=server.max_concurrency)
+        self.start()
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _route(self, update):
+        """
+        Queues an update on its chat's worker, or keeps it until a worker is back or, for a chat moving
+        to a restarted worker, until the handover is done. The caller holds the lock.
+        """
+        if not self.live:
+            self.backlog.append(update)
+            return
+        chat_id = update_chat_id(update)
+        if self.joining is not None and owner(chat_id, self.joining) not in self.live:
+            self.backlog.append(update)
+            return
+        self.queues[owner(chat_id, self.live)].put(('update', update))
+
+    def _spawn(self, index):
+        updates = self.context.Queue()
+        process = self.context.Process(target=run_worker,
+                                       args=(self.token, index, self.shard_count, updates, self.acks),
+                                       name=f'zoobot-shard-{index}', daemon=True)
+        process.start()
+        self.queues[index] = updates
+        self.processes[index] = process
+
+    def _watch(self):
+        while self.running:
+            time.sleep(self.check_interval)
+            for index, process in list(self.processes.items()):
+                if self.running and not process.is_alive():
+                    self._replace(index, process.exitcode)
+
+    def _replace(self, index, exitcode):
+        """
+        Moves a dead worker's chats and queued updates to the other workers and starts a replacement.
+        The others drop the sessions of the chats that move back to it and commit their buffered writes;
+        only once they have confirmed does the replacement receive updates, so it never reads a stale session.
+        """
+        logger.warning('Shard %s exited with code %s, restarting', index, exitcode)
+        self.processes.pop(index).join()
+        with self.lock:
+            self.live = tuple(shard for shard in self.live if shard != index)
+            orphaned = self._drain(self.queues.pop(index))
+            for update in orphaned:
+                self._route(update)
+        self.restarts += 1
+        with self.lock:
+            self._spawn(index)
+            others = self.live
+            self.joining = tuple(sorted(others + (index,)))
+            for shard in others:
+                self.queues[shard].put(('rebalance', (self.joining, self.restarts)))
+        self._wait_for_handover(others, self.restarts)
+        with self.lock:
+            self.live, self.joining = self.joining, None
+            backlog, self.backlog = self.backlog, []
+            for update in backlog:
+                self._route(update)
+
+    def _wait_for_handover(self, shards, generation):
+        """
+        Waits until the given workers confirm the rebalance of `generation`, or die, or `handover_timeout` passes.
+        """
+        pending = set(shards)
+        deadline = time.monotonic() + self.handover_timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning('Shards %s did not confirm the handover in time', sorted(pending))
+                return
+            try:
+                shard, confirmed = self.acks.get(timeout=min(remaining, self.check_interval))
+            except queue.Empty:
+                pending = {shard for shard in pending if self.processes[shard].is_alive()}
+                continue
+            if confirmed == generation:
+                pending.discard(shard)
+
+    @staticmethod
+    def _drain(updates):
+        """
+        Takes back the updates a dead worker had not read yet.
+        """
+        orphaned = []
+        while True:
+            try:
+                kind, payload = updates.get(timeout=0.1)
+            except (queue.Empty, OSError, EOFError):
+                break
+            if kind == 'update':
+                orphaned.append(payload)
+        updates.close()
+        updates.cancel_join_thread()
+        return orphaned
@@ -0,0 +1,108 @@
+import logging
+import threading
+
+from decouple import config
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+DEEP_LINK_PREFIX = 'result_'
+START_RESULT_COMMAND = f'/start {DEEP_LINK_PREFIX}'
+MAX_INLINE_RESULTS = 50
+
+
+class SharingIndex:
+    """
+    Precomputed index of the totem animals for sharing results: inline queries (`@bot otter`) and
+    `/start result_<animal>` deep links. Inline results are built once per animal and reuse the
+    file_id of its result card, so answering a query uploads nothing; Telegram caches the answers
+    for `cache_time` seconds, so popular queries do not reach the bot at all.
+    """
+    def __init__(self, cards, animals, username=None, cache_time=None):
+        self.cards = cards
+        self.animals = tuple(animals)
+        self.username = username or config('BOT_USERNAME', default='')
+        self.cache_time = cache_time or config('INLINE_CACHE_TIME', default=3600, cast=int)
+        self.lock = threading.Lock()
+        self.results = {}
+        self.search_keys = {}
+        self.content_version = None
+
+    def start_warming(self):
+        """
+        Renders the missing result cards in a background thread, so the first inline query finds them ready.
+        """
+        thread = threading.Thread(target=self.cards.build, args=(self.animals,), name='sharing-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def deep_link(self, animal):
+        """
+        Returns the t.me link that opens the bot on an animal's result.
+        """
+        return f'https://t.me/{self.username}?start={DEEP_LINK_PREFIX}{animal}'
+
+    def animal_from_start(self, text):
+        """
+        Returns the animal of a `/start result_<animal>` message, or None if it names no known animal.
+        """
+        if not text.startswith(START_RESULT_COMMAND):
+            return None
+        animal = text[len(START_RESULT_COMMAND):].strip().lower()
+        return animal if animal in self.animals else None
+
+    def markup(self, animal):
+        """
+        Keyboard attached to a shared result: a deep link back to the bot.
+        """
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton('Find Your Totem Animal', url=self.deep_link(animal)))
+        return markup
+
+    def _check_version(self):
+        if self.cards.content.content is not self.content_version:
+            self.content_version = self.cards.content.content
+            self.results.clear()
+            self.search_keys = {animal: f'{animal} {self.cards.animal_data(animal)["name"]}'.lower()
+                                for animal in self.animals}
+
+    def result(self, animal):
+        """
+        Returns the inline result of an animal: its card as a cached photo or document once uploaded,
+        otherwise a text article. Results are rebuilt when a card gets a file_id or the content changes.
+        """
+        path = self.cards.card_path(animal)
+        photo_id = self.cards.media.cached_file_id(path, 'photo') if path else None
+        document_id = self.cards.media.cached_file_id(path, 'document') if path else None
+        with self.lock:
+            self._check_version()
+            cached = self.results.get(animal)
+        if cached is not None and cached[0] == (photo_id, document_id):
+            return cached[1]
+        record = self.cards.animal_data(animal)
+        caption = self.cards.caption(animal)
+        markup = self.markup(animal)
+        if photo_id:
+            result = types.InlineQueryResultCachedPhoto(
+                animal, photo_id, title=record['name'], caption=caption, parse_mode='HTML', reply_markup=markup)
+        elif document_id:
+            result = types.InlineQueryResultCachedDocument(
+                animal, document_id, record['name'], caption=caption, parse_mode='HTML', reply_markup=markup)
+        else:
+            result = types.InlineQueryResultArticle(
+                animal, record['name'], types.InputTextMessageContent(caption, parse_mode='HTML'),
+                reply_markup=markup, description=record['description'][:100])
+        with self.lock:
+            self.results[animal] = ((photo_id, document_id), result)
+        return result
+
+    def search(self, query):
+        """
+        Returns the inline results for a query: every animal whose key or name contains all its words.
+        """
+        words = query.lower().split()
+        with self.lock:
+            self._check_version()
+            search_keys = self.search_keys
+        matches = [animal for animal in self.animals if all(word in search_keys[animal] for word in words)]
+        return [self.result(animal) for animal in matches[:MAX_INLINE_RESULTS]]
@@ -0,0 +1,181 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from decouple import config
+
+import resources
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    question_index INTEGER NOT NULL,
+    answers BLOB NOT NULL,
+    choices BLOB NOT NULL,
+    message_id INTEGER,
+    result_tuples TEXT,
+    result_animal TEXT,
+    totem_animal_data TEXT,
+    nonce INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    animal TEXT,
+    traits TEXT NOT NULL,
+    choices BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS consents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER,
+    full_name TEXT,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+class SessionStore:
+    """
+    SQLite storage (WAL mode) for quiz sessions, completed results and mailing consents.
+    Writes are buffered in memory and committed by a background thread every `flush_interval` ms
+    in one transaction; several updates of the same session in between become a single row write.
+    """
+    def __init__(self, path=None, flush_interval=None):
+        self.path = path or resources.path(config('STORAGE_PATH', default='settings/zoobot.sqlite3'))
+        interval = flush_interval if flush_interval is not None else config('STORAGE_FLUSH_MS', default=200, cast=int)
+        self.flush_interval = interval / 1000
+        self.lock = threading.Lock()
+        # one flush at a time, so a flush returns only after everything buffered before it is committed
+        self.flush_lock = threading.Lock()
+        self.dirty_sessions = {}
+        self.flushing_sessions = {}
+        self.new_results = []
+        self.new_consents = []
+        self.writer = self._connect()
+        self.writer.executescript(SCHEMA)
+        self._migrate()
+        self.reader = self._connect()
+        self.reader_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='storage-writer', daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _migrate(self):
+        """
+        Adds columns introduced after a database file was created.
+        """
+        columns = {row[1] for row in self.writer.execute('PRAGMA table_info(sessions)')}
+        if 'nonce' not in columns:
+            self.writer.execute('ALTER TABLE sessions ADD COLUMN nonce INTEGER NOT NULL DEFAULT 0')
+
+    def save_session(self, session):
+        """
+        Buffers the current state of a session for the next flush.
+        """
+        row = (
+            session.chat_id, session.current_question_index, session.answers.tobytes(),
+            session.choices.tobytes(), session.message_id,
+            json.dumps(list(session.result_tuples)) if session.result_tuples is not None else None,
+            session.result_animal,
+            json.dumps(dict(session.totem_animal_data)) if session.totem_animal_data else None,
+            session.nonce,
+            time.time(),
+        )
+        with self.lock:
+            self.dirty_sessions[session.chat_id] = row
+
+    def save_result(self, session):
+        """
+        Buffers a completed quiz result.
+        """
+        row = (session.chat_id, session.result_animal, json.dumps(list(session.result_tuples)),
+               session.choices.tobytes(), time.time())
+        with self.lock:
+            self.new_results.append(row)
+
+    def save_consent(self, chat_id, user_id, full_name, payload):
+        """
+        Buffers the data a user agreed to send to the zoo.
+        """
+        row = (chat_id, user_id, full_name, json.dumps(payload, ensure_ascii=False, default=str), time.time())
+        with self.lock:
+            self.new_consents.append(row)
+
+    def load_session(self, chat_id):
+        """
+        Returns the stored row of a session (unflushed changes included), or None.
+        """
+        with self.lock:
+            row = self.dirty_sessions.get(chat_id) or self.flushing_sessions.get(chat_id)
+        if row is not None:
+            return row
+        with self.reader_lock:
+            return self.reader.execute(
+                'SELECT chat_id, question_index, answers, choices, message_id, result_tuples, result_animal, '
+                'totem_animal_data, nonce, updated FROM sessions WHERE chat_id = ?', (chat_id,)).fetchone()
+
+    def flush(self):
+        """
+        Writes all buffered changes in one transaction.
+        """
+        with self.flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self.lock:
+            self.flushing_sessions = self.dirty_sessions
+            sessions = list(self.flushing_sessions.values())
+            results, consents = self.new_results, self.new_consents
+            self.dirty_sessions, self.new_results, self.new_consents = {}, [], []
+        if not (sessions or results or consents):
+            return
+        try:
+            self.writer.execute('BEGIN')
+            self.writer.executemany('INSERT OR REPLACE INTO sessions (chat_id, question_index, answers, choices, '
+                                    'message_id, result_tuples, result_animal, totem_animal_data, nonce, updated) '
+                                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', sessions)
+            self.writer.executemany('INSERT INTO results (chat_id, animal, traits, choices, created) '
+                                    'VALUES (?, ?, ?, ?, ?)', results)
+            self.writer.executemany('INSERT INTO consents (chat_id, user_id, full_name, payload, created) '
+                                    'VALUES (?, ?, ?, ?, ?)', consents)
+            self.writer.execute('COMMIT')
+        except sqlite3.Error as e:
+            if self.writer.in_transaction:
+                self.writer.execute('ROLLBACK')
+            logger.error('Storage flush failed, will retry: %s', e)
+            with self.lock:
+                for row in sessions:
+                    self.dirty_sessions.setdefault(row[0], row)
+                self.new_results[:0] = results
+                self.new_consents[:0] = consents
+        finally:
+            with self.lock:
+                self.flushing_sessions = {}
+
+    def close(self):
+        """
+        Stops the writer thread after a final flush.
+        """
+        self.stop_event.set()
+        self.thread.join()
+        self.flush()
+        self.writer.close()
+        self.reader.close()
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,34 @@
+"""
+The content snapshot is only a cache: unreadable snapshots are rebuilt and writes leave no temporary files.
+"""
+import os
+import pickle
+
+import pytest
+
+from content import ContentStore
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'not a pickle',
+    pickle.dumps(42),
+    pickle.dumps((1, 2)),
+    pickle.dumps(('version', 'signature', (), ['not', 'a', 'dict'])),
+])
+def test_unreadable_snapshot_is_rebuilt(tmp_path, data):
+    snapshot_path = str(tmp_path / 'content.snapshot')
+    expected = ContentStore(snapshot_path=snapshot_path).questions
+    with open(snapshot_path, 'wb') as file:
+        file.write(data)
+    store = ContentStore(snapshot_path=snapshot_path)
+    assert store.questions == expected
+    assert store.read_snapshot(store.signature()) is not None
+
+
+def test_snapshot_writes_leave_no_temporary_files(tmp_path):
+    snapshot_path = str(tmp_path / 'content.snapshot')
+    store = ContentStore(snapshot_path=snapshot_path)
+    for _ in range(3):
+        store.write_snapshot(store.content)
+    assert os.listdir(tmp_path) == ['content.snapshot']
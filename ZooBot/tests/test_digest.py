@@ -0,0 +1,69 @@
+"""
+DigestAggregator mailing through MailDispatcher into an in-process SMTP sink.
+"""
+import json
+import os
+import time
+
+import pytest
+
+from benchmarks.smtp_sink import SmtpSink, digest_rows
+from digest import DigestAggregator
+from mailer import MailDispatcher
+from test_mailer import wait_for
+
+
+@pytest.fixture
+def sink():
+    sink = SmtpSink().start()
+    yield sink
+    sink.stop()
+
+
+@pytest.fixture
+def mailer(sink, tmp_path):
+    mailer = MailDispatcher(outbox_dir=str(tmp_path / 'outbox'), host=sink.host, port=sink.port, starttls=False)
+    yield mailer
+    mailer.stop()
+
+
+def feedback(n):
+    return {'chat_id': n, 'user_id': n, 'full_name': f'User {n}', 'text': f'<b>Nice</b>, {n}'}
+
+
+def test_full_batches_and_the_rest_on_stop_are_mailed_as_digests(sink, mailer):
+    digest = DigestAggregator(mailer, max_items=2, max_age=3600)
+    for n in range(5):
+        assert digest.add('feedback', feedback(n))
+    digest.stop()
+    wait_for(lambda: len(sink.messages) == 3)
+    rows = sorted(digest_rows(message) for message in sink.messages)
+    assert rows == [(1, 1), (2, 2), (2, 2)]
+    assert all(message['Subject'].startswith('Feedback from Zoo-Bot users') for message in sink.messages)
+    assert digest.pending() == 0
+    assert not [name for name in os.listdir(digest.spool_dir) if name.endswith('.jsonl')]
+
+
+def test_batch_is_mailed_when_its_oldest_record_is_max_age_old(sink, mailer):
+    digest = DigestAggregator(mailer, max_items=100, max_age=0.3)
+    try:
+        digest.add('consent', {'chat_id': 1, 'name': 'Manul', 'results': [['manul', 3.5]]})
+        wait_for(lambda: len(sink.messages) == 1)
+    finally:
+        digest.stop()
+    assert sink.messages[0]['Subject'] == 'Quiz Results from Zoo-Bot: 1 records'
+    assert digest_rows(sink.messages[0]) == (1, 1)
+
+
+def test_spool_of_a_previous_run_is_resumed(sink, mailer):
+    spool_dir = os.path.join(mailer.outbox_dir, 'digest')
+    os.makedirs(spool_dir)
+    with open(os.path.join(spool_dir, 'feedback.jsonl'), 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'time': time.time(), **feedback(1)}) + '\n')
+        file.write('{"time": 1, "cut short')
+    digest = DigestAggregator(mailer, max_items=100, max_age=3600)
+    assert digest.pending() == 1
+    digest.add('feedback', feedback(2))
+    digest.stop()
+    wait_for(lambda: len(sink.messages) == 1)
+    assert digest_rows(sink.messages[0]) == (2, 2)
@@ -0,0 +1,117 @@
+"""
+The sync and async bot managers answer the same messages with the same replies.
+"""
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import views
+from app import BotManager
+from async_app import AsyncBotManager
+from content import ContentStore
+from quiz import Quiz
+from sessions import SessionManager
+
+
+def make_manager(runtime, tmp_path):
+    """
+    Builds a manager of a runtime around mocked Bot API, scheduler, digest and store, without starting anything.
+    """
+    manager = object.__new__(runtime)
+    manager.sessions = SessionManager()
+    manager.scheduler = mock.Mock()
+    manager.digest = mock.Mock()
+    manager.store = mock.Mock()
+    manager.admins = set()
+    manager.profiler = SimpleNamespace(enabled=False, dump_dir='profiles')
+    content = ContentStore(snapshot_path=str(tmp_path / 'content.snapshot'))
+    manager.quiz = Quiz(mock.Mock(), manager.sessions, manager.scheduler, mock.Mock(), content)
+    transport = mock.AsyncMock() if runtime is AsyncBotManager else mock.Mock()
+    transport.send_message.return_value = transport.reply_to.return_value = SimpleNamespace(message_id=99)
+    if runtime is AsyncBotManager:
+        manager.bot = transport
+    else:
+        manager.api = transport
+    return manager, transport
+
+
+def handle(manager, name, message):
+    result = getattr(manager, name)(message)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+
+
+def message(text, chat_id=7):
+    user = SimpleNamespace(id=chat_id, first_name='Ann', last_name='Lee')
+    return SimpleNamespace(text=text, message_id=5, chat=SimpleNamespace(id=chat_id), from_user=user)
+
+
+def sent(transport):
+    """
+    Returns the replies sent through a transport as (method, text, kwargs) tuples.
+    """
+    calls = []
+    for method in ('send_message', 'reply_to'):
+        for call in getattr(transport, method).call_args_list:
+            calls.append((method, call.args[1], call.kwargs))
+    return calls
+
+
+def both(tmp_path, name, text, prepare=None):
+    """
+    Runs a handler on both runtimes and returns what each sent and scheduled.
+    """
+    outcomes = []
+    for runtime in (BotManager, AsyncBotManager):
+        manager, transport = make_manager(runtime, tmp_path / runtime.__name__)
+        if prepare is not None:
+            prepare(manager)
+        handle(manager, name, message(text))
+        outcomes.append((sent(transport), manager.scheduler.mock_calls, manager.digest.add.call_args_list))
+    return outcomes
+
+
+@pytest.mark.parametrize('name, text, reply', [
+    ('handle_feedback_message', 'Feedback: great', views.feedback_too_early_reply),
+    ('agreement', 'confirm', views.consent_too_early_reply),
+])
+def test_feedback_and_consent_before_the_quiz_are_refused_by_both(tmp_path, name, text, reply):
+    sync, async_ = both(tmp_path, name, text)
+    assert sync == async_
+    replies, scheduled, added = sync
+    assert replies == [('send_message', reply.text, {})]
+    assert scheduled == [mock.call.delete_message_later(2, 7, 5), mock.call.delete_message_later(6, 7, 99)]
+    assert added == []
+
+
+def finish_quiz(manager):
+    manager.sessions.get(7).totem_animal_data = {'name': 'Lynx'}
+    manager.digest.add.return_value = True
+
+
+@pytest.mark.parametrize('name, text, method, reply_text', [
+    ('handle_feedback_message', 'Feedback: great', 'reply_to', views.feedback_reply(True).text),
+    ('agreement', 'confirm', 'send_message', views.consent_reply(True).text),
+])
+def test_feedback_and_consent_after_the_quiz_are_accepted_by_both(tmp_path, name, text, method, reply_text):
+    sync, async_ = both(tmp_path, name, text, prepare=finish_quiz)
+    assert sync == async_
+    replies, scheduled, added = sync
+    assert replies == [(method, reply_text, {})]
+    assert scheduled == []
+    assert len(added) == 1
+
+
+@pytest.mark.parametrize('name, text', [
+    ('send_help_message', '/help'),
+    ('send_info_message', '/info'),
+    ('send_default_response', 'what?'),
+    ('profile_command', '/profile on'),
+    ('load_result_list', 'get_res'),
+])
+def test_simple_replies_are_the_same_in_both(tmp_path, name, text):
+    sync, async_ = both(tmp_path, name, text)
+    assert sync == async_
+    assert len(sync[0]) == 1
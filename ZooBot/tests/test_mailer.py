@@ -0,0 +1,101 @@
+"""
+MailDispatcher against an in-process SMTP sink: delivery from the outbox, retries after a refused
+connection and giving up after max_attempts.
+"""
+import os
+import socket
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from benchmarks.smtp_sink import SmtpSink
+from mailer import MailDispatcher
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def message(subject):
+    msg = MIMEText(f'Body of {subject}')
+    msg['Subject'] = subject
+    return msg
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.02)
+
+
+def outbox_entries(mailer):
+    return [name for name in os.listdir(mailer.outbox_dir) if name.endswith('.json')]
+
+
+@pytest.fixture
+def sink():
+    sink = SmtpSink().start()
+    yield sink
+    sink.stop()
+
+
+def test_enqueued_messages_are_delivered_and_removed_from_outbox(sink, tmp_path):
+    mailer = MailDispatcher(outbox_dir=str(tmp_path / 'outbox'), host=sink.host, port=sink.port, starttls=False)
+    try:
+        for n in range(3):
+            assert mailer.enqueue(message(f'message {n}'))
+        wait_for(lambda: len(sink.messages) == 3)
+        wait_for(lambda: not outbox_entries(mailer))
+    finally:
+        mailer.stop()
+    assert sorted(msg['Subject'] for msg in sink.messages) == ['message 0', 'message 1', 'message 2']
+    assert mailer.queue_depth() == 0
+
+
+def test_refused_connection_is_retried_until_the_server_is_up(tmp_path):
+    port = free_port()
+    mailer = MailDispatcher(outbox_dir=str(tmp_path / 'outbox'), host='127.0.0.1', port=port, starttls=False,
+                            base_delay=0.2)
+    sink = None
+    try:
+        assert mailer.enqueue(message('retried'))
+        time.sleep(0.5)
+        assert len(outbox_entries(mailer)) == 1
+        sink = SmtpSink(port=port).start()
+        wait_for(lambda: len(sink.messages) == 1)
+        wait_for(lambda: not outbox_entries(mailer))
+    finally:
+        mailer.stop()
+        if sink is not None:
+            sink.stop()
+    assert sink.messages[0]['Subject'] == 'retried'
+    assert not os.listdir(mailer.failed_dir)
+
+
+def test_message_is_moved_to_failed_after_max_attempts(tmp_path):
+    mailer = MailDispatcher(outbox_dir=str(tmp_path / 'outbox'), host='127.0.0.1', port=free_port(),
+                            starttls=False, max_attempts=2, base_delay=0.1)
+    try:
+        assert mailer.enqueue(message('undeliverable'))
+        wait_for(lambda: os.listdir(mailer.failed_dir))
+    finally:
+        mailer.stop()
+    assert not outbox_entries(mailer)
+
+
+def test_outbox_left_by_a_previous_run_is_sent(sink, tmp_path):
+    outbox = str(tmp_path / 'outbox')
+    first = MailDispatcher(outbox_dir=outbox, host='127.0.0.1', port=free_port(), starttls=False)
+    first.stop()
+    assert first.enqueue(message('left over'))
+    mailer = MailDispatcher(outbox_dir=outbox, host=sink.host, port=sink.port, starttls=False)
+    try:
+        wait_for(lambda: len(sink.messages) == 1)
+    finally:
+        mailer.stop()
+    assert sink.messages[0]['Subject'] == 'left over'
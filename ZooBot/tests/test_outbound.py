@@ -0,0 +1,154 @@
+"""
+OutboundGateway against a local HTTP stand-in for the Bot API: per-chat pacing, retries after
+429 Too Many Requests, the logging of failed edits and deletes and the release of requests queued at shutdown.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+import telebot
+from telebot import apihelper
+
+from outbound import OutboundGateway
+
+
+class StubBotApi(ThreadingHTTPServer):
+    """
+    Answers sendMessage with a message and deleteMessage with an error, and rejects the first
+    `floods` sendMessage calls with 429 and `retry_after`. Records (time, method, chat_id) of every call.
+    """
+    def __init__(self, floods=0, retry_after=1):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.floods = floods
+        self.retry_after = retry_after
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def answer(self, method, params):
+        with self.lock:
+            self.calls.append((time.monotonic(), method, params.get('chat_id')))
+            if method == 'sendMessage' and self.floods:
+                self.floods -= 1
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+        if method == 'deleteMessage':
+            return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message to delete not found'}
+        message = {'message_id': len(self.calls), 'date': 0, 'text': params.get('text', ''),
+                   'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        return 200, {'ok': True, 'result': message}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        params.update(parse_qsl(body.decode()))
+        status, result = self.server.answer(url.path.rsplit('/', 1)[1], params)
+        data = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    def start(**kwargs):
+        server = StubBotApi(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(apihelper, 'API_URL', f'http://127.0.0.1:{server.server_port}/bot{{0}}/{{1}}')
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def gateway(**kwargs):
+    return OutboundGateway(telebot.TeleBot('1:test', threaded=False), workers=4, **kwargs)
+
+
+def test_sends_to_one_chat_are_paced_by_its_bucket(stub):
+    server = stub()
+    api = gateway(per_chat_rate=5, per_chat_burst=1, global_rate=100)
+    try:
+        futures = [api.submit('send_message', 1, 1, f'message {n}') for n in range(4)]
+        assert [future.result(timeout=5).text for future in futures] == [f'message {n}' for n in range(4)]
+    finally:
+        api.stop()
+    times = [at for at, _, _ in server.calls]
+    assert all(later - earlier >= 0.18 for earlier, later in zip(times, times[1:]))
+
+
+def test_flood_limit_is_retried_after_retry_after(stub):
+    server = stub(floods=1, retry_after=1)
+    api = gateway(per_chat_rate=100, per_chat_burst=10, global_rate=100)
+    try:
+        message = api.send_message(1, 'hello')
+    finally:
+        api.stop()
+    assert message.text == 'hello'
+    (flooded, _, _), (retried, _, _) = server.calls
+    assert retried - flooded >= 0.95
+
+
+def test_flood_limit_gives_up_after_max_attempts(stub):
+    stub(floods=3, retry_after=0)
+    api = gateway(per_chat_rate=100, per_chat_burst=10, global_rate=100, max_attempts=2)
+    try:
+        with pytest.raises(apihelper.ApiTelegramException) as error:
+            api.send_message(1, 'hello')
+    finally:
+        api.stop()
+    assert error.value.error_code == 429
+
+
+def test_failed_delete_is_logged(stub, caplog):
+    stub()
+    api = gateway(per_chat_rate=100, per_chat_burst=10, global_rate=100)
+    with caplog.at_level(logging.WARNING, logger='outbound'):
+        future = api.delete_message(1, 42)
+        with pytest.raises(apihelper.ApiTelegramException):
+            future.result(timeout=5)
+        api.stop()
+    assert any('delete_message for chat 1 failed' in record.getMessage() for record in caplog.records)
+
+
+def test_requests_queued_at_stop_are_cancelled(stub):
+    stub()
+    api = gateway(per_chat_rate=0.01, per_chat_burst=1, global_rate=100)
+    first = api.submit('send_message', 1, 1, 'sent')
+    assert first.result(timeout=5).text == 'sent'
+    released = []
+
+    def handler():
+        try:
+            api.send_message(1, 'queued')
+        except CancelledError:
+            released.append(True)
+
+    thread = threading.Thread(target=handler, daemon=True)
+    thread.start()
+    queued = api.submit('send_message', 1, 1, 'queued too')
+    time.sleep(0.2)
+    api.stop()
+    thread.join(timeout=5)
+    assert released == [True]
+    assert queued.cancelled()
+    assert api.submit('send_message', 1, 1, 'after stop').cancelled()
@@ -0,0 +1,51 @@
+"""
+Quiz answer handling when the same button is pressed from several handler threads at once.
+"""
+import threading
+from unittest import mock
+
+import pytest
+
+from content import ContentStore
+from quiz import Quiz
+from sessions import SessionManager
+
+
+@pytest.fixture
+def quiz(tmp_path):
+    content = ContentStore(snapshot_path=str(tmp_path / 'content.snapshot'))
+    quiz = Quiz(mock.Mock(), SessionManager(), mock.Mock(), mock.Mock(), content)
+    quiz.mode = 'messages'
+    quiz.adaptive = False
+    return quiz
+
+
+def press_together(quiz, chat_id, presses, *args):
+    barrier = threading.Barrier(presses)
+
+    def press():
+        barrier.wait()
+        quiz.process_answer(chat_id, *args)
+
+    threads = [threading.Thread(target=press) for _ in range(presses)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_button_pressed_twice_at_once_is_recorded_once(quiz):
+    for chat_id in range(300):
+        session = quiz.sessions.get(chat_id)
+        quiz.begin(session)
+        press_together(quiz, chat_id, 2, 1, 0, session.nonce)
+        assert list(session.choices) == [1]
+        assert session.current_question_index == 1
+
+
+def test_answers_to_consecutive_questions_are_all_recorded(quiz):
+    session = quiz.sessions.get(1)
+    quiz.begin(session)
+    for question_index in range(len(quiz.questions)):
+        press_together(quiz, 1, 3, 2, question_index, session.nonce)
+    assert list(session.choices) == [2] * len(quiz.questions)
@@ -0,0 +1,50 @@
+"""
+The webhook server refuses malformed requests with a status instead of failing on them.
+"""
+import asyncio
+import json
+
+import pytest
+import telebot
+
+from webhook import WebhookServer
+from webhook_harness import check_malformed, malformed_requests, post_updates, synthetic_update
+
+SECRET = 'test-secret'
+PATH = '/telegram'
+
+
+async def with_server(check):
+    bot = telebot.TeleBot('0:test', threaded=False)
+    server = WebhookServer(bot, secret_token=SECRET, host='127.0.0.1', port=0, path=PATH)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        return await check(port)
+    finally:
+        server.server.close()
+        await server.server.wait_closed()
+        server.executor.shutdown(wait=True)
+
+
+def test_malformed_requests_are_refused():
+    failures = asyncio.run(with_server(lambda port: check_malformed('127.0.0.1', port, PATH, SECRET)))
+    assert failures == []
+
+
+@pytest.mark.parametrize('description', [case[0] for case in malformed_requests(PATH, SECRET)])
+def test_server_keeps_serving_after_a_malformed_request(description):
+    raw = next(raw for name, raw, _ in malformed_requests(PATH, SECRET) if name == description)
+
+    async def check(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        await reader.readline()
+        writer.close()
+        statuses = {}
+        body = json.dumps(synthetic_update(1)).encode('utf-8')
+        await post_updates('127.0.0.1', port, PATH, SECRET, [body], [], statuses)
+        return statuses
+
+    assert asyncio.run(with_server(check)) == {200: 1}
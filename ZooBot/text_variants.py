@@ -0,0 +1,129 @@
+import random
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from decouple import config
+
+MAX_REDRAWS = 16
+
+
+def parse_variants(lines):
+    """
+    Parses text variants, one per line. A line may end with a tab and a weight (default 1);
+    blank lines are skipped. Returns (texts, weights), with the texts stripped and interned.
+    """
+    texts = []
+    weights = []
+    for line in lines:
+        text, tab, weight = line.rstrip('\r\n').rpartition('\t')
+        if not tab:
+            text, weight = weight, '1'
+        text = text.strip()
+        if text:
+            texts.append(sys.intern(text))
+            weights.append(float(weight))
+    return tuple(texts), weights
+
+
+def seen(recent, start, window, index):
+    """
+    Tells whether `index` is among the `window` recent draws stored from `start`, without slicing the array.
+    """
+    for position in range(start, start + window):
+        if recent[position] == index:
+            return True
+    return False
+
+
+class TextVariants:
+    """
+    A set of weighted text variants sampled in O(1) per draw with Vose's alias method:
+    a variant slot is picked uniformly, then kept with probability `prob[slot]` or replaced by `alias[slot]`.
+    """
+    def __init__(self, texts, weights=None):
+        self.texts = tuple(texts)
+        count = len(self.texts)
+        self.prob = array('d', [1.0] * count)
+        self.alias = array('I', range(count))
+        total = float(sum(weights)) if weights is not None else 0.0
+        if count and total > 0:
+            scaled = [weight * count / total for weight in weights]
+            small = [i for i, p in enumerate(scaled) if p < 1.0]
+            large = [i for i, p in enumerate(scaled) if p >= 1.0]
+            while small and large:
+                less, more = small.pop(), large.pop()
+                self.prob[less] = scaled[less]
+                self.alias[less] = more
+                scaled[more] -= 1.0 - scaled[less]
+                (small if scaled[more] < 1.0 else large).append(more)
+            for i in small + large:
+                self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.texts)
+
+    def sample(self, rand=random.random):
+        """
+        Returns the index of a variant drawn according to the weights.
+        """
+        slot = int(rand() * len(self.texts))
+        return slot if rand() < self.prob[slot] else self.alias[slot]
+
+
+class VariantEngine:
+    """
+    Draws text variants for every RandomTextGenerator, avoiding the last `window` variants each chat
+    has seen from the same set. The recent draws of a chat are kept in one preallocated integer array
+    (a ring of `window` slots per set), and only the `max_chats` most recently active chats are remembered.
+    """
+    def __init__(self, window=None, max_chats=None):
+        self.window = window if window is not None else config('TEXT_NO_REPEAT_WINDOW', default=1, cast=int)
+        self.max_chats = max_chats or config('TEXT_HISTORY_CHATS', default=10000, cast=int)
+        self.sets = []
+        self.history = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, resource):
+        """
+        Adds a variant set, given as a lazily loaded resource of TextVariants, and returns its number.
+        """
+        self.sets.append(resource)
+        return len(self.sets) - 1
+
+    def draw(self, set_number, chat_id=None):
+        """
+        Returns a variant of a set, or None if the set is empty. With a chat_id the variants the chat has
+        seen last are redrawn, within the limits of the set's size.
+        """
+        variants = self.sets[set_number].get()
+        if not variants.texts:
+            return None
+        index = variants.sample()
+        window = min(self.window, len(variants) - 1)
+        if chat_id is None or window <= 0:
+            return variants.texts[index]
+        stride = self.window + 1
+        with self.lock:
+            recent = self.history.get(chat_id)
+            if recent is None:
+                recent = self.history[chat_id] = array('i', [-1] * (stride * len(self.sets)))
+                if len(self.history) > self.max_chats:
+                    self.history.popitem(last=False)
+            else:
+                self.history.move_to_end(chat_id)
+                if len(recent) < stride * len(self.sets):
+                    recent.extend([-1] * (stride * len(self.sets) - len(recent)))
+            base = set_number * stride
+            redraws = 0
+            while redraws < MAX_REDRAWS and seen(recent, base + 1, window, index):
+                index = variants.sample()
+                redraws += 1
+            position = recent[base] + 1 if recent[base] + 1 < window else 0
+            recent[base] = position
+            recent[base + 1 + position] = index
+        return variants.texts[index]
+
+
+engine = VariantEngine()
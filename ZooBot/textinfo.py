@@ -1,7 +1,10 @@
 
-logo_photo = "assets/start_logo.jpg"
-logo_start_quiz_photo = 'assets/Eng/logo_quiz.jpg'
-logo_end_photo = 'assets/Circle/MZoo-logo-Circle-mono-white-small-preview.jpg'
+import resources
+from asset_manifest import manifest
+
+logo_photo = manifest.resolve(resources.path('assets/start_logo.jpg'))
+logo_start_quiz_photo = manifest.resolve(resources.path('assets/Eng/logo_quiz.jpg'))
+logo_end_photo = manifest.resolve(resources.path('assets/Circle/MZoo-logo-Circle-mono-white-small-preview.jpg'))
 info_guardian_url = 'https://moscowzoo.ru/my-zoo/become-a-guardian/'
 default_response_text = (
     'Sorry, I don\'t understand your request.\nLet\'s start with a greeting!'
@@ -33,7 +36,8 @@ send_message_text = (
     '\ne-mail: opeka@moscow.zoo\nphone: +7(495) xxx-xx-xx')
 
 share_result_text = (
-    'Now that you have received your quiz results, you can share them with friends by simply forwarding this message.')
+    'Now that you have received your quiz results, you can share them with friends by simply forwarding this message '
+    'or with the Share Result button.')
 serious_text = (
     'You have completed the quiz. That’s great! In reality, this project is quite humorous but serves a very important purpose. Your result is a collective representation based on your answers, regardless of what animal it might be—it'
 ' all about your attention.'
@@ -0,0 +1,266 @@
+from typing import NamedTuple
+
+from telebot import types
+
+from routing import encode_answer
+from service import greetings_generator1, greetings_generator2, start_generator
+
+from textinfo import info_guardian_url, default_response_text, help_text, info_text, guardian_text, \
+    send_message_text, contacts_text, serious_text
+
+info_url = "https://moscowzoo.ru/"
+
+# text commands and button callbacks, mapped to the names of the bot manager methods handling them
+message_commands = {
+    'hello': 'send_greeting_with_buttons',
+    '/start': 'send_start_menu_keyboard',
+    '/help': 'send_help_message',
+    '/info': 'send_info_message',
+    '/contacts': 'send_contacts',
+    'confirm': 'agreement',
+}
+
+prefix_commands = {
+    'Feedback': 'handle_feedback_message',
+    '/start result_': 'show_shared_result',
+    '/profile': 'profile_command',
+}
+
+callback_commands = {
+    'learn_more': 'send_info_message',
+    'become_guardian?': 'send_become_guardian_info',
+    'start_quiz': 'send_start_quiz_message',
+    'start': 'send_start_menu_keyboard',
+    'help': 'send_help_message',
+    'info': 'send_info_message',
+    'contacts': 'send_contacts',
+    'continue': 'processing_of_results',
+    'restart_quiz': 'send_start_quiz_message',
+    'show_result': 'show_totem_animal_info',
+    'get_res': 'load_result_list',
+    'become_a_guardian': 'become_a_guardian',
+    'some_serious': 'some_serious',
+}
+
+results_text = '<b>Results obtained! Move ahead!</b>'
+processing_text = '<b>You have come a long way, only one step remains! But choosing is hard...</b>'
+
+
+class Reply(NamedTuple):
+    """
+    A text answer to a message, sent the same way by both runtimes: the name of its static keyboard,
+    its parse mode, whether it quotes the message, and the delays in seconds after which the answer
+    and the user's message are deleted.
+    """
+    text: str
+    markup: str = None
+    parse_mode: str = None
+    reply_to: bool = False
+    delete_after: int = None
+    delete_request_after: int = None
+
+
+help_reply = Reply(help_text)
+contacts_reply = Reply(contacts_text)
+info_reply = Reply(info_text, markup='info')
+guardian_info_reply = Reply(guardian_text, markup='guardian')
+become_guardian_reply = Reply(send_message_text, parse_mode='HTML')
+serious_reply = Reply(serious_text, parse_mode='HTML')
+default_reply = Reply(default_response_text, delete_after=9, delete_request_after=3)
+no_results_reply = Reply('Take the quiz to receive results.', delete_after=3)
+result_not_found_reply = Reply('Result not found.', delete_after=3)
+feedback_too_early_reply = Reply('Quiz not completed yet, maybe you haven\'t formed an opinion yet.',
+                                 delete_after=6, delete_request_after=2)
+consent_too_early_reply = Reply('Quiz not completed yet, this keyword should be used later',
+                                delete_after=6, delete_request_after=2)
+
+
+def full_name(user):
+    """
+    Returns the user's first and last name as one string.
+    """
+    return f"{user.first_name} {user.last_name}"
+
+
+def greeting_reply(message):
+    """
+    Returns the greeting of a `hello` message with the navigation buttons.
+    """
+    return Reply(greeting_text(message.from_user.first_name, message.chat.id), markup='greeting')
+
+
+def feedback_record(session, message):
+    """
+    Returns the feedback digest record of a message, or None while the chat has not completed the quiz.
+    """
+    if session.totem_animal_data is None:
+        return None
+    return {'chat_id': message.chat.id, 'user_id': message.from_user.id, 'full_name': full_name(message.from_user),
+            'text': message.text}
+
+
+def feedback_reply(accepted):
+    """
+    Returns the answer to a feedback message, depending on whether the digest took it.
+    """
+    if accepted:
+        return Reply('Thank you for your feedback! It has been received and processed.', reply_to=True)
+    return Reply('Failed to process your request, please try again later.', reply_to=True)
+
+
+def consent_reply(accepted):
+    """
+    Returns the answer to a consent, depending on whether the digest took it.
+    """
+    return Reply('Sent' if accepted else 'Unable to send, try again later')
+
+
+def profile_reply(profiler):
+    """
+    Returns the answer to the `/profile` admin command: whether profiling is on and where dumps go.
+    """
+    state = 'on' if profiler.enabled else 'off'
+    return Reply(f'Profiling is {state}; dumps go to {profiler.dump_dir}.')
+
+
+def greeting_text(user_name, chat_id=None):
+    """
+    Builds a random greeting addressed to the user, avoiding the greetings the chat has just seen.
+    """
+    greet1 = greetings_generator1.get_random_text(chat_id)
+    greet2 = greetings_generator2.get_random_text(chat_id)
+    return f"{greet1}, {user_name}! {greet2}"
+
+
+def start_menu_texts(chat_id=None):
+    """
+    Returns the greeting and the logo caption of the start menu.
+    """
+    greeting = greetings_generator2.get_random_text(chat_id)
+    start_menu_message = f"{start_generator.get_random_text(chat_id)}:"
+    return greeting, start_menu_message
+
+
+def animal_caption(animal_data):
+    """
+    Formats the name and description of a totem animal as an HTML caption.
+    """
+    text = f"<b>{animal_data['name']}</b>\n"
+    text += f"{animal_data['description']}\n"
+    return text
+
+
+def greeting_markup():
+    """
+    Creates the START / Help / Info keyboard shown with the greeting.
+    """
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    button_start = types.InlineKeyboardButton("START", callback_data='start')
+    button_help = types.InlineKeyboardButton("Help", callback_data='help')
+    button_info = types.InlineKeyboardButton("Info", callback_data='info')
+    markup.add(button_start)
+    markup.add(button_help, button_info)
+    return markup
+
+
+def start_menu_markup():
+    """
+    Creates the start menu keyboard: quiz, guardianship and more information.
+    """
+    markup = types.InlineKeyboardMarkup()
+    button_learn_more = types.InlineKeyboardButton("Learn More", callback_data='learn_more')
+    button_become_guardian = types.InlineKeyboardButton("Become a Guardian?", callback_data='become_guardian?')
+    button_start_quiz = types.InlineKeyboardButton("QUIZ", callback_data='start_quiz')
+    markup.add(button_start_quiz)
+    markup.add(button_become_guardian, button_learn_more)
+    return markup
+
+
+def info_markup():
+    """
+    Creates a keyboard with a link to the zoo website.
+    """
+    markup = types.InlineKeyboardMarkup()
+    info_button = types.InlineKeyboardButton("Visit Zoo Website", url=info_url)
+    markup.add(info_button)
+    return markup
+
+
+def guardian_markup():
+    """
+    Creates a keyboard with the guardianship program link and a contacts button.
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    button_info_guardian = types.InlineKeyboardButton('Learn About Program', url=info_guardian_url)
+    button_get_contacts = types.InlineKeyboardButton('Contacts', callback_data='contacts')
+    keyboard.add(button_info_guardian)
+    keyboard.add(button_get_contacts)
+    return keyboard
+
+
+def continue_markup():
+    """
+    Creates the keyboard shown under the totem animal result.
+    """
+    markup = types.InlineKeyboardMarkup()
+    button_continue = types.InlineKeyboardButton('Adventures Continue...', callback_data='continue')
+    markup.add(button_continue)
+    return markup
+
+
+def results_markup(website_url, animal=None):
+    """
+    Creates the keyboard of final steps after the result, linking to the animal's page.
+    With an animal, a Share button offers the result in inline mode in any chat.
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    button_info = types.InlineKeyboardButton("Learn More About Animal", url=website_url)
+    button_get_result = types.InlineKeyboardButton('Download Result', callback_data='get_res')
+    button_get_res_mail = types.InlineKeyboardButton('A Bit Serious...', callback_data='some_serious')
+    button_info_guardian = types.InlineKeyboardButton('Become a Guardian?', callback_data='become_guardian?')
+    button_become_guardian = types.InlineKeyboardButton('Become a Guardian!', callback_data='become_a_guardian')
+    button_quiz_repeat = types.InlineKeyboardButton("Try Again?", callback_data='start')
+    keyboard.row(button_info)
+    keyboard.row(button_get_result)
+    if animal is not None:
+        keyboard.row(types.InlineKeyboardButton('Share Result', switch_inline_query=animal))
+    keyboard.row(button_get_res_mail)
+    keyboard.row(button_info_guardian)
+    keyboard.row(button_become_guardian)
+    keyboard.row(button_quiz_repeat)
+    return keyboard
+
+
+def shared_result_markup():
+    """
+    Creates the keyboard under a result opened from a shared link.
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.row(types.InlineKeyboardButton('Find Your Totem Animal', callback_data='start_quiz'))
+    keyboard.row(types.InlineKeyboardButton('Learn More', callback_data='learn_more'))
+    return keyboard
+
+
+def answer_markup(answers, question_index, nonce):
+    """
+    Creates an inline keyboard markup for displaying answer options.
+    Each button carries the question index and the session nonce, so presses on old keyboards can be ignored.
+    """
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for i, answer in enumerate(answers, start=1):
+        button_text = answer.text
+        button_data = encode_answer(question_index, i, nonce)
+        button = types.InlineKeyboardButton(button_text, callback_data=button_data)
+        markup.add(button)
+    return markup
+
+
+def result_keyboard():
+    """
+    Creates an inline keyboard for showing results and restarting the quiz.
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    result_button = types.InlineKeyboardButton("View Result", callback_data="show_result")
+    restart_button = types.InlineKeyboardButton("Restart Quiz", callback_data='restart_quiz')
+    keyboard.add(result_button, restart_button)
+    return keyboard
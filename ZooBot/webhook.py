@@ -0,0 +1,193 @@
+import asyncio
+import hmac
+import inspect
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1 << 20
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable',
+}
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates over HTTP and hands them to the bot's registered handlers.
+    Requests are checked against the webhook secret token and decoded into Update objects;
+    handlers run on a bounded worker pool (or as bounded tasks for an AsyncTeleBot), and once `max_pending` updates are queued
+    new requests get 503 so Telegram backs off and redelivers them later.
+    With `parse_updates=False` the bot receives the decoded JSON dicts instead of Update objects.
+    """
+    def __init__(self, bot, secret_token=None, host=None, port=None, path=None,
+                 max_concurrency=None, max_pending=None, parse_updates=True):
+        self.bot = bot
+        self.parse_updates = parse_updates
+        self.secret_token = secret_token if secret_token is not None else config('WEBHOOK_SECRET', default='')
+        self.host = host or config('WEBHOOK_HOST', default='0.0.0.0')
+        self.port = port if port is not None else config('WEBHOOK_PORT', default=8443, cast=int)
+        self.path = path or config('WEBHOOK_PATH', default='/telegram')
+        self.max_concurrency = max_concurrency or config('WEBHOOK_CONCURRENCY', default=16, cast=int)
+        self.max_pending = max_pending or config('WEBHOOK_MAX_PENDING', default=1000, cast=int)
+        self.is_async = inspect.iscoroutinefunction(bot.process_new_updates)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='webhook')
+        self.semaphore = None
+        self.tasks = set()
+        self.pending = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.server = None
+        self.loop = None
+
+    async def start(self):
+        """
+        Starts listening for webhook requests.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def run(self):
+        """
+        Runs the webhook server until interrupted.
+        """
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self.executor.shutdown(wait=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                status, keep_alive = self.handle_request(*request)
+                await self.write_response(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader):
+        """
+        Reads one HTTP/1.1 request and returns (method, path, headers, body), or None at end of stream.
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            return 'BAD', '', {}, b''
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        headers.setdefault('connection', 'close' if version == 'HTTP/1.0' else 'keep-alive')
+        length = headers.get('content-length') or '0'
+        if not (length.isascii() and length.isdigit()):
+            # the body cannot be delimited, so the connection is closed after the 400
+            return 'BAD', path, headers, b''
+        length = int(length)
+        if length > MAX_BODY_SIZE:
+            return method, path, headers, None
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    def handle_request(self, method, path, headers, body):
+        """
+        Validates a webhook request and queues its update; returns (status, keep_alive).
+        """
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if method == 'BAD':
+            return 400, False
+        if path != self.path:
+            return 404, keep_alive
+        if method != 'POST':
+            return 405, keep_alive
+        if body is None:
+            return 413, False
+        # compared as bytes: compare_digest raises TypeError for str with non-ASCII characters
+        token = headers.get('x-telegram-bot-api-secret-token', '').encode('latin-1')
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token.encode('utf-8')):
+            return 403, keep_alive
+        try:
+            update = json.loads(body)
+            if self.parse_updates:
+                update = types.Update.de_json(update)
+            elif not isinstance(update, dict) or 'update_id' not in update:
+                return 400, keep_alive
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, keep_alive
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, keep_alive
+        self.pending += 1
+        self.accepted += 1
+        if self.is_async:
+            task = self.loop.create_task(self.dispatch_async(update))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            future = self.executor.submit(self.dispatch, update)
+            future.add_done_callback(self._done)
+        return 200, keep_alive
+
+    def dispatch(self, update):
+        try:
+            self.bot.process_new_updates([update])
+        except Exception as e:
+            logger.exception('Error while processing update %s: %s', self.update_id(update), e)
+
+    async def dispatch_async(self, update):
+        try:
+            async with self.semaphore:
+                await self.bot.process_new_updates([update])
+        except Exception as e:
+            logger.exception('Error while processing update %s: %s', self.update_id(update), e)
+        finally:
+            self._release()
+
+    @staticmethod
+    def update_id(update):
+        return update['update_id'] if isinstance(update, dict) else update.update_id
+
+    def _done(self, future):
+        self.loop.call_soon_threadsafe(self._release)
+
+    def _release(self):
+        self.pending -= 1
+
+    @staticmethod
+    async def write_response(writer, status, keep_alive):
+        head = (f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+                f'Content-Length: 0\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1'))
+        await writer.drain()
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+import telebot
+
+from webhook import WebhookServer
+
+update_ids = itertools.count(1)
+
+
+def synthetic_update(chat_id, text=None, callback_data=None, message_id=1):
+    """
+    Builds the JSON of a Telegram Update carrying either a text message or a button press.
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Visitor', 'last_name': str(chat_id)}
+    chat = {'id': chat_id, 'type': 'private', 'first_name': 'Visitor'}
+    message = {'message_id': message_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+    if callback_data is None:
+        message['text'] = text if text is not None else 'hello'
+        return {'update_id': next(update_ids), 'message': message}
+    bot_message = dict(message, **{'from': {'id': 1, 'is_bot': True, 'first_name': 'ZooBot'}, 'text': '...'})
+    callback_query = {'id': str(next(update_ids)), 'from': user, 'message': bot_message,
+                      'chat_instance': str(chat_id), 'data': callback_data}
+    return {'update_id': next(update_ids), 'callback_query': callback_query}
+
+
+async def post_updates(host, port, path, secret, bodies, latencies, statuses):
+    """
+    Sends the given update bodies over one keep-alive connection and records latencies and statuses.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            head = (f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                    f'X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n')
+            started = time.perf_counter()
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def malformed_requests(path, secret):
+    """
+    Returns (description, raw request, expected status) for requests the webhook must refuse without failing.
+    """
+    body = json.dumps(synthetic_update(1)).encode('utf-8')
+
+    def request(secret_token=secret, content_length=str(len(body))):
+        head = (f'POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                f'X-Telegram-Bot-Api-Secret-Token: {secret_token}\r\nContent-Length: {content_length}\r\n\r\n')
+        return head.encode('utf-8') + body
+
+    return [
+        ('non-numeric Content-Length', request(content_length='twelve'), 400),
+        ('negative Content-Length', request(content_length='-1'), 400),
+        ('non-ASCII digits in Content-Length', request(content_length='\u0663'), 400),
+        ('wrong secret token', request(secret_token=secret + 'x'), 403),
+        ('non-ASCII secret token', request(secret_token='s\u00e9cr\u00e8t'), 403),
+    ]
+
+
+async def check_malformed(host, port, path, secret):
+    """
+    Sends each malformed request on its own connection; returns (description, expected, actual status)
+    of the requests that were not answered as expected, with None as the status of a dropped connection.
+    """
+    failures = []
+    for description, raw, expected in malformed_requests(path, secret):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(raw)
+            await writer.drain()
+            status_line = await reader.readline()
+        finally:
+            writer.close()
+        status = int(status_line.split()[1]) if status_line else None
+        if status != expected:
+            failures.append((description, expected, status))
+    return failures
+
+
+async def report_malformed(host, port, path, secret):
+    failures = await check_malformed(host, port, path, secret)
+    for description, expected, status in failures:
+        print(f'{description}: expected {expected}, got {status}')
+    print(f'malformed requests: {len(malformed_requests(path, secret)) - len(failures)} refused as expected, '
+          f'{len(failures)} not')
+
+
+async def run_load(host, port, path, secret, total, connections, chats):
+    bodies = [json.dumps(synthetic_update(random.randint(1, chats))).encode('utf-8') for _ in range(total)]
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*(post_updates(host, port, path, secret, bodies[i::connections], latencies, statuses)
+                           for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f'{total} updates over {connections} connections in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} updates/s)')
+    print(f'latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms')
+    print('statuses:', dict(sorted(statuses.items())))
+
+
+async def run_local(args):
+    """
+    Measures the webhook ingress alone: the bot only counts updates and makes no API calls.
+    """
+    bot = telebot.TeleBot('0:harness', threaded=False)
+    handled = itertools.count()
+
+    @bot.message_handler(func=lambda message: True)
+    def count_message(message):
+        next(handled)
+
+    server = WebhookServer(bot, secret_token=args.secret, host='127.0.0.1', port=args.port, path=args.path,
+                           max_concurrency=args.concurrency, max_pending=args.max_pending)
+    await server.start()
+    await report_malformed('127.0.0.1', args.port, args.path, args.secret)
+    await run_load('127.0.0.1', args.port, args.path, args.secret, args.updates, args.connections, args.chats)
+    server.executor.shutdown(wait=True)
+    print(f'handled {next(handled)} updates, rejected {server.rejected} with 503')
+    server.server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='POST synthetic Telegram updates to a webhook endpoint.')
+    parser.add_argument('--url', help='webhook URL of a running bot; a local no-op bot is used if omitted')
+    parser.add_argument('--secret', default='harness-secret')
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--path', default='/telegram')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-pending', type=int, default=1000)
+    args = parser.parse_args()
+    if args.url:
+        url = urlsplit(args.url)
+        asyncio.run(report_malformed(url.hostname, url.port or 80, url.path or '/', args.secret))
+        asyncio.run(run_load(url.hostname, url.port or 80, url.path or '/', args.secret,
+                             args.updates, args.connections, args.chats))
+    else:
+        asyncio.run(run_local(args))